@@ -1,118 +1,334 @@
-from flask import Flask, request, jsonify, Response, stream_with_context, render_template, send_from_directory, redirect
+import startup
+# With PROFILE_STARTUP set, every import from here on is timed
+startup_profile = startup.StartupProfile.from_env()
+
+from flask import Flask, request, jsonify, Response, stream_with_context, render_template, send_from_directory, redirect, g, has_request_context
 from flask_cors import CORS
 import requests
 import os
 import time
 import uuid
 import json
-from dotenv import load_dotenv
-from colorama import Fore, Back, Style, init
-from queue import Queue
-from threading import Lock
 import datetime
+import base64
+import sys
+from array import array
+from upstream import UpstreamClient
+from model_registry import ModelRegistry
+from backends import BackendPool
+from metrics import registry as metrics_registry, REQUESTS, REQUEST_DURATION, StreamTimer, observe_ollama_counts
+from scheduler import Scheduler, QueueFull, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from clients import ClientLimits, client_id
+from single_flight import SingleFlight, request_key
+from config import env_bool, load_env_file
+from console import REQUEST_COLOR, RESPONSE_COLOR, ERROR_COLOR, RESET_COLOR
+from log_bus import LogBus, ChunkBatcher
+from log_store import LogStore, LogFilter
+from response_cache import ResponseCache, is_deterministic, entry_from_chunks, replay_chunks
+from openai_compat import to_ollama_chat, tool_calls_to_openai, finish_reason, prompt_text
+from usage import TokenCounter, CompletionCount
+from recorder import Recorder
+from model_lifecycle import ModelLifecycle
+from disconnects import DisconnectWatcher
+from prefix_affinity import PrefixAffinity, prefix_fingerprints
+from embeddings import EmbeddingBatcher, EmbeddingCache, content_key, EMBED_INPUTS
+from output_stage import OutputStage
+import sse
+from sse import ChunkEncoder
 
-# Initialize colorama
-init()
-
-# Color constants for logging
-REQUEST_COLOR = Fore.CYAN
-RESPONSE_COLOR = Fore.GREEN
-ERROR_COLOR = Fore.RED
-RESET_COLOR = Style.RESET_ALL
+# Load .env before anything reads its configuration
+load_env_file(os.path.dirname(os.path.abspath(__file__)))
+startup_profile.mark('imports')
 
-# Queue for web logs
-log_queue = Queue()
-clients = set()
-clients_lock = Lock()
+# Ring buffer for web logs, shared by all /logs viewers
+log_bus = LogBus()
+# Searchable log history behind /logs/history
+log_store = LogStore(log_bus)
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
-load_dotenv()
 
 # Ollama API endpoint - use host.docker.internal when running in Docker
 OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://host.docker.internal:11434')
 print(f"\n{REQUEST_COLOR}Environment OLLAMA_BASE_URL: {os.getenv('OLLAMA_BASE_URL')}{RESET_COLOR}")
 print(f"{REQUEST_COLOR}Using Ollama base URL: {OLLAMA_BASE_URL}{RESET_COLOR}")
 
-# Add cache for model status
-model_status_cache = {}
+# Ollama hosts to balance across (OLLAMA_BASE_URLS), defaulting to OLLAMA_BASE_URL
+backend_pool = BackendPool.from_env(OLLAMA_BASE_URL)
+
+# Shared keep-alive connection pool for every call to Ollama
+upstream = UpstreamClient(OLLAMA_BASE_URL, hosts=len(backend_pool.backends))
+if len(backend_pool.backends) > 1:
+    print(f"{REQUEST_COLOR}Balancing across Ollama backends: {', '.join(b.url for b in backend_pool.backends)}{RESET_COLOR}")
+
+# Admission control: per-model/per-backend concurrency limits and a bounded queue
+scheduler = Scheduler(backend_count=len(backend_pool.backends))
+# Per-client (API key) rate limits, fair-share weights and usage
+client_limits = ClientLimits()
+
+# Identical concurrent upstream calls share one request to Ollama
+single_flight = SingleFlight(enabled=env_bool('SINGLE_FLIGHT', True))
+# Sampled completions differ on every call, so POSTs only share a call when the
+# answer is repeatable, unless SINGLE_FLIGHT_ALL_POSTS opts in to sharing them all
+DEDUP_ALL_POSTS = env_bool('SINGLE_FLIGHT_ALL_POSTS', False)
+IDEMPOTENT_POSTS = ('/api/show',)
+
+def can_share_call(method, path, data):
+    """Whether identical concurrent calls may be answered by one upstream call"""
+    if method == 'GET':
+        return True
+    if method != 'POST':
+        return False
+    if DEDUP_ALL_POSTS or path in IDEMPOTENT_POSTS:
+        return True
+    if not isinstance(data, dict):
+        return False
+    return is_deterministic(data.get('options') or {}) or is_deterministic(data)
+
+# Cached model catalog, refreshed in the background when stale
+model_registry = ModelRegistry(upstream, single_flight=single_flight, backends=backend_pool)
+
+# Residency from /api/ps, startup preloading and keep_alive pinning of hot models
+model_lifecycle = ModelLifecycle(upstream, backend_pool, model_registry)
+if model_lifecycle.preload:
+    print(f"{REQUEST_COLOR}Preloading models: {', '.join(model_lifecycle.preload)}{RESET_COLOR}")
+model_lifecycle.start()
+
+# Opt-in cache for deterministic (temperature 0 or seeded) completions
+response_cache = ResponseCache()
+token_counter = TokenCounter()
+recorder = Recorder()
+if recorder.enabled:
+    print(f"{REQUEST_COLOR}Recording {recorder.sample_rate:.0%} of requests to {recorder.directory}{RESET_COLOR}")
+# Routes follow-up turns to the backend holding their prompt prefix
+prefix_affinity = PrefixAffinity()
+# Cancels upstream generation when a streaming client goes away
+disconnect_watcher = DisconnectWatcher()
+# Opt-in coalescing of streamed deltas and gzip/deflate response compression
+output_stage = OutputStage()
 
-def log_to_web(message, log_type="request"):
+def send_embeddings(model, texts, dimensions=None):
+    """One batched /api/embed call, admitted like any other batch request"""
+    body = {"model": model, "input": texts}
+    if dimensions:
+        body["dimensions"] = dimensions
+    ticket = scheduler.acquire(model, PRIORITY_BATCH)
+    try:
+        response = backend_pool.request(upstream, 'POST', '/api/embed', json=body, model=model)
+        response.raise_for_status()
+        result = response.json()
+    finally:
+        ticket.release()
+    return result.get('embeddings', []), result.get('prompt_eval_count') or 0
+
+# Concurrent embedding requests share /api/embed calls; unchanged inputs are not re-embedded
+embedding_cache = EmbeddingCache()
+embedding_batcher = EmbeddingBatcher(send_embeddings)
+
+# Log verbosity: "debug" logs request/response bodies and streamed text,
+# "info" only request summaries, "warning"/"error" only problems
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LOG_LEVEL = LOG_LEVELS.get(os.getenv('LOG_LEVEL', 'debug').lower(), LOG_LEVELS["debug"])
+
+def log_enabled(level):
+    return LOG_LEVELS[level] >= LOG_LEVEL
+
+def log_to_web(message, log_type="request", **fields):
     """Send log message to all connected web clients"""
-    with clients_lock:
-        for client in clients:
+    entry = {
+        "message": message,
+        "type": log_type,
+        "timestamp": time.time()
+    }
+    entry.update(fields)
+    # Tag messages with the request they belong to, for history queries
+    if has_request_context():
+        if not entry.get('request_id') and g.get('request_id'):
+            entry['request_id'] = g.request_id
+        if g.get('model'):
+            entry.setdefault('model', g.model)
+    log_bus.publish(entry)
+
+def stream_log_batcher(request_id):
+    """Batch streamed text into log frames, or None when stream logging is off"""
+    if not log_enabled("debug"):
+        return None
+    
+    def emit(text):
+        print(f"{RESPONSE_COLOR}📝 Streaming chunk: {text}{RESET_COLOR}")
+        log_to_web(text, "stream_chunk", request_id=request_id)
+    
+    return ChunkBatcher(emit)
+
+def iter_ollama_chunks(response):
+    """Parse Ollama's NDJSON stream, skipping malformed lines"""
+    for line in response.iter_lines():
+        if line:
             try:
-                client.put({
-                    "message": message,
-                    "type": log_type
-                })
-            except:
+                yield sse.loads(line)
+            except json.JSONDecodeError:
                 continue
 
-def proxy_request(method, path, data=None, stream=False):
-    url = f"{OLLAMA_BASE_URL}{path}"
-    headers = {
-        'Content-Type': 'application/json',
-    }
+def chunk_text_length(chunk):
+    """Size of an Ollama chat chunk for coalescing: the length of its text"""
+    return len(chunk.get('message', {}).get('content') or '')
+
+def charge_client(client, chunk):
+    """Count the tokens in Ollama's final chunk against the client that asked for them"""
+    client_limits.record(client, chunk.get('prompt_eval_count') or 0, chunk.get('eval_count') or 0)
+
+def client_gone_response():
+    """499 (client closed request) for a client that left while queued; nobody reads it"""
+    log_to_web("Client disconnected while queued; request not sent to Ollama", "warning")
+    return jsonify({"error": {"message": "Client closed request", "type": "client_closed_request", "param": None, "code": None}}), 499
+
+def busy_response(error):
+    """429 with Retry-After for requests the scheduler could not admit"""
+    print(f"\n{ERROR_COLOR}{str(error)} (retry after {error.retry_after}s){RESET_COLOR}")
+    log_to_web(f"{str(error)} (retry after {error.retry_after}s)", "warning")
+    response = jsonify({
+        "error": {
+            "message": str(error),
+            "type": "rate_limit_exceeded",
+            "param": None,
+            "code": "rate_limit_exceeded"
+        }
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def proxy_request(method, path, data=None, stream=False, request_id=None, prefer=None):
+    model = data.get('model') if isinstance(data, dict) else None
+    if len(backend_pool.backends) == 1:
+        url = f"{backend_pool.backends[0].url}{path}"
+    else:
+        url = f"{path} (least busy of {len(backend_pool.backends)} backends)"
     
     # Log the request
-    web_url = f"http://localhost:7005/logs"
-    request_msg = f"➡️ Sending request to Ollama (View logs at {web_url}):"
-    print(f"\n{REQUEST_COLOR}{request_msg}{RESET_COLOR}")
-    log_to_web(request_msg)
-    
-    method_msg = f"Method: {method}"
-    print(f"{REQUEST_COLOR}{method_msg}{RESET_COLOR}")
-    log_to_web(method_msg)
-    
-    url_msg = f"URL: {url}"
-    print(f"{REQUEST_COLOR}{url_msg}{RESET_COLOR}")
-    log_to_web(url_msg)
+    if log_enabled("info"):
+        web_url = f"http://localhost:7005/logs"
+        request_msg = f"➡️ Sending request to Ollama (View logs at {web_url}):"
+        print(f"\n{REQUEST_COLOR}{request_msg}{RESET_COLOR}")
+        log_to_web(request_msg)
+        
+        method_msg = f"Method: {method}"
+        print(f"{REQUEST_COLOR}{method_msg}{RESET_COLOR}")
+        log_to_web(method_msg)
+        
+        url_msg = f"URL: {url}"
+        print(f"{REQUEST_COLOR}{url_msg}{RESET_COLOR}")
+        log_to_web(url_msg)
     
-    if data:
+    if data and log_enabled("debug"):
         data_msg = f"Data: {json.dumps(data, indent=2)}"
         print(f"{REQUEST_COLOR}{data_msg}{RESET_COLOR}")
         log_to_web(data_msg)
     
+    dedup = can_share_call(method, path, data)
+    
     try:
         if stream:
-            response = requests.request(
-                method,
-                url,
-                json=data,
-                headers=headers,
-                stream=True
-            )
-            response.raise_for_status()
-            stream_msg = "⬅️ Received streaming response from Ollama"
-            print(f"{RESPONSE_COLOR}{stream_msg}{RESET_COLOR}")
-            log_to_web("Stream started", "stream_start")
+            def open_stream():
+                response = backend_pool.request(upstream, method, path, json=data, stream=True, model=model, prefer=prefer)
+                response.raise_for_status()
+                return response
+            
+            if dedup:
+                # Followers read a shared copy of the leader's stream
+                response = single_flight.stream(request_key(method, path, data), open_stream)
+            else:
+                response = open_stream()
+            g.ollama_backend = getattr(response, 'backend_url', None) or ''
+            if log_enabled("info"):
+                stream_msg = "⬅️ Received streaming response from Ollama"
+                print(f"{RESPONSE_COLOR}{stream_msg}{RESET_COLOR}")
+                log_to_web("Stream started", "stream_start", request_id=request_id)
             return response
         
-        response = requests.request(
-            method,
-            url,
-            json=data,
-            headers=headers
-        )
-        response.raise_for_status()
+        def call():
+            response = backend_pool.request(upstream, method, path, json=data, model=model, prefer=prefer)
+            response.raise_for_status()
+            return response.json(), response.backend_url
+        
+        if dedup:
+            response_json, g.ollama_backend = single_flight.do(request_key(method, path, data), call)
+        else:
+            response_json, g.ollama_backend = call()
         
         # Log the response
-        response_msg = "⬅️ Received response from Ollama:"
-        print(f"\n{RESPONSE_COLOR}{response_msg}{RESET_COLOR}")
-        log_to_web(response_msg, "response")
+        if log_enabled("info"):
+            response_msg = "⬅️ Received response from Ollama:"
+            print(f"\n{RESPONSE_COLOR}{response_msg}{RESET_COLOR}")
+            log_to_web(response_msg, "response")
         
-        response_data = f"{json.dumps(response.json(), indent=2)}"
-        print(f"{RESPONSE_COLOR}{response_data}{RESET_COLOR}")
-        log_to_web(response_data, "response")
+        if log_enabled("debug"):
+            response_data = f"{json.dumps(response_json, indent=2)}"
+            print(f"{RESPONSE_COLOR}{response_data}{RESET_COLOR}")
+            log_to_web(response_data, "response")
         
-        return response.json()
+        return response_json
     except Exception as e:
         error_msg = f"❌ Error in proxy request: {str(e)}"
         print(f"\n{ERROR_COLOR}{error_msg}{RESET_COLOR}")
         log_to_web(error_msg, "error")
         raise
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.client = client_id(request.headers.get('Authorization'))
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if route in ('/logs/stream', '/metrics', '/ready', '/healthz') or request.method == 'OPTIONS':
+        return response
+    started = g.get('request_started', time.perf_counter())
+    model = g.get('model', '')
+    status = str(response.status_code)
+    
+    backend = g.get('ollama_backend', '')
+    capture = g.get('capture')
+    if g.get('request_id'):
+        response.headers['X-Request-Id'] = g.request_id
+    
+    # Streams finish long after this hook runs, so measure on close
+    def observe():
+        duration = time.perf_counter() - started
+        REQUESTS.inc(route=route, model=model, status=status)
+        REQUEST_DURATION.observe(duration, route=route, model=model, backend=backend)
+        recorder.finish(capture, status=int(status), duration=duration, model=model, backend=backend)
+    
+    response.call_on_close(observe)
+    return response
+
+@app.after_request
+def compress_response(response):
+    if request.method == 'OPTIONS':
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    return output_stage.compress(response, request, route)
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@metrics_registry.collector
+def collect_proxy_state():
+    scheduler_state = scheduler.stats()
+    backends_state = backend_pool.stats()['backends']
+    return [
+        ('ollama_proxy_queue_depth', 'gauge', 'Requests waiting for an admission slot.',
+         [({}, scheduler_state['queue_depth'])]),
+        ('ollama_proxy_active_requests', 'gauge', 'Admitted requests per model.',
+         [({'model': model}, count) for model, count in scheduler_state['active'].items()]),
+        ('ollama_proxy_backend_in_flight', 'gauge', 'Requests in flight per Ollama backend.',
+         [({'backend': b['url']}, b['in_flight']) for b in backends_state]),
+        ('ollama_proxy_backend_healthy', 'gauge', 'Whether an Ollama backend is in rotation.',
+         [({'backend': b['url']}, 1 if b['healthy'] else 0) for b in backends_state]),
+    ]
+
 @app.route('/logs')
 def logs_page():
     return render_template('logs.html')
@@ -120,19 +336,48 @@ def logs_page():
 @app.route('/logs/stream')
 def stream_logs():
     def generate():
-        q = Queue()
-        with clients_lock:
-            clients.add(q)
+        subscription = log_bus.subscribe()
+        dropped = 0
         try:
             while True:
-                message = q.get()
-                yield f"data: {json.dumps(message)}\n\n"
+                messages = subscription.get(timeout=15)
+                if not messages:
+                    # Keep idle connections alive and notice closed tabs
+                    yield ": keepalive\n\n"
+                    continue
+                if subscription.dropped > dropped:
+                    notice = {
+                        "message": f"Viewer fell behind: {subscription.dropped - dropped} log messages dropped",
+                        "type": "warning",
+                        "timestamp": time.time()
+                    }
+                    dropped = subscription.dropped
+                    yield f"data: {json.dumps(notice)}\n\n"
+                yield "".join(f"data: {json.dumps(message)}\n\n" for message in messages)
         finally:
-            with clients_lock:
-                clients.remove(q)
+            subscription.close()
     
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
+@app.route('/logs/stats')
+def log_stats():
+    stats = log_bus.stats()
+    stats["history"] = log_store.stats()
+    return jsonify(stats)
+
+@app.route('/logs/history')
+def log_history():
+    args = request.args
+    log_filter = LogFilter(
+        types=[t for t in args.get('type', '').split(',') if t],
+        model=args.get('model') or None,
+        request_id=args.get('request_id') or None,
+        since=args.get('since', type=float),
+        until=args.get('until', type=float),
+        text=args.get('q') or None,
+    )
+    return jsonify(log_store.query(log_filter, before=args.get('before', type=int), limit=args.get('limit', 200, type=int)))
+
 @app.route('/v1/chat/completions', methods=['OPTIONS', 'POST'])
 @app.route('/chat/completions', methods=['OPTIONS', 'POST'])
 def chat_completions():
@@ -147,22 +392,19 @@ def chat_completions():
         response.headers.add('Access-Control-Max-Age', '3600')
         return response
     
+    ticket = None
     try:
         data = request.get_json()
         stream = data.get('stream', False)
         requested_model = data.get('model', 'gemma3:12b-it-qat')  # Get requested model
         
-        # Get available models from Ollama
+        # Check the requested model against the cached catalog
         try:
-            models_response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
-            models_data = models_response.json()
-            available_models = [model['name'] for model in models_data.get('models', [])]
-            
             # If requested model doesn't exist, use first available model
-            if not available_models:
-                raise Exception("No models available from Ollama")
-                
-            if requested_model not in available_models:
+            if not model_registry.contains(requested_model):
+                available_models = model_registry.names()
+                if not available_models:
+                    raise Exception("No models available from Ollama")
                 original_model = requested_model
                 requested_model = available_models[0]
                 print(f"\n{REQUEST_COLOR}Model '{original_model}' not found. Using '{requested_model}' instead. View available models at http://localhost:7005/logs{RESET_COLOR}")
@@ -171,172 +413,325 @@ def chat_completions():
             print(f"\n{ERROR_COLOR}Error getting models list: {str(e)}. Using default model.{RESET_COLOR}")
             requested_model = 'gemma3:12b-it-qat'  # Fallback to default
         
-        # Transform OpenAI format to Ollama format
-        messages = data.get('messages', [])
-        prompt = ""
-        for message in messages:
-            role = message.get('role', 'user')
-            content = message.get('content', '')
-            prompt += f"{role}: {content}\n"
-        
-        ollama_data = {
-            "model": requested_model,  # Use the selected model
-            "prompt": prompt,
-            "stream": stream
-        }
+        g.model = requested_model
+        client = g.client
+        client_limits.admit(client)
+        model_lifecycle.record_request(requested_model)
+        timer = StreamTimer(request.url_rule.rule, requested_model, g.request_started)
+        completion_id = g.request_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        capture = g.capture = recorder.begin(completion_id, request.method, request.path, data)
+        
+        # Transform OpenAI format to Ollama /api/chat format
+        ollama_data = to_ollama_chat(data, requested_model, stream)
+        prompt = prompt_text(ollama_data['messages'])
+        
+        # Deterministic requests can be answered from the response cache
+        cache_key = None
+        cached = None
+        if response_cache.enabled and is_deterministic(data):
+            cache_key = response_cache.key(ollama_data)
+            cached = response_cache.get(cache_key)
+            if cached is not None and log_enabled("info"):
+                print(f"\n{RESPONSE_COLOR}⚡ Serving cached response for {requested_model}{RESET_COLOR}")
+                log_to_web(f"⚡ Serving cached response for {requested_model}", "response")
+        
+        # Wait for a slot unless the answer is already cached; streaming
+        # (interactive) requests are admitted ahead of non-streaming (batch) ones
+        if cached is None:
+            queued_at = time.perf_counter()
+            ticket = scheduler.acquire(requested_model, PRIORITY_INTERACTIVE if stream else PRIORITY_BATCH, client, client_limits.weight(client))
+            timer.queued(time.perf_counter() - queued_at)
+            if disconnect_watcher.gone_while_queued(request.environ, request.url_rule.rule, requested_model):
+                ticket.release()
+                return client_gone_response()
+        else:
+            timer.backend = 'cache'
+        
+        # Prefer the backend that already holds this conversation's prefix in its KV cache
+        fingerprints = None
+        preferred_backend = None
+        # With one backend there is nothing to choose, so skip hashing the history
+        if cached is None and prefix_affinity.enabled and len(backend_pool.backends) > 1:
+            fingerprints = prefix_fingerprints(requested_model, ollama_data['messages'], ollama_data.get('tools'))
+            preferred_backend, _ = prefix_affinity.lookup(fingerprints)
         
         if stream:
-            ollama_response = proxy_request('POST', '/api/generate', ollama_data, stream=True)
+            guard = None
+            if cached is not None:
+                ollama_chunks = replay_chunks(cached)
+                if log_enabled("info"):
+                    log_to_web("Stream started (cached)", "stream_start", request_id=completion_id)
+            else:
+                sent_at = time.perf_counter()
+                ollama_response = proxy_request('POST', '/api/chat', ollama_data, stream=True, request_id=completion_id, prefer=preferred_backend)
+                timer.waited(time.perf_counter() - sent_at)
+                timer.backend = g.ollama_backend
+                prefix_affinity.remember(fingerprints, ollama_data['messages'], g.ollama_backend, preferred_backend)
+                guard = disconnect_watcher.guard(request.environ, request.url_rule.rule, requested_model, ollama_response)
+                ollama_chunks = timer.upstream(guard.upstream(iter_ollama_chunks(ollama_response)))
             
             def generate():
-                full_response = ""
-                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
-                created = int(time.time())
+                completion = CompletionCount()
+                encoder = ChunkEncoder(completion_id, int(time.time()), data.get('model', 'gemma3:12b-it-qat'))
+                log_batcher = stream_log_batcher(completion_id)
+                saw_tool_calls = False
+                last_chunk = {}
+                # Only keep the text around when it is going into the cache
+                cache_parts = [] if cache_key and cached is None else None
+                cache_tool_calls = []
                 
                 # Send initial role chunk
-                response_data = {
-                    'id': completion_id,
-                    'object': 'chat.completion.chunk',
-                    'created': created,
-                    'model': data.get('model', 'gemma3:12b-it-qat'),
-                    'choices': [{
-                        'index': 0,
-                        'delta': {'role': 'assistant'},
-                        'finish_reason': None
-                    }]
-                }
-                yield f"data: {json.dumps(response_data)}\n\n"
+                yield encoder.role()
                 
-                # Process Ollama's streaming response
-                for line in ollama_response.iter_lines():
-                    if line:
-                        try:
-                            chunk = json.loads(line)
-                            if 'response' in chunk:
-                                response_text = chunk['response']
-                                full_response += response_text
-                                
-                                # Log streaming chunk
-                                print(f"{RESPONSE_COLOR}📝 Streaming chunk: {response_text}{RESET_COLOR}")
-                                log_to_web(response_text, "stream_chunk")
-                                
-                                # Send content chunk
-                                chunk_data = {
-                                    'id': completion_id,
-                                    'object': 'chat.completion.chunk',
-                                    'created': created,
-                                    'model': data.get('model', 'gemma3:12b-it-qat'),
-                                    'choices': [{
-                                        'index': 0,
-                                        'delta': {'content': response_text},
-                                        'finish_reason': None
-                                    }]
-                                }
-                                yield f"data: {json.dumps(chunk_data)}\n\n"
-                        except json.JSONDecodeError:
-                            continue
+                # Bytes a delta costs besides its text, saved by every delta merged into another
+                frame_overhead = len(encoder.content(''))
+                
+                def merged_content(parts):
+                    output_stage.saved((len(parts) - 1) * frame_overhead)
+                    return encoder.content(''.join(parts))
+                
+                def token_arrived(chunk):
+                    # Timed as chunks arrive, not when their (coalesced) frame is written
+                    if chunk.get('message', {}).get('content'):
+                        timer.token()
+                
+                # Process Ollama's streaming response; chunks that arrive close together form one frame
+                batches = output_stage.batches(
+                    timer.route, ollama_chunks, chunk_text_length,
+                    arrived=token_arrived, close=guard.response.close if guard else None)
+                for batch in batches:
+                    text_parts = []
+                    for chunk in batch:
+                        last_chunk = chunk
+                        message = chunk.get('message', {})
+                        
+                        if message.get('tool_calls'):
+                            saw_tool_calls = True
+                            if cache_parts is not None:
+                                cache_tool_calls.extend(message['tool_calls'])
+                            # Keep the text that came first ahead of the tool calls
+                            if text_parts:
+                                yield merged_content(text_parts)
+                                text_parts = []
+                            yield encoder.tool_calls(tool_calls_to_openai(message['tool_calls']))
+                        
+                        response_text = message.get('content')
+                        if response_text:
+                            completion.add(response_text)
+                            if capture:
+                                capture.add(response_text)
+                            if cache_parts is not None:
+                                cache_parts.append(response_text)
+                            
+                            # Log streaming chunk, coalesced into frames
+                            if log_batcher:
+                                log_batcher.add(response_text)
+                            text_parts.append(response_text)
+                    
+                    # Send content chunk
+                    if text_parts:
+                        yield merged_content(text_parts)
+                
+                if guard and guard.cancelled:
+                    client_limits.record(client, completion_tokens=guard.tokens)
+                    if log_batcher:
+                        log_batcher.flush()
+                    log_to_web(f"Client disconnected; cancelled generation after {guard.tokens} chunks", "warning", request_id=completion_id)
+                    return
+                
+                if cached is None:
+                    observe_ollama_counts(last_chunk, requested_model, timer.backend)
+                    model_lifecycle.observe(requested_model, last_chunk)
+                # Cached replays cost Ollama nothing
+                charge_client(client, last_chunk if cached is None else {})
+                
+                # Cache only streams that ran to completion
+                if cache_parts is not None and last_chunk.get('done'):
+                    response_cache.put(cache_key, entry_from_chunks(''.join(cache_parts), cache_tool_calls, last_chunk))
                 
                 # Log stream end
-                log_to_web("Stream completed", "stream_end")
+                if log_batcher:
+                    log_batcher.flush()
+                if log_enabled("info"):
+                    log_to_web("Stream completed", "stream_end", request_id=completion_id)
                 
                 # Send final chunk
-                final_chunk = {
-                    'id': completion_id,
-                    'object': 'chat.completion.chunk',
-                    'created': created,
-                    'model': data.get('model', 'gemma3:12b-it-qat'),
-                    'choices': [{
-                        'index': 0,
-                        'delta': {},
-                        'finish_reason': 'stop'
-                    }]
-                }
-                yield f"data: {json.dumps(final_chunk)}\n\n"
+                yield encoder.finish(finish_reason(last_chunk, saw_tool_calls))
                 
                 # Send usage chunk
-                prompt_tokens = len(prompt) // 4
-                completion_tokens = len(full_response) // 4
-                usage_chunk = {
-                    'id': completion_id,
-                    'object': 'chat.completion.chunk',
-                    'created': created,
-                    'model': data.get('model', 'gemma3:12b-it-qat'),
-                    'choices': [{
-                        'index': 0,
-                        'delta': {},
-                        'finish_reason': None
-                    }],
-                    'usage': {
-                        'prompt_tokens': prompt_tokens,
-                        'completion_tokens': completion_tokens,
-                        'total_tokens': prompt_tokens + completion_tokens,
-                        'prompt_tokens_details': {
-                            'cached_tokens': 0,
-                            'audio_tokens': 0
-                        },
-                        'completion_tokens_details': {
-                            'reasoning_tokens': 0,
-                            'audio_tokens': 0,
-                            'accepted_prediction_tokens': 0,
-                            'rejected_prediction_tokens': 0
-                        }
-                    }
-                }
-                yield f"data: {json.dumps(usage_chunk)}\n\n"
+                yield encoder.usage(token_counter.usage(requested_model, prompt, completion, last_chunk, streamed=cached is None))
                 
-                yield "data: [DONE]\n\n"
+                yield sse.DONE
             
-            return Response(stream_with_context(generate()), mimetype='text/event-stream')
+            frames = timer.track(generate())
+            if guard:
+                frames = guard.track(frames)
+            response = Response(stream_with_context(frames), mimetype='text/event-stream')
+            if ticket:
+                # Hold the slot until the stream is finished or the client goes away
+                response.call_on_close(ticket.release)
+            timer.responded()
+            return response
         else:
-            ollama_response = proxy_request('POST', '/api/generate', ollama_data)
-            response_content = ollama_response.get('response', '')
+            if cached is not None:
+                ollama_response = cached
+                charge_client(client, {})
+            else:
+                sent_at = time.perf_counter()
+                try:
+                    ollama_response = proxy_request('POST', '/api/chat', ollama_data, prefer=preferred_backend)
+                finally:
+                    ticket.release()
+                timer.waited(time.perf_counter() - sent_at)
+                timer.backend = g.ollama_backend
+                prefix_affinity.remember(fingerprints, ollama_data['messages'], g.ollama_backend, preferred_backend)
+                observe_ollama_counts(ollama_response, requested_model, timer.backend)
+                model_lifecycle.observe(requested_model, ollama_response)
+                charge_client(client, ollama_response)
+                if cache_key:
+                    response_cache.put(cache_key, entry_from_chunks(
+                        ollama_response.get('message', {}).get('content', ''),
+                        ollama_response.get('message', {}).get('tool_calls'),
+                        ollama_response
+                    ))
+            ollama_message = ollama_response.get('message', {})
+            response_content = ollama_message.get('content', '')
             
             # Format response to match OpenAI API format
-            prompt_tokens = len(prompt) // 4
-            completion_tokens = len(response_content) // 4
+            completion = CompletionCount()
+            completion.add(response_content)
+            
+            message = {
+                "role": "assistant",
+                "content": response_content,
+                "refusal": None,
+                "annotations": []
+            }
+            if ollama_message.get('tool_calls'):
+                message["tool_calls"] = tool_calls_to_openai(ollama_message['tool_calls'])
             
             openai_response = {
-                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "id": completion_id,
                 "object": "chat.completion",
                 "created": int(time.time()),
                 "model": data.get('model', 'gemma3:12b-it-qat'),
                 "choices": [
                     {
                         "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": response_content,
-                            "refusal": None,
-                            "annotations": []
-                        },
+                        "message": message,
                         "logprobs": None,
-                        "finish_reason": "stop"
+                        "finish_reason": finish_reason(ollama_response, bool(ollama_message.get('tool_calls')))
                     }
                 ],
-                "usage": {
-                    "prompt_tokens": prompt_tokens,
-                    "completion_tokens": completion_tokens,
-                    "total_tokens": prompt_tokens + completion_tokens,
-                    "prompt_tokens_details": {
-                        "cached_tokens": 0,
-                        "audio_tokens": 0
-                    },
-                    "completion_tokens_details": {
-                        "reasoning_tokens": 0,
-                        "audio_tokens": 0,
-                        "accepted_prediction_tokens": 0,
-                        "rejected_prediction_tokens": 0
-                    }
-                },
+                "usage": token_counter.usage(requested_model, prompt, completion, ollama_response),
                 "service_tier": "default",
                 "system_fingerprint": f"fp_{uuid.uuid4().hex[:8]}"
             }
             
-            return jsonify(openai_response)
+            if capture:
+                capture.response = openai_response
+            response = jsonify(openai_response)
+            timer.finish()
+            return response
     
+    except QueueFull as e:
+        return busy_response(e)
     except Exception as e:
+        if ticket:
+            ticket.release()
         return jsonify({"error": str(e)}), 500
 
+@app.route('/v1/embeddings', methods=['OPTIONS', 'POST'])
+@app.route('/embeddings', methods=['OPTIONS', 'POST'])
+def embeddings():
+    if request.method == 'OPTIONS':
+        response = jsonify({
+            "status": "ok",
+            "message": "CORS preflight request successful"
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        response.headers.add('Access-Control-Max-Age', '3600')
+        return response
+    
+    def error(message, status, error_type="invalid_request_error"):
+        return jsonify({"error": {"message": message, "type": error_type, "param": None, "code": None}}), status
+    
+    try:
+        data = request.get_json()
+        model = data.get('model')
+        inputs = data.get('input')
+        dimensions = data.get('dimensions')
+        if not model:
+            return error("Missing model", 400)
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        if not isinstance(inputs, list) or not inputs or not all(isinstance(text, str) for text in inputs):
+            return error("input must be a string or an array of strings (Ollama does not accept token arrays)", 400)
+        g.model = model
+        g.request_id = f"req-{uuid.uuid4().hex[:12]}"
+        client_limits.admit(g.client)
+        
+        # Look every input up by content hash; only the rest goes to Ollama
+        vectors = [None] * len(inputs)
+        prompt_tokens = 0
+        missing = []
+        missing_keys = []
+        for i, text in enumerate(inputs):
+            key = content_key(model, text, dimensions)
+            vector, source = embedding_cache.get(model, key)
+            if vector is None:
+                missing.append(i)
+                missing_keys.append(key)
+                continue
+            vectors[i] = vector
+            prompt_tokens += token_counter.estimate(model, text)
+            EMBED_INPUTS.inc(model=model, source=source)
+        
+        if missing:
+            items = embedding_batcher.embed(model, missing_keys, [inputs[i] for i in missing], dimensions)
+            for i, item in zip(missing, items):
+                vectors[i] = item.vector
+                prompt_tokens += item.tokens
+                embedding_cache.put(model, item.key, item.vector)
+            EMBED_INPUTS.inc(len(missing), model=model, source='ollama')
+        
+        client_limits.record(g.client, prompt_tokens=prompt_tokens)
+        if log_enabled("info"):
+            log_to_web(f"Embedded {len(inputs)} inputs with {model} ({len(inputs) - len(missing)} cached)", "response")
+        
+        base64_encoded = data.get('encoding_format') == 'base64'
+        entries = []
+        for i, vector in enumerate(vectors):
+            if base64_encoded:
+                # OpenAI's base64 format is little-endian float32
+                packed = array('f', vector)
+                if sys.byteorder != 'little':
+                    packed.byteswap()
+                vector = base64.b64encode(packed.tobytes()).decode('ascii')
+            entries.append({"object": "embedding", "index": i, "embedding": vector})
+        
+        body = {
+            "object": "list",
+            "data": entries,
+            "model": model,
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+        }
+        return Response(sse.dumps(body), mimetype='application/json')
+    except QueueFull as e:
+        return busy_response(e)
+    except requests.exceptions.HTTPError as e:
+        try:
+            message = e.response.json().get('error', str(e))
+        except ValueError:
+            message = str(e)
+        log_to_web(f"Embedding request failed: {message}", "error")
+        return error(message, e.response.status_code if e.response.status_code < 500 else 502, "upstream_error")
+    except Exception as e:
+        log_to_web(f"Embedding request failed: {str(e)}", "error")
+        return error(str(e), 500, "server_error")
+
 @app.route('/v1/models', methods=['OPTIONS', 'GET'])
 @app.route('/models', methods=['OPTIONS', 'GET'])
 def list_models():
@@ -352,8 +747,7 @@ def list_models():
         return response
     
     try:
-        ollama_response = proxy_request('GET', '/api/tags')
-        models = ollama_response.get('models', [])
+        models = model_registry.models()
         
         return jsonify({
             "object": "list",
@@ -373,19 +767,18 @@ def list_models():
 @app.route('/api/models')
 def get_models():
     try:
-        # Get list of models from Ollama with timeout - silently
-        models_response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
-        if not models_response.ok:
-            error_msg = f"Failed to get models list: {models_response.status_code} - {models_response.text}"
+        # Get list of models from the cached catalog - silently
+        try:
+            catalog = model_registry.models()
+        except Exception as e:
+            error_msg = f"Failed to get models list: {str(e)}"
             print(f"\n{ERROR_COLOR}{error_msg}{RESET_COLOR}")
             log_to_web(error_msg, "error")
             return jsonify({"error": error_msg}), 500
-            
-        models_data = models_response.json()
         
         # Return models without status
         models = []
-        for model in models_data.get('models', []):
+        for model in catalog:
             models.append({
                 "name": model.get('name', ''),
                 "details": model.get('details', {})
@@ -401,41 +794,31 @@ def get_models():
 @app.route('/api/models/refresh', methods=['POST'])
 def refresh_models():
     try:
-        # Get list of models
-        models_response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
-        if not models_response.ok:
+        # Get list of models, bypassing the catalog TTL
+        try:
+            catalog = model_registry.refresh()
+        except Exception:
             return jsonify({"error": "Failed to get models list"}), 500
-            
-        models_data = models_response.json()
-        
-        # Check which model is currently loaded using a single request
-        print(f"\n{REQUEST_COLOR}Checking which model is currently loaded{RESET_COLOR}")
-        log_to_web("Checking which model is currently loaded")
         
+        # Ask every backend which models are resident
         try:
-            # Get currently loaded model
-            show_response = requests.get(f"{OLLAMA_BASE_URL}/api/show", timeout=2)
-            current_model = None
-            if show_response.status_code == 200:
-                current_model = show_response.json().get('model', {}).get('name')
-                print(f"{RESPONSE_COLOR}Currently loaded model: {current_model}{RESET_COLOR}")
-                log_to_web(f"Currently loaded model: {current_model}")
+            loaded = model_lifecycle.poll()
         except Exception as e:
-            print(f"{ERROR_COLOR}Error checking loaded model: {str(e)}{RESET_COLOR}")
-            current_model = None
+            print(f"{ERROR_COLOR}Error checking loaded models: {str(e)}{RESET_COLOR}")
+            loaded = set()
+        residency = model_lifecycle.residency()
         
         # Update status for all models
         results = []
-        for model in models_data.get('models', []):
+        for model in catalog:
             model_name = model.get('name', '')
-            running = model_name == current_model
-            
-            # Update cache
-            model_status_cache[model_name] = running
+            running = model_name in loaded
+            model_registry.set_running(model_name, running)
             
             results.append({
                 "name": model_name,
                 "running": running,
+                "residency": residency.get(model_name),
                 "details": model.get('details', {})
             })
         
@@ -457,27 +840,19 @@ def control_model():
             print(f"\n{REQUEST_COLOR}Starting model: {model_name}{RESET_COLOR}")
             log_to_web(f"Starting model: {model_name}")
             
-            # Start model by sending a simple generation request
-            response = requests.post(
-                f"{OLLAMA_BASE_URL}/api/generate",
-                json={
-                    "model": model_name,
-                    "prompt": "You are a helpful AI assistant.",
-                    "stream": False
-                },
-                timeout=30  # Longer timeout for model loading
-            )
-            
-            if response.status_code == 200:
-                success_msg = f"Model {model_name} start request sent"
-                print(f"{RESPONSE_COLOR}{success_msg}{RESET_COLOR}")
-                log_to_web(success_msg, "response")
-                return jsonify({"status": "success", "message": success_msg})
-            else:
-                error_msg = f"Failed to start model: {response.status_code} - {response.text}"
+            # Load the model without generating; keep_alive keeps it resident
+            try:
+                elapsed = model_lifecycle.load(model_name, timeout=30)  # Longer timeout for model loading
+            except requests.exceptions.HTTPError as e:
+                error_msg = f"Failed to start model: {e.response.status_code} - {e.response.text}"
                 print(f"{ERROR_COLOR}{error_msg}{RESET_COLOR}")
                 log_to_web(error_msg, "error")
                 return jsonify({"error": error_msg}), 500
+            
+            success_msg = f"Model {model_name} loaded in {elapsed:.1f}s"
+            print(f"{RESPONSE_COLOR}{success_msg}{RESET_COLOR}")
+            log_to_web(success_msg, "response")
+            return jsonify({"status": "success", "message": success_msg, "load_seconds": elapsed})
         else:
             return jsonify({"error": "Invalid action"}), 400
             
@@ -507,29 +882,87 @@ def catch_all(path):
         response.headers.add('Access-Control-Max-Age', '3600')
         return response
     
+    ticket = None
     try:
         method = request.method
         data = request.get_json() if request.is_json else None
         stream = data.get('stream', False) if data else False
         
+        # Only model work is queued; catalog and status calls pass straight through
+        model = data.get('model') if isinstance(data, dict) else None
+        g.model = model or ''
+        timer = StreamTimer(request.url_rule.rule, g.model, g.request_started)
+        g.request_id = f"req-{uuid.uuid4().hex[:12]}"
+        capture = g.capture = recorder.begin(g.request_id, method, request.path, data)
+        client = g.client
+        if model:
+            client_limits.admit(client)
+            model_lifecycle.record_request(model)
+            queued_at = time.perf_counter()
+            ticket = scheduler.acquire(model, PRIORITY_INTERACTIVE if stream else PRIORITY_BATCH, client, client_limits.weight(client))
+            timer.queued(time.perf_counter() - queued_at)
+            if disconnect_watcher.gone_while_queued(request.environ, request.url_rule.rule, model):
+                ticket.release()
+                return client_gone_response()
+        
+        sent_at = time.perf_counter()
         ollama_response = proxy_request(method, f'/api/{path}', data, stream)
+        timer.waited(time.perf_counter() - sent_at)
+        timer.backend = g.get('ollama_backend', '')
         
         if stream:
+            guard = disconnect_watcher.guard(request.environ, request.url_rule.rule, g.model, ollama_response)
+            
             def generate():
-                for line in ollama_response.iter_lines():
-                    if line:
+                lines = (line for line in timer.upstream(guard.upstream(ollama_response.iter_lines())) if line)
+                last_line = None
+                # Lines that arrive close together go out in one write
+                batches = output_stage.batches(
+                    timer.route, lines, arrived=lambda line: timer.token(), close=ollama_response.close)
+                for batch in batches:
+                    for line in batch:
+                        if capture:
+                            capture.add(line.decode('utf-8', 'replace') + '\n')
+                    last_line = batch[-1]
+                    # Ollama's NDJSON lines are already JSON; frame them as they are
+                    yield b"".join(sse.passthrough(line) for line in batch)
+                if model:
+                    if guard.cancelled:
+                        client_limits.record(client, completion_tokens=guard.tokens)
+                    else:
+                        # Only the final line carries Ollama's token counts
                         try:
-                            chunk = json.loads(line)
-                            yield f"data: {json.dumps(chunk)}\n\n"
-                        except json.JSONDecodeError:
-                            continue
-                yield "data: [DONE]\n\n"
+                            final = sse.loads(last_line) if last_line else {}
+                        except ValueError:
+                            final = {}
+                        charge_client(client, final if isinstance(final, dict) else {})
+                if guard.cancelled:
+                    log_to_web(f"Client disconnected; cancelled generation after {guard.tokens} chunks", "warning")
+                    return
+                yield sse.DONE
             
-            return Response(stream_with_context(generate()), mimetype='text/event-stream')
+            response = Response(stream_with_context(guard.track(timer.track(generate()))), mimetype='text/event-stream')
+            if ticket:
+                response.call_on_close(ticket.release)
+            timer.responded()
+            return response
         else:
-            return jsonify(ollama_response)
+            if ticket:
+                ticket.release()
+            if capture:
+                capture.response = ollama_response
+            if model and isinstance(ollama_response, dict):
+                model_lifecycle.observe(model, ollama_response)
+                charge_client(client, ollama_response)
+            response = jsonify(ollama_response)
+            timer.finish()
+            return response
     
+    except QueueFull as e:
+        return busy_response(e)
     except Exception as e:
+        if ticket:
+            ticket.release()
         return jsonify({
             "error": {
                 "message": str(e),
@@ -539,6 +972,82 @@ def catch_all(path):
             }
         }), 500
 
+@app.route('/api/upstream/stats')
+def upstream_stats():
+    return jsonify(upstream.stats())
+
+@app.route('/api/scheduler/stats')
+def scheduler_stats():
+    return jsonify(scheduler.stats())
+
+@app.route('/api/clients')
+def client_stats():
+    stats = client_limits.stats()
+    queue = scheduler.stats()['clients']
+    for name, entry in stats['clients'].items():
+        entry.update(queue.get(name, {"queued": 0, "active": 0, "hold_ewma": None}))
+    return jsonify(stats)
+
+@app.route('/api/backends')
+def backend_stats():
+    return jsonify(backend_pool.stats())
+
+@app.route('/api/singleflight/stats')
+def single_flight_stats():
+    return jsonify(single_flight.stats())
+
+@app.route('/api/cache/stats')
+def response_cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/api/recorder/stats')
+def recorder_stats():
+    return jsonify(recorder.stats())
+
+@app.route('/api/recorder/<request_id>')
+def recorded_request(request_id):
+    record = recorder.lookup(request_id)
+    if record is None:
+        return jsonify({"error": f"No recording for {request_id}"}), 404
+    return jsonify(record)
+
+@app.route('/api/models/stats')
+def model_catalog_stats():
+    return jsonify(model_registry.stats())
+
+@app.route('/api/embeddings/stats')
+def embedding_stats():
+    return jsonify({"batcher": embedding_batcher.stats(), "cache": embedding_cache.stats()})
+
+@app.route('/api/affinity/stats')
+def prefix_affinity_stats():
+    return jsonify(prefix_affinity.stats())
+
+@app.route('/api/disconnects/stats')
+def disconnect_stats():
+    return jsonify(disconnect_watcher.stats())
+
+@app.route('/api/output/stats')
+def output_stats():
+    return jsonify(output_stage.stats())
+
+@app.route('/api/models/lifecycle')
+def model_lifecycle_stats():
+    return jsonify(model_lifecycle.stats())
+
+@app.route('/healthz')
+def liveness():
+    return jsonify({"status": "ok"})
+
+@app.route('/ready')
+def readiness():
+    status = warm_up.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/api/startup')
+def startup_stats():
+    return jsonify({"profile": startup_profile.report(), "warm_up": warm_up.status()})
+
 @app.route('/favicon.ico')
 def favicon():
     return '', 204  # Return empty response with "No Content" status
@@ -560,14 +1069,17 @@ def generate():
         print(f"\n{REQUEST_COLOR}Sending query to model {model_name}{RESET_COLOR}")
         log_to_web(f"Sending query to model {model_name}")
         
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
+        response = backend_pool.request(
+            upstream,
+            'POST',
+            '/api/generate',
             json={
                 "model": model_name,
                 "prompt": prompt,
                 "stream": False
             },
-            timeout=30
+            timeout=30,
+            model=model_name
         )
         
         if response.status_code == 200:
@@ -586,5 +1098,29 @@ def generate():
         log_to_web(error_msg, "error")
         return jsonify({"error": error_msg}), 500
 
+def warm_upstream():
+    """Open a keep-alive connection to every backend; at least one has to answer"""
+    errors = []
+    for backend in backend_pool.backends:
+        try:
+            response = upstream.get('/api/version', timeout=5, base_url=backend.url)
+            if response.status_code >= 500:
+                raise Exception(f"HTTP {response.status_code}")
+        except Exception as e:
+            errors.append(f"{backend.url}: {e}")
+    if len(errors) == len(backend_pool.backends):
+        raise Exception("; ".join(errors))
+
+def on_ready():
+    startup_profile.mark('warm-up')
+    elapsed = time.perf_counter() - startup_profile.started
+    print(f"{RESPONSE_COLOR}Ready after {elapsed:.2f}s: upstream connections and model catalog are warm{RESET_COLOR}")
+
+# Readiness (/ready) waits for warm upstream connections and a fetched model catalog
+warm_up = startup.WarmUp([("upstream", warm_upstream), ("catalog", model_registry.refresh)], on_ready=on_ready)
+warm_up.start()
+startup_profile.mark('subsystems')
+startup_profile.finish()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=7005) 
\ No newline at end of file
@@ -0,0 +1,274 @@
+import os
+import threading
+import time
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from metrics import UPSTREAM_CONNECT
+
+
+# Upstream statuses that mean the host itself is unhealthy
+_UNHEALTHY_STATUSES = (502, 503, 504)
+
+
+class Backend:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.latency_ewma = None
+        self.models = set()
+        self.loaded = {}
+
+    def ejected(self, now=None):
+        return (now or time.monotonic()) < self.ejected_until
+
+    def has_loaded(self, model, affinity_ttl, now=None):
+        used = self.loaded.get(model)
+        return used is not None and (now or time.monotonic()) - used < affinity_ttl
+
+    def stats(self, affinity_ttl):
+        now = time.monotonic()
+        return {
+            "url": self.url,
+            "healthy": not self.ejected(now),
+            "ejected_for": max(self.ejected_until - now, 0.0),
+            "ejections": self.ejections,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.consecutive_failures,
+            "latency_ewma": self.latency_ewma,
+            "models": sorted(self.models),
+            "loaded": sorted(model for model in self.loaded if self.has_loaded(model, affinity_ttl, now)),
+        }
+
+
+class BackendPool:
+    """Set of Ollama hosts with least-outstanding-requests routing.
+
+    Hosts come from OLLAMA_BASE_URLS (comma separated), falling back to the
+    single OLLAMA_BASE_URL. A request for a model prefers hosts that have
+    served that model within BACKEND_AFFINITY_TTL seconds (default 300, the
+    Ollama keep_alive default) to avoid swapping models, then hosts that have
+    it installed, then the fewest requests in flight.
+
+    A caller can name a preferred backend (e.g. the one holding a prompt
+    prefix in its KV cache); it goes first unless it has more than
+    PREFIX_AFFINITY_MAX_SKEW requests in flight (default 2) beyond the least
+    busy backend.
+
+    With MAX_CONCURRENCY_PER_BACKEND set, model requests skip hosts that
+    already have that many requests in flight, whatever their affinity; if
+    every host is at the limit (e.g. while one is ejected) the least busy
+    one is used.
+
+    Health is checked passively: BACKEND_MAX_FAILURES consecutive connection
+    errors or 502/503/504 responses (default 3) eject a host for
+    BACKEND_EJECT_SECONDS (default 30). A read timeout only means the
+    request was slow (a long generation or a cold model load), so it is
+    neither held against the host nor retried elsewhere.
+    """
+
+    def __init__(self, urls):
+        self.backends = [Backend(url) for url in urls]
+        self.affinity_ttl = float(os.getenv('BACKEND_AFFINITY_TTL', '300'))
+        self.max_failures = int(os.getenv('BACKEND_MAX_FAILURES', '3'))
+        self.eject_seconds = float(os.getenv('BACKEND_EJECT_SECONDS', '30'))
+        self.prefer_max_skew = int(os.getenv('PREFIX_AFFINITY_MAX_SKEW', '2'))
+        self.max_in_flight = int(os.getenv('MAX_CONCURRENCY_PER_BACKEND', '0'))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_url):
+        urls = [url.strip() for url in os.getenv('OLLAMA_BASE_URLS', '').split(',') if url.strip()]
+        return cls(urls or [default_url])
+
+    def candidates(self, model=None, exclude=(), prefer=None):
+        """Backends in the order they should be tried for ``model``."""
+        now = time.monotonic()
+        with self._lock:
+            pool = [b for b in self.backends if b not in exclude]
+            healthy = [b for b in pool if not b.ejected(now)]
+            # Fail open: a fully ejected pool still gets traffic
+            pool = healthy or pool
+            if model and self.max_in_flight > 0:
+                # Affinity must not push a host past its concurrency limit
+                pool = [b for b in pool if b.in_flight < self.max_in_flight] or sorted(pool, key=lambda b: b.in_flight)[:1]
+            least_busy = min((b.in_flight for b in pool), default=0)
+
+            def rank(backend):
+                return (
+                    0 if prefer and backend.url == prefer and backend.in_flight <= least_busy + self.prefer_max_skew else 1,
+                    0 if model and backend.has_loaded(model, self.affinity_ttl, now) else 1,
+                    0 if not model or not backend.models or model in backend.models else 1,
+                    backend.in_flight,
+                    backend.latency_ewma or 0.0,
+                )
+
+            return sorted(pool, key=rank)
+
+    def choose(self, model=None, exclude=(), prefer=None):
+        ordered = self.candidates(model, exclude, prefer)
+        return ordered[0] if ordered else None
+
+    def start(self, backend):
+        with self._lock:
+            backend.in_flight += 1
+            backend.requests += 1
+
+    def finish(self, backend, ok, latency=None, model=None):
+        with self._lock:
+            backend.in_flight -= 1
+            if ok:
+                backend.consecutive_failures = 0
+                if latency is not None:
+                    backend.latency_ewma = latency if backend.latency_ewma is None else 0.8 * backend.latency_ewma + 0.2 * latency
+                if model:
+                    backend.loaded[model] = time.monotonic()
+            else:
+                backend.errors += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.max_failures and not backend.ejected():
+                    backend.ejected_until = time.monotonic() + self.eject_seconds
+                    backend.ejections += 1
+
+    def set_models(self, backend, models):
+        with self._lock:
+            backend.models = set(models)
+
+    def set_loaded(self, backend, models):
+        """Replace the resident model set, e.g. from ``/api/ps``."""
+        now = time.monotonic()
+        with self._lock:
+            backend.loaded = {model: now for model in models}
+
+    def backends_with(self, model):
+        with self._lock:
+            return [b for b in self.backends if model in b.models]
+
+    def request(self, upstream, method, path, json=None, stream=False, timeout=None, model=None, prefer=None):
+        """Send a request to the best backend for ``model``.
+
+        Connection errors and 502/503/504 responses fail over to the next
+        candidate. A read timeout is raised as is: Ollama may still be
+        working on the request, and a POST must not run twice. Streaming responses are wrapped so the backend stays
+        counted as busy until the stream is consumed or closed.
+        """
+        tried = []
+        last_error = None
+        while True:
+            backend = self.choose(model, exclude=tried, prefer=prefer)
+            if backend is None:
+                break
+            tried.append(backend)
+            self.start(backend)
+            try:
+                response = upstream.request(method, path, json=json, stream=stream, timeout=timeout, base_url=backend.url)
+            except requests.exceptions.RequestException as e:
+                self.finish(backend, not is_unhealthy(e))
+                if not is_unhealthy(e):
+                    raise
+                last_error = e
+                continue
+
+            # Time to response headers; a non-streaming call has also read the whole body by now
+            latency = response.elapsed.total_seconds()
+            UPSTREAM_CONNECT.observe(latency, backend=backend.url)
+            response.backend_url = backend.url
+            if is_unhealthy(response) and len(tried) < len(self.backends):
+                response.close()
+                self.finish(backend, False)
+                continue
+
+            ok = not is_unhealthy(response)
+            if stream:
+                return TrackedResponse(self, backend, response, model if response.ok else None, latency, ok)
+            self.finish(backend, ok, latency, model if response.ok else None)
+            return response
+
+        raise last_error or requests.exceptions.ConnectionError("No Ollama backends available")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "affinity_ttl": self.affinity_ttl,
+                "max_failures": self.max_failures,
+                "eject_seconds": self.eject_seconds,
+                "prefer_max_skew": self.prefer_max_skew,
+                "max_in_flight": self.max_in_flight,
+                "backends": [backend.stats(self.affinity_ttl) for backend in self.backends],
+            }
+
+
+def read_timed_out(error):
+    """True when the request reached Ollama but the answer was too slow."""
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return True
+    # requests reports a timeout while reading a body as a ConnectionError
+    return isinstance(error, requests.exceptions.ConnectionError) and any(
+        isinstance(arg, ReadTimeoutError) for arg in error.args)
+
+
+def is_unhealthy(error_or_response):
+    """True for errors that say something about the host rather than the request."""
+    if isinstance(error_or_response, requests.Response):
+        return error_or_response.status_code in _UNHEALTHY_STATUSES
+    if isinstance(error_or_response, requests.exceptions.HTTPError):
+        response = error_or_response.response
+        return response is not None and response.status_code in _UNHEALTHY_STATUSES
+    # ConnectTimeout is a ConnectionError; ReadTimeout is not
+    return isinstance(error_or_response, requests.exceptions.ConnectionError) and not read_timed_out(error_or_response)
+
+
+class TrackedResponse:
+    """Streaming response that reports back to the pool when it ends."""
+
+    def __init__(self, pool, backend, response, model=None, latency=None, ok=True):
+        self.pool = pool
+        self.backend = backend
+        self.response = response
+        self.model = model
+        self.latency = latency
+        self.ok = ok
+        self.status_code = response.status_code
+        self.backend_url = backend.url
+        self.closed = False
+        self._finished = False
+
+    def raise_for_status(self):
+        try:
+            self.response.raise_for_status()
+        except Exception:
+            self.close()
+            raise
+
+    def iter_lines(self):
+        ok = self.ok
+        try:
+            for line in self.response.iter_lines():
+                yield line
+        except Exception as e:
+            if self.closed:
+                # Closed on purpose (the client went away); not the backend's fault
+                return
+            ok = not is_unhealthy(e)
+            raise
+        finally:
+            self._finish(ok)
+
+    def _finish(self, ok):
+        if self._finished:
+            return
+        self._finished = True
+        self.pool.finish(self.backend, ok, self.latency, self.model)
+
+    def close(self):
+        self.closed = True
+        self.response.close()
+        self._finish(self.ok)
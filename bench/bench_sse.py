@@ -0,0 +1,91 @@
+"""Microbenchmark for the streaming chunk encoder.
+
+Compares building a dict and running json.dumps per chunk (the old
+behaviour) against ChunkEncoder, and the json.loads/json.dumps round trip
+against passing NDJSON lines through. Reports bytes/sec and CPU time per
+chunk.
+
+    python bench/bench_sse.py [--chunks 200000] [--text " token"]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sse  # noqa: E402
+
+
+def legacy_chat(chunks, text):
+    created = int(time.time())
+    data = {'model': 'llama3.1:8b'}
+    for _ in range(chunks):
+        chunk_data = {
+            'id': 'chatcmpl-0123456789ab',
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': data.get('model', 'gemma3:12b-it-qat'),
+            'choices': [{
+                'index': 0,
+                'delta': {'content': text},
+                'finish_reason': None
+            }]
+        }
+        yield f"data: {json.dumps(chunk_data)}\n\n".encode('utf-8')
+
+
+def encoder_chat(chunks, text):
+    encoder = sse.ChunkEncoder('chatcmpl-0123456789ab', int(time.time()), 'llama3.1:8b')
+    for _ in range(chunks):
+        yield encoder.content(text)
+
+
+def _ndjson_line(text):
+    return json.dumps({'model': 'llama3.1:8b', 'created_at': '2024-01-01T00:00:00.000000Z',
+                       'response': text, 'done': False}).encode('utf-8')
+
+
+def legacy_passthrough(chunks, text):
+    line = _ndjson_line(text)
+    for _ in range(chunks):
+        chunk = json.loads(line)
+        yield f"data: {json.dumps(chunk)}\n\n".encode('utf-8')
+
+
+def fast_passthrough(chunks, text):
+    line = _ndjson_line(text)
+    for _ in range(chunks):
+        yield sse.passthrough(line)
+
+
+def run(name, fn, chunks, text):
+    total = 0
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for frame in fn(chunks, text):
+        total += len(frame)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    print(f"{name:<22} {total / wall / 1e6:8.1f} MB/s {cpu / chunks * 1e6:8.2f} us/chunk CPU")
+    return cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=200000)
+    parser.add_argument('--text', default=' token')
+    args = parser.parse_args()
+
+    print(f"JSON backend: {sse.JSON_BACKEND}, {args.chunks} chunks of {args.text!r}\n")
+    legacy = run('chat: dict + dumps', legacy_chat, args.chunks, args.text)
+    fast = run('chat: ChunkEncoder', encoder_chat, args.chunks, args.text)
+    print(f"{'':<22} {legacy / fast:.1f}x less CPU\n")
+    legacy = run('ndjson: loads + dumps', legacy_passthrough, args.chunks, args.text)
+    fast = run('ndjson: passthrough', fast_passthrough, args.chunks, args.text)
+    print(f"{'':<22} {legacy / fast:.1f}x less CPU")
+
+
+if __name__ == '__main__':
+    main()
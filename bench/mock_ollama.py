@@ -0,0 +1,156 @@
+"""Mock Ollama server for benchmarks.
+
+Emulates /api/tags, /api/ps, /api/show, /api/version, /api/generate,
+/api/chat and /api/embed. Streams tokens at a fixed rate after a fixed
+prompt latency, so the proxy can be load tested without a GPU.
+
+    python bench/mock_ollama.py --port 11435 --token-rate 50 --latency 0.2
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+WORDS = ('the', 'proxy', 'streams', 'tokens', 'from', 'a', 'local', 'model', 'to', 'the', 'editor', 'quickly')
+
+
+class MockOllama(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json({"models": [
+                {"name": name, "model": name, "size": 4_000_000_000, "details": {"parameter_size": "8B", "quantization_level": "Q4_K_M"}}
+                for name in self.config.models
+            ]})
+        elif self.path == '/api/ps':
+            self._send_json({"models": [{"name": name, "model": name, "size_vram": 4_000_000_000} for name in self.config.models[:1]]})
+        elif self.path == '/api/version':
+            self._send_json({"version": "0.0.0-mock"})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path in ('/api/chat', '/api/generate'):
+            self._generate(body, chat=self.path == '/api/chat')
+        elif self.path == '/api/show':
+            self._send_json({"details": {"parameter_size": "8B"}, "model_info": {}})
+        elif self.path == '/api/embed':
+            inputs = body.get('input', '')
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            time.sleep(self.config.latency)
+            self._send_json({
+                "model": body.get('model'),
+                "embeddings": [[(hash(text) % 1000) / 1000.0] * self.config.dimensions for text in inputs],
+                "prompt_eval_count": sum(len(text) // 4 + 1 for text in inputs),
+            })
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _generate(self, body, chat):
+        config = self.config
+        model = body.get('model', '')
+        if model not in config.models:
+            self._send_json({"error": f"model '{model}' not found"}, 404)
+            return
+
+        options = body.get('options') or {}
+        count = options.get('num_predict') or config.tokens
+        if count < 0:
+            count = config.tokens
+        tokens = [' ' + random.choice(WORDS) for _ in range(count)]
+        prompt = json.dumps(body.get('messages') or body.get('prompt', ''))
+        prompt_tokens = len(prompt) // 4 + 1
+        interval = 1.0 / config.token_rate if config.token_rate > 0 else 0.0
+
+        def frame(text, done):
+            chunk = {"model": model, "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ'), "done": done}
+            if chat:
+                chunk["message"] = {"role": "assistant", "content": text}
+            else:
+                chunk["response"] = text
+            if done:
+                chunk.update({
+                    "done_reason": "length" if count == options.get('num_predict') else "stop",
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(config.latency * 1e9),
+                    "eval_count": count,
+                    "eval_duration": int(count * interval * 1e9),
+                    "total_duration": int((config.latency + count * interval) * 1e9),
+                })
+            return chunk
+
+        time.sleep(config.latency)
+        if not body.get('stream', True):
+            time.sleep(count * interval)
+            self._send_json(frame(''.join(tokens), True))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for token in tokens:
+                self._send_chunk(json.dumps(frame(token, False)).encode('utf-8') + b"\n")
+                if interval:
+                    time.sleep(interval)
+            self._send_chunk(json.dumps(frame('', True)).encode('utf-8') + b"\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(port, models, token_rate, latency, tokens, dimensions=8):
+    config = argparse.Namespace(models=models, token_rate=token_rate, latency=latency, tokens=tokens, dimensions=dimensions)
+    handler = type('Handler', (MockOllama,), {'config': config})
+    # A load test opens many connections at once; the default backlog of 5
+    # would drop SYNs and add one-second retransmits to the measurements
+    server_class = type('Server', (ThreadingHTTPServer,), {'request_queue_size': 1024, 'daemon_threads': True})
+    return server_class(('127.0.0.1', port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama server for benchmarks")
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--models', default='llama3.1:8b,qwen2.5-coder:7b', help="comma separated model names")
+    parser.add_argument('--token-rate', type=float, default=50.0, help="tokens per second per stream, 0 for as fast as possible")
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds before the first token (prompt evaluation)")
+    parser.add_argument('--tokens', type=int, default=64, help="tokens per completion unless the request sets max_tokens")
+    parser.add_argument('--dimensions', type=int, default=8, help="embedding size")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.models.split(','), args.token_rate, args.latency, args.tokens, args.dimensions)
+    print(f"Mock Ollama on http://127.0.0.1:{args.port} ({args.token_rate:g} tok/s, {args.latency:g}s latency)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""Replay captured OpenAI requests against the proxy and report latency.
+
+Each line of the capture is a JSON chat completion body (anything with
+``messages``), or a record with the body under ``body`` and an optional
+``path``. Lines without messages are skipped.
+
+By default the harness starts a mock Ollama (bench/mock_ollama.py) and the
+proxy under gunicorn, replays the capture, and reports TTFT, latency,
+throughput and the proxy's CPU time and memory:
+
+    python bench/replay.py bench/requests.sample.jsonl --concurrency 32 --requests 500
+    python bench/replay.py capture.jsonl --rate 20 --duration 60
+    python bench/replay.py capture.jsonl --url http://localhost:7005 --pid 1234
+
+With ``--rate`` requests arrive as a Poisson process at that many per
+second (open loop); otherwise ``--concurrency`` clients send back to back.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_SAMPLE_ERRORS = (OSError, IndexError, ValueError) + ((psutil.Error,) if psutil else ())
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+
+def load_capture(paths):
+    entries = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                body = record.get('body', record)
+                if isinstance(body, dict) and body.get('messages'):
+                    entries.append((record.get('path', '/v1/chat/completions'), body))
+    return entries
+
+
+class ProcessSampler:
+    """CPU seconds and resident memory of a process and its children."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _pids(self):
+        if psutil is not None:
+            try:
+                process = psutil.Process(self.pid)
+                return [self.pid] + [child.pid for child in process.children(recursive=True)]
+            except psutil.Error:
+                return []
+        pids = [self.pid]
+        try:
+            for entry in os.listdir('/proc'):
+                if entry.isdigit():
+                    with open(f'/proc/{entry}/stat') as f:
+                        fields = f.read().rsplit(')', 1)[1].split()
+                    if int(fields[1]) in pids:
+                        pids.append(int(entry))
+        except OSError:
+            pass
+        return pids
+
+    def sample(self):
+        """Return (cpu_seconds, rss_bytes) summed over the process tree."""
+        cpu = 0.0
+        rss = 0
+        for pid in self._pids():
+            try:
+                if psutil is not None:
+                    process = psutil.Process(pid)
+                    times = process.cpu_times()
+                    cpu += times.user + times.system
+                    rss += process.memory_info().rss
+                else:
+                    with open(f'/proc/{pid}/stat') as f:
+                        fields = f.read().rsplit(')', 1)[1].split()
+                    ticks = os.sysconf('SC_CLK_TCK')
+                    cpu += (int(fields[11]) + int(fields[12])) / ticks
+                    rss += int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+            except _SAMPLE_ERRORS:
+                continue
+        self.peak_rss = max(self.peak_rss, rss)
+        return cpu, rss
+
+    def _run(self):
+        while not self._stop.wait(0.2):
+            self.sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self.sample()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self.sample()
+
+
+class Result:
+    def __init__(self):
+        self.ttft = None
+        self.latency = None
+        self.chunks = 0
+        self.bytes = 0
+        self.error = None
+
+
+def send(session, url, path, body, timeout):
+    result = Result()
+    started = time.perf_counter()
+    try:
+        with session.post(url + path, json=body, stream=bool(body.get('stream')), timeout=timeout) as response:
+            if response.status_code != 200:
+                result.error = f"HTTP {response.status_code}"
+                return result
+            if body.get('stream'):
+                for line in response.iter_lines():
+                    if not line.startswith(b'data: ') or line == b'data: [DONE]':
+                        continue
+                    result.bytes += len(line)
+                    if b'"content"' in line:
+                        if result.ttft is None:
+                            result.ttft = time.perf_counter() - started
+                        result.chunks += 1
+            else:
+                result.bytes = len(response.content)
+                result.ttft = time.perf_counter() - started
+                usage = response.json().get('usage') or {}
+                result.chunks = usage.get('completion_tokens', 0)
+    except requests.RequestException as e:
+        result.error = type(e).__name__
+    result.latency = time.perf_counter() - started
+    return result
+
+
+def percentile(values, share):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def replay(args, entries, url, count=None, duration=None):
+    results = []
+    lock = threading.Lock()
+    source = itertools.cycle(entries)
+    deadline = time.monotonic() + duration if duration else None
+    remaining = [count]
+
+    def next_entry():
+        with lock:
+            if deadline and time.monotonic() >= deadline:
+                return None
+            if not deadline and remaining[0] <= 0:
+                return None
+            remaining[0] -= 1
+            path, body = next(source)
+        body = dict(body)
+        if args.model:
+            body['model'] = args.model
+        if args.stream is not None:
+            body['stream'] = args.stream
+        return path, body
+
+    def record(result):
+        with lock:
+            results.append(result)
+
+    def worker():
+        session = requests.Session()
+        while True:
+            entry = next_entry()
+            if entry is None:
+                return
+            record(send(session, url, entry[0], entry[1], args.timeout))
+
+    threads = []
+    if args.rate:
+        # Open loop: arrivals do not wait for earlier requests to finish
+        while True:
+            entry = next_entry()
+            if entry is None:
+                break
+            thread = threading.Thread(target=lambda e=entry: record(send(requests, url, e[0], e[1], args.timeout)), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(random.expovariate(args.rate))
+    else:
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def spawn(args):
+    """Start the mock Ollama and the proxy; returns (processes, proxy_url, proxy_pid)."""
+    mock_port = free_port()
+    proxy_port = free_port()
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, 'mock_ollama.py'), '--port', str(mock_port),
+        '--token-rate', str(args.token_rate), '--latency', str(args.latency), '--tokens', str(args.tokens),
+        '--models', args.model or 'llama3.1:8b',
+    ], stdout=subprocess.DEVNULL)
+    wait_for(f'http://127.0.0.1:{mock_port}/api/tags')
+
+    env = dict(os.environ, OLLAMA_BASE_URL=f'http://127.0.0.1:{mock_port}', PORT=str(proxy_port), LOG_LEVEL=args.log_level)
+    env.pop('OLLAMA_BASE_URLS', None)
+    proxy = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    proxy_url = f'http://127.0.0.1:{proxy_port}'
+    # Ready once its upstream connections and model catalog are warm
+    wait_for(proxy_url + '/ready')
+    return [proxy, mock], proxy_url, proxy.pid
+
+
+def report(results, elapsed, cpu, rss_start, rss_end, peak_rss):
+    ok = [r for r in results if r.error is None]
+    errors = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    ttft = [r.ttft for r in ok if r.ttft is not None]
+    latency = [r.latency for r in ok]
+    chunks = sum(r.chunks for r in ok)
+
+    print(f"requests      {len(results)} ({len(ok)} ok, {len(results) - len(ok)} failed) in {elapsed:.1f}s")
+    for error, count in sorted(errors.items()):
+        print(f"  {error}: {count}")
+    print(f"throughput    {len(ok) / elapsed:.1f} req/s, {chunks / elapsed:.0f} tokens/s, "
+          f"{sum(r.bytes for r in ok) / elapsed / 1024:.0f} KiB/s")
+    print(f"TTFT          p50 {percentile(ttft, 0.5) * 1000:.1f} ms  p99 {percentile(ttft, 0.99) * 1000:.1f} ms")
+    print(f"latency       p50 {percentile(latency, 0.5) * 1000:.1f} ms  p99 {percentile(latency, 0.99) * 1000:.1f} ms")
+    if cpu is not None:
+        print(f"proxy CPU     {cpu:.2f}s total, {cpu / max(len(ok), 1) * 1000:.2f} ms per stream, "
+              f"{cpu / max(chunks, 1) * 1e6:.1f} us per token")
+        print(f"proxy memory  {rss_start / 2**20:.1f} MiB -> {rss_end / 2**20:.1f} MiB (peak {peak_rss / 2**20:.1f} MiB), "
+              f"{max(peak_rss - rss_start, 0) / max(len(ok), 1) / 1024:.1f} KiB per stream at peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured OpenAI requests against the proxy")
+    parser.add_argument('capture', nargs='*', default=[os.path.join(BENCH_DIR, 'requests.sample.jsonl')])
+    parser.add_argument('--url', help="proxy to test; by default a mock Ollama and the proxy are started")
+    parser.add_argument('--pid', type=int, help="proxy process id for CPU/memory figures when --url is given")
+    parser.add_argument('--concurrency', type=int, default=16, help="closed-loop clients")
+    parser.add_argument('--rate', type=float, default=0.0, help="open-loop arrivals per second instead of --concurrency")
+    parser.add_argument('--requests', type=int, default=200, help="requests to send (cycles through the capture)")
+    parser.add_argument('--duration', type=float, default=0.0, help="send for this many seconds instead of --requests")
+    parser.add_argument('--warmup', type=int, default=None, help="unmeasured requests sent first (default: --concurrency)")
+    parser.add_argument('--model', help="override the model of every request")
+    parser.add_argument('--stream', dest='stream', action='store_true', default=None, help="force streaming")
+    parser.add_argument('--no-stream', dest='stream', action='store_false', help="force non-streaming")
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--token-rate', type=float, default=50.0, help="mock tokens per second per stream")
+    parser.add_argument('--latency', type=float, default=0.2, help="mock seconds before the first token")
+    parser.add_argument('--tokens', type=int, default=64, help="mock tokens per completion")
+    parser.add_argument('--log-level', default='info', help="LOG_LEVEL of the spawned proxy")
+    args = parser.parse_args()
+
+    if args.warmup is None:
+        args.warmup = args.concurrency
+    entries = load_capture(args.capture)
+    if not entries:
+        parser.error("no replayable requests (JSON lines with 'messages') in " + ", ".join(args.capture))
+
+    processes = []
+    try:
+        if args.url:
+            url, pid = args.url.rstrip('/'), args.pid
+        else:
+            # The mock only knows the one model, so route every request to it
+            args.model = args.model or 'llama3.1:8b'
+            processes, url, pid = spawn(args)
+
+        if args.warmup:
+            # Open the proxy's upstream connections before anything is measured
+            replay(args, entries, url, count=args.warmup)
+
+        sampler = ProcessSampler(pid) if pid else None
+        cpu_start, rss_start = sampler.start() if sampler else (None, 0)
+        started = time.perf_counter()
+        results = replay(args, entries, url, args.requests, args.duration)
+        elapsed = time.perf_counter() - started
+        cpu_end, rss_end = sampler.stop() if sampler else (None, 0)
+
+        report(results, elapsed, None if sampler is None else cpu_end - cpu_start, rss_start, rss_end,
+               sampler.peak_rss if sampler else 0)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import collections
+import hashlib
+import os
+import threading
+import time
+
+from metrics import registry, Counter
+from scheduler import QueueFull
+
+
+CLIENT_REQUESTS = registry.register(Counter(
+    'ollama_proxy_client_requests_total', 'Requests per client, by result (admitted, limited_requests, limited_tokens).', ('client', 'result')))
+CLIENT_TOKENS = registry.register(Counter(
+    'ollama_proxy_client_tokens_total', 'Tokens Ollama processed per client, by kind (prompt, completion).', ('client', 'kind')))
+
+ANONYMOUS = 'anonymous'
+# Metrics label shared by every client without its own quota or weight
+OTHER = 'other'
+# Seconds of history behind the per-client throughput figures
+USAGE_WINDOW = 60.0
+
+
+class RateLimited(QueueFull):
+    """Raised when a client is over its request or token rate."""
+
+
+def client_id(authorization):
+    """Stable, non-reversible client name for an ``Authorization`` header value."""
+    if authorization and authorization[:7].lower() == 'bearer ':
+        key = authorization[7:].strip()
+        if key:
+            return 'key-' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]
+    return ANONYMOUS
+
+
+def _parse_overrides(value):
+    """``"client=value,client=value"`` as a dict of strings."""
+    overrides = {}
+    for item in value.split(','):
+        client, _, setting = item.partition('=')
+        if client.strip() and setting.strip():
+            overrides[client.strip()] = setting.strip()
+    return overrides
+
+
+class TokenBucket:
+    """Refills at ``rate`` per second up to ``burst``; may go into debt.
+
+    Generated tokens are only known once a completion is done, so they are
+    charged afterwards and can take the bucket below zero. Nothing is
+    admitted until the debt is paid off.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.level = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.burst, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount, now):
+        """Seconds until ``amount`` is available (0 if it is now)."""
+        self._refill(now)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def available(self, now):
+        self._refill(now)
+        return self.level
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+
+class _Client:
+    def __init__(self, name, weight, requests, tokens):
+        self.name = name
+        self.weight = weight
+        self.requests = requests
+        self.tokens = tokens
+        self.admitted = 0
+        self.limited = {"requests": 0, "tokens": 0}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.first_seen = time.time()
+        self.last_seen = None
+        self.recent = collections.deque()
+
+    def prune(self, now):
+        while self.recent and now - self.recent[0][0] > USAGE_WINDOW:
+            self.recent.popleft()
+
+
+class ClientLimits:
+    """Per-client rate limits, fair-share weights and usage.
+
+    Clients are told apart by a hash of their ``Authorization`` bearer key;
+    requests without one share the ``anonymous`` client. Each client has a
+    bucket of requests and a bucket of generated tokens. A request is
+    admitted when a request is left and the token bucket is not in debt,
+    and its completion tokens are charged when it finishes. Over-limit
+    requests get a 429 with the time until the bucket refills. Weights set
+    each client's share of queued capacity in the scheduler.
+
+    At most MAX_TRACKED_CLIENTS clients (default 1000) are remembered, least
+    recently seen forgotten first, so random keys cannot grow memory without
+    bound. Metrics are labelled by client only for ``anonymous`` and clients
+    named in CLIENT_QUOTAS or CLIENT_WEIGHTS; all others count as ``other``.
+
+    Configured through environment variables:
+
+    - CLIENT_REQUESTS_PER_MINUTE: requests per client per minute, 0 for no limit (default 0)
+    - CLIENT_REQUEST_BURST: requests a client can make at once (default: one minute's worth)
+    - CLIENT_TOKENS_PER_MINUTE: generated tokens per client per minute, 0 for no limit (default 0)
+    - CLIENT_TOKEN_BURST: tokens a client can use at once (default: one minute's worth)
+    - CLIENT_QUOTAS: per-client overrides as ``client=requests:tokens`` per minute, comma separated
+    - CLIENT_WEIGHTS: fair-share weights as ``client=weight``, comma separated (default 1 each)
+    """
+
+    def __init__(self):
+        self.requests_per_minute = float(os.getenv('CLIENT_REQUESTS_PER_MINUTE', '0'))
+        self.request_burst = float(os.getenv('CLIENT_REQUEST_BURST', '0')) or None
+        self.tokens_per_minute = float(os.getenv('CLIENT_TOKENS_PER_MINUTE', '0'))
+        self.token_burst = float(os.getenv('CLIENT_TOKEN_BURST', '0')) or None
+        self.quotas = {}
+        for client, quota in _parse_overrides(os.getenv('CLIENT_QUOTAS', '')).items():
+            requests, _, tokens = quota.partition(':')
+            self.quotas[client] = (float(requests or 0), float(tokens or 0))
+        self.weights = {client: float(weight) for client, weight in _parse_overrides(os.getenv('CLIENT_WEIGHTS', '')).items()}
+
+        self.max_tracked = max(1, int(os.getenv('MAX_TRACKED_CLIENTS', '1000')))
+
+        self._lock = threading.Lock()
+        self._clients = collections.OrderedDict()
+
+    def weight(self, client):
+        return self.weights.get(client, 1.0)
+
+    def label(self, client):
+        """Metrics label for ``client``; unconfigured clients share one."""
+        if client == ANONYMOUS or client in self.quotas or client in self.weights:
+            return client
+        return OTHER
+
+    def _bucket(self, per_minute, burst):
+        if per_minute <= 0:
+            return None
+        return TokenBucket(per_minute / 60, burst or per_minute)
+
+    def _client(self, name):
+        client = self._clients.get(name)
+        if client is not None:
+            self._clients.move_to_end(name)
+            return client
+        requests, tokens = self.quotas.get(name, (self.requests_per_minute, self.tokens_per_minute))
+        client = self._clients[name] = _Client(
+            name,
+            self.weight(name),
+            self._bucket(requests, self.request_burst),
+            self._bucket(tokens, self.token_burst),
+        )
+        while len(self._clients) > self.max_tracked:
+            self._clients.popitem(last=False)
+        return client
+
+    def admit(self, name):
+        """Take one request from ``name``'s bucket; raises RateLimited when over a limit."""
+        now = time.monotonic()
+        with self._lock:
+            client = self._client(name)
+            client.last_seen = time.time()
+            token_wait = client.tokens.wait(0, now) if client.tokens else 0.0
+            request_wait = client.requests.wait(1, now) if client.requests else 0.0
+            if token_wait or request_wait:
+                reason = "tokens" if token_wait >= request_wait else "requests"
+                client.limited[reason] += 1
+                retry_after = max(1, int(max(token_wait, request_wait) + 0.999))
+            else:
+                reason = None
+                if client.requests:
+                    client.requests.take(1, now)
+                client.admitted += 1
+        if reason:
+            CLIENT_REQUESTS.inc(client=self.label(name), result=f"limited_{reason}")
+            raise RateLimited(f"Rate limit exceeded: too many {reason} for this API key", retry_after)
+        CLIENT_REQUESTS.inc(client=self.label(name), result="admitted")
+
+    def record(self, name, prompt_tokens=0, completion_tokens=0):
+        """Charge a finished request's tokens to ``name``."""
+        now = time.monotonic()
+        with self._lock:
+            client = self._client(name)
+            client.prompt_tokens += prompt_tokens
+            client.completion_tokens += completion_tokens
+            if client.tokens and completion_tokens:
+                client.tokens.take(completion_tokens, now)
+            client.recent.append((now, prompt_tokens, completion_tokens))
+            client.prune(now)
+        if prompt_tokens:
+            CLIENT_TOKENS.inc(prompt_tokens, client=self.label(name), kind='prompt')
+        if completion_tokens:
+            CLIENT_TOKENS.inc(completion_tokens, client=self.label(name), kind='completion')
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            clients = {}
+            for name, client in self._clients.items():
+                client.prune(now)
+                clients[name] = {
+                    "weight": client.weight,
+                    "requests_per_minute_limit": client.requests.rate * 60 if client.requests else None,
+                    "tokens_per_minute_limit": client.tokens.rate * 60 if client.tokens else None,
+                    "requests_available": client.requests.available(now) if client.requests else None,
+                    "tokens_available": client.tokens.available(now) if client.tokens else None,
+                    "admitted": client.admitted,
+                    "rate_limited": dict(client.limited),
+                    "prompt_tokens": client.prompt_tokens,
+                    "completion_tokens": client.completion_tokens,
+                    "completed_last_minute": len(client.recent),
+                    "completion_tokens_last_minute": sum(completion for _, _, completion in client.recent),
+                    "prompt_tokens_last_minute": sum(prompt for _, prompt, _ in client.recent),
+                    "first_seen": client.first_seen,
+                    "last_seen": client.last_seen,
+                }
+            return {
+                "requests_per_minute": self.requests_per_minute or None,
+                "tokens_per_minute": self.tokens_per_minute or None,
+                "max_tracked": self.max_tracked,
+                "clients": clients,
+            }
@@ -0,0 +1,35 @@
+import os
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_float(name, default):
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    if value.strip().lower() == 'none':
+        return None
+    return float(value)
+
+
+def load_env_file(start_dir):
+    """Load the nearest .env at or above ``start_dir``, as python-dotenv's load_dotenv() finds it.
+
+    python-dotenv is only imported when there is a file to load.
+    """
+    directory = os.path.abspath(start_dir)
+    while True:
+        path = os.path.join(directory, '.env')
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return path
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
@@ -0,0 +1,27 @@
+"""Colors for the proxy's console output.
+
+ANSI codes are used only when stdout is a terminal, which is what colorama's
+``init()`` used to achieve by wrapping stdout and stripping them from every
+write otherwise. colorama is only imported on Windows, where the console
+needs it to understand ANSI codes at all.
+"""
+import sys
+
+
+def _colors_enabled():
+    try:
+        tty = sys.stdout.isatty()
+    except (AttributeError, ValueError):
+        return False
+    if tty and sys.platform == 'win32':
+        import colorama
+        colorama.just_fix_windows_console()
+    return tty
+
+
+COLORS = _colors_enabled()
+
+REQUEST_COLOR = '\033[36m' if COLORS else ''
+RESPONSE_COLOR = '\033[32m' if COLORS else ''
+ERROR_COLOR = '\033[31m' if COLORS else ''
+RESET_COLOR = '\033[0m' if COLORS else ''
@@ -0,0 +1,218 @@
+import os
+import select
+import socket
+import threading
+import time
+
+from metrics import registry, Counter
+
+
+CLIENT_DISCONNECTS = registry.register(Counter(
+    'ollama_proxy_client_disconnects_total', 'Requests whose client went away before the response was complete, by phase (queued, prompt, generating).', ('route', 'model', 'phase')))
+WASTED_TOKENS = registry.register(Counter(
+    'ollama_proxy_wasted_tokens_total', 'Tokens Ollama generated for clients that disconnected.', ('model',)))
+RECLAIMED_TOKENS = registry.register(Counter(
+    'ollama_proxy_reclaimed_tokens_total', 'Estimated tokens Ollama did not have to generate because a stream was cancelled.', ('model',)))
+
+
+def client_socket(environ):
+    """The client connection of a WSGI request, when the server exposes it."""
+    return environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+
+
+def _readable(sock):
+    # poll has no FD_SETSIZE limit; select() fails on descriptors above 1023
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        return bool(poller.poll(0))
+    readable, _, _ = select.select([sock], [], [], 0)
+    return bool(readable)
+
+
+def client_gone(sock):
+    """True when the client has closed its end of the connection.
+
+    False when it cannot be told, so an unknown state never cancels a stream.
+    """
+    if sock is None:
+        return False
+    try:
+        # Readable with nothing to read is EOF; a pipelined request is left in place
+        return _readable(sock) and sock.recv(1, socket.MSG_PEEK) == b''
+    except ValueError:
+        return False
+    except OSError:
+        return True
+
+
+class StreamGuard:
+    """Ties one upstream stream to the client connection.
+
+    ``upstream`` counts the chunks read from Ollama and ``track`` wraps the
+    outgoing generator. When the client goes away, whether noticed by the
+    watcher or by a failed write closing the generator, the upstream response
+    is closed so Ollama stops generating.
+    """
+
+    def __init__(self, watcher, sock, route, model, response):
+        self.watcher = watcher
+        self.sock = sock
+        self.route = route
+        self.model = model
+        self.response = response
+        self.tokens = 0
+        self.first_token_at = None
+        self.started = time.monotonic()
+        self.cancelled = False
+        self.finished = False
+
+    def upstream(self, iterable):
+        for item in iterable:
+            self.tokens += 1
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+            yield item
+
+    def track(self, generator):
+        completed = False
+        try:
+            for frame in generator:
+                yield frame
+            completed = True
+        except Exception:
+            # Reading a response we closed ourselves fails; the client is gone anyway
+            if not self.cancelled:
+                raise
+        finally:
+            self.close(completed)
+            generator.close()
+
+    def cancel(self):
+        """Close the upstream response because the client went away."""
+        if not self.watcher._cancel(self):
+            return
+        try:
+            self.response.close()
+        except Exception:
+            pass
+
+    def close(self, completed):
+        if not completed and not self.cancelled:
+            self.cancel()
+        self.watcher._finish(self)
+
+
+class DisconnectWatcher:
+    """Detects clients that disconnect from streams and cancels upstream work.
+
+    A failed write already closes the response generator, but nothing is
+    written while Ollama evaluates a long prompt. A background thread
+    therefore checks the client sockets of active streams every
+    DISCONNECT_POLL_INTERVAL seconds (default 0.5, 0 to rely on failed
+    writes alone).
+
+    Tokens generated for streams that were cancelled are counted as wasted.
+    The tokens a cancellation saved are estimated from the average length of
+    completed streams of the same model, and turned into GPU seconds with
+    their observed token rate.
+    """
+
+    def __init__(self, poll_interval=None):
+        self.poll_interval = float(os.getenv('DISCONNECT_POLL_INTERVAL', '0.5')) if poll_interval is None else poll_interval
+        self._lock = threading.Lock()
+        self._active = set()
+        self._thread = None
+        self._disconnects = {"queued": 0, "prompt": 0, "generating": 0}
+        self._wasted_tokens = 0
+        self._reclaimed_tokens = 0.0
+        self._reclaimed_seconds = 0.0
+        # model -> [completed streams, EWMA of tokens per stream, EWMA of tokens/sec]
+        self._models = {}
+
+    def guard(self, environ, route, model, response):
+        guard = StreamGuard(self, client_socket(environ), route, model, response)
+        with self._lock:
+            self._active.add(guard)
+            if self.poll_interval > 0 and guard.sock is not None and self._thread is None:
+                self._thread = threading.Thread(target=self._watch, daemon=True)
+                self._thread.start()
+        # The client may have left while the request waited for response headers
+        if client_gone(guard.sock):
+            guard.cancel()
+        return guard
+
+    def gone_while_queued(self, environ, route, model):
+        """Check after a queue wait; True (and counted) if the client left meanwhile."""
+        if not client_gone(client_socket(environ)):
+            return False
+        with self._lock:
+            self._disconnects["queued"] += 1
+        CLIENT_DISCONNECTS.inc(route=route, model=model, phase="queued")
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                active = [guard for guard in self._active if guard.sock is not None]
+            for guard in active:
+                if client_gone(guard.sock):
+                    guard.cancel()
+
+    def _cancel(self, guard):
+        with self._lock:
+            if guard.cancelled or guard.finished:
+                return False
+            guard.cancelled = True
+            phase = "generating" if guard.tokens else "prompt"
+            self._disconnects[phase] += 1
+            if not guard.model:
+                # Not a generation (e.g. a pull); nothing to count as tokens
+                guard.tokens = 0
+            self._wasted_tokens += guard.tokens
+            history = self._models.get(guard.model)
+            reclaimed = max(history[1] - guard.tokens, 0.0) if history else 0.0
+            self._reclaimed_tokens += reclaimed
+            if history and history[2]:
+                self._reclaimed_seconds += reclaimed / history[2]
+        CLIENT_DISCONNECTS.inc(route=guard.route, model=guard.model, phase=phase)
+        if guard.tokens:
+            WASTED_TOKENS.inc(guard.tokens, model=guard.model)
+        if reclaimed:
+            RECLAIMED_TOKENS.inc(reclaimed, model=guard.model)
+        return True
+
+    def _finish(self, guard):
+        with self._lock:
+            if guard.finished:
+                return
+            guard.finished = True
+            self._active.discard(guard)
+            if guard.cancelled or not guard.tokens or not guard.model:
+                return
+            elapsed = time.monotonic() - guard.first_token_at
+            rate = guard.tokens / elapsed if elapsed > 0 else None
+            history = self._models.get(guard.model)
+            if history is None:
+                self._models[guard.model] = [1, float(guard.tokens), rate]
+            else:
+                history[0] += 1
+                history[1] = 0.8 * history[1] + 0.2 * guard.tokens
+                if rate:
+                    history[2] = rate if history[2] is None else 0.8 * history[2] + 0.2 * rate
+
+    def stats(self):
+        with self._lock:
+            return {
+                "poll_interval": self.poll_interval,
+                "active_streams": len(self._active),
+                "disconnects": dict(self._disconnects),
+                "wasted_tokens": self._wasted_tokens,
+                "reclaimed_tokens_estimate": round(self._reclaimed_tokens),
+                "reclaimed_gpu_seconds_estimate": self._reclaimed_seconds,
+                "models": {
+                    model: {"completed_streams": count, "avg_tokens": avg, "tokens_per_second": rate}
+                    for model, (count, avg, rate) in self._models.items()
+                },
+            }
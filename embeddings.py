@@ -0,0 +1,340 @@
+import hashlib
+import mmap
+import os
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from config import env_bool
+from metrics import registry, Counter, Histogram
+from offload import run_blocking
+
+
+EMBED_INPUTS = registry.register(Counter(
+    'ollama_proxy_embedding_inputs_total', 'Embedding inputs, by where the vector came from (memory, disk, ollama).', ('model', 'source')))
+EMBED_BATCH_SIZE = registry.register(Histogram(
+    'ollama_proxy_embedding_batch_size', 'Inputs per /api/embed call sent to Ollama.', ('model',),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+
+# Row key: first 16 bytes of the content hash
+_KEY_BYTES = 16
+
+
+def _safe_name(model):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', model)
+
+
+def content_key(model, text, dimensions=None):
+    """Content hash of one input; unchanged text gets the same key."""
+    digest = hashlib.sha256(f"{model}\0{dimensions or ''}\0".encode('utf-8') + text.encode('utf-8')).digest()
+    return digest[:_KEY_BYTES]
+
+
+class VectorStore:
+    """Append-only float32 vectors of one model and size, memory-mapped for reads.
+
+    ``<name>.f32`` holds the rows back to back and ``<name>.keys`` the content
+    key of each row in the same order, so the index is rebuilt at startup by
+    reading the keys alone. When the store outgrows its size limit it starts
+    over empty.
+    """
+
+    def __init__(self, directory, name, dimensions, max_bytes):
+        self.dimensions = dimensions
+        self.row_bytes = dimensions * 4
+        self.max_bytes = max_bytes
+        self.vector_path = os.path.join(directory, f"{name}.f32")
+        self.key_path = os.path.join(directory, f"{name}.keys")
+        self.resets = 0
+        self._index = {}
+        self._map = None
+        self._mapped_rows = 0
+        self._load()
+
+    def _load(self):
+        rows = os.path.getsize(self.vector_path) // self.row_bytes if os.path.exists(self.vector_path) else 0
+        try:
+            with open(self.key_path, 'rb') as f:
+                keys = f.read()
+        except FileNotFoundError:
+            keys = b''
+        # A crash can leave either file a little ahead of the other
+        rows = min(rows, len(keys) // _KEY_BYTES)
+        self._index = {keys[i * _KEY_BYTES:(i + 1) * _KEY_BYTES]: i for i in range(rows)}
+        self._vectors = open(self.vector_path, 'a+b')
+        self._vectors.truncate(rows * self.row_bytes)
+        self._keys = open(self.key_path, 'a+b')
+        self._keys.truncate(rows * _KEY_BYTES)
+        self._remap()
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        size = len(self._index) * self.row_bytes
+        if size:
+            self._map = mmap.mmap(self._vectors.fileno(), size, access=mmap.ACCESS_READ)
+        self._mapped_rows = len(self._index)
+
+    def get(self, key):
+        row = self._index.get(key)
+        if row is None:
+            return None
+        if row >= self._mapped_rows:
+            self._remap()
+        vector = array('f')
+        vector.frombytes(self._map[row * self.row_bytes:(row + 1) * self.row_bytes])
+        return vector.tolist()
+
+    def put(self, key, vector):
+        if key in self._index or len(vector) != self.dimensions:
+            return
+        if (len(self._index) + 1) * self.row_bytes > self.max_bytes:
+            self._reset()
+        self._vectors.write(array('f', vector).tobytes())
+        self._vectors.flush()
+        self._keys.write(key)
+        self._keys.flush()
+        self._index[key] = len(self._index)
+
+    def _reset(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._vectors.truncate(0)
+        self._keys.truncate(0)
+        self._index = {}
+        self._mapped_rows = 0
+        self.resets += 1
+
+    def disk_bytes(self):
+        return len(self._index) * (self.row_bytes + _KEY_BYTES)
+
+
+def _scan(directory):
+    """Vector sizes per model file name of the stores in ``directory``."""
+    dimensions = {}
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):
+        name, _, size = filename[:-4].rpartition('-')
+        if filename.endswith('.f32') and size.isdigit():
+            dimensions.setdefault(name, set()).add(int(size))
+    return dimensions
+
+
+class EmbeddingCache:
+    """Content-hash keyed embeddings: a memory LRU over optional memory-mapped stores.
+
+    Under gevent, opening a store and appending to it run on gevent's OS
+    thread pool; reads from the memory map stay on the request greenlet.
+
+    Configured through environment variables:
+
+    - EMBED_CACHE: enable the cache (default true)
+    - EMBED_CACHE_SIZE: vectors kept in memory (default 10000)
+    - EMBED_CACHE_DIR: directory for the on-disk vector stores (default: memory only)
+    - EMBED_CACHE_DISK_MAX_MB: size of one model's store before it starts over (default 1024)
+    """
+
+    def __init__(self):
+        self.enabled = env_bool('EMBED_CACHE', True)
+        self.max_entries = int(os.getenv('EMBED_CACHE_SIZE', '10000'))
+        self.disk_dir = os.getenv('EMBED_CACHE_DIR') or None
+        self.disk_max_bytes = int(float(os.getenv('EMBED_CACHE_DISK_MAX_MB', '1024')) * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stores = {}
+        # Vector sizes with a store on disk, per model file name; scanned on first use
+        self._dimensions = None
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _disk_dimensions(self):
+        """Vector sizes on disk per model file name, from a scan of the directory on first use."""
+        if self._dimensions is None:
+            self._dimensions = run_blocking(_scan, self.disk_dir)
+        return self._dimensions
+
+    def _store(self, model, dimensions):
+        """The on-disk store for a model and vector size, opened on first use."""
+        name = _safe_name(model)
+        store = self._stores.get((name, dimensions))
+        if store is None:
+            # Opening reads every key of the store
+            store = run_blocking(VectorStore, self.disk_dir, f"{name}-{dimensions}", dimensions, self.disk_max_bytes)
+            self._stores[(name, dimensions)] = store
+            self._disk_dimensions().setdefault(name, set()).add(dimensions)
+        return store
+
+    def get(self, model, key):
+        """Returns (vector, source) with source "memory" or "disk", or (None, None)."""
+        if not self.enabled:
+            return None, None
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return vector, 'memory'
+            if self.disk_dir:
+                for dimensions in list(self._disk_dimensions().get(_safe_name(model), ())):
+                    vector = self._store(model, dimensions).get(key)
+                    if vector is not None:
+                        self._disk_hits += 1
+                        self._remember(key, vector)
+                        return vector, 'disk'
+            self._misses += 1
+            return None, None
+
+    def put(self, model, key, vector):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remember(key, vector)
+            if self.disk_dir:
+                run_blocking(self._store(model, len(vector)).put, key, vector)
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_dir": self.disk_dir,
+                "disk_vectors": sum(len(store._index) for store in self._stores.values()),
+                "disk_bytes": sum(store.disk_bytes() for store in self._stores.values()),
+                "disk_resets": sum(store.resets for store in self._stores.values()),
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": ((self._hits + self._disk_hits) / lookups) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
+
+
+class _Item:
+    def __init__(self, key, text):
+        self.key = key
+        self.text = text
+        self.vector = None
+        self.tokens = 0
+        self.error = None
+        self.done = threading.Event()
+
+
+class EmbeddingBatcher:
+    """Collects concurrent embedding inputs into batched ``/api/embed`` calls.
+
+    The first input to arrive for a model opens a window of EMBED_BATCH_WINDOW_MS
+    (default 10); everything submitted for that model (and the same
+    ``dimensions``) before it closes goes out in one call. A batch that
+    reaches EMBED_MAX_BATCH inputs (default 64) is sent at once. Identical
+    inputs in a batch are embedded once.
+
+    ``send(model, texts, dimensions)`` makes the upstream call and returns
+    ``(embeddings, prompt_eval_count)``.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.window = float(os.getenv('EMBED_BATCH_WINDOW_MS', '10')) / 1000
+        self.max_batch = max(1, int(os.getenv('EMBED_MAX_BATCH', '64')))
+
+        self._lock = threading.Lock()
+        self._pending = {}
+
+        self._inputs = 0
+        self._batches = 0
+        self._deduplicated = 0
+        self._errors = 0
+
+    def embed(self, model, keys, texts, dimensions=None):
+        """Embed ``texts``; returns one ``_Item`` (vector, tokens) per text."""
+        items = [_Item(key, text) for key, text in zip(keys, texts)]
+        group = (model, dimensions)
+        batches = []
+        with self._lock:
+            self._inputs += len(items)
+            pending = self._pending.setdefault(group, [])
+            leader = not pending
+            pending.extend(items)
+            while len(pending) >= self.max_batch:
+                batches.append(pending[:self.max_batch])
+                del pending[:self.max_batch]
+            if not pending:
+                del self._pending[group]
+
+        for batch in batches:
+            self._flush(group, batch)
+        if leader and self.window > 0:
+            time.sleep(self.window)
+        if leader:
+            with self._lock:
+                batch = self._pending.pop(group, [])
+            if batch:
+                self._flush(group, batch)
+
+        for item in items:
+            item.done.wait()
+            if item.error is not None:
+                raise item.error
+        return items
+
+    def _flush(self, group, batch):
+        model, dimensions = group
+        unique = OrderedDict()
+        for item in batch:
+            unique.setdefault(item.key, []).append(item)
+        texts = [items[0].text for items in unique.values()]
+        with self._lock:
+            self._batches += 1
+            self._deduplicated += len(batch) - len(texts)
+        EMBED_BATCH_SIZE.observe(len(texts), model=model)
+
+        try:
+            vectors, prompt_tokens = self.send(model, texts, dimensions)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Ollama returned {len(vectors)} embeddings for {len(texts)} inputs")
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+            for item in batch:
+                item.error = e
+                item.done.set()
+            return
+
+        # Ollama counts the batch as a whole; share it out by length
+        total_chars = sum(len(text) for text in texts) or 1
+        for vector, (text, items) in zip(vectors, zip(texts, unique.values())):
+            tokens = round(prompt_tokens * len(text) / total_chars) if prompt_tokens else 0
+            for item in items:
+                item.vector = vector
+                item.tokens = tokens
+                item.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "inputs": self._inputs,
+                "batches": self._batches,
+                "avg_batch_size": ((self._inputs - self._deduplicated) / self._batches) if self._batches else 0.0,
+                "deduplicated": self._deduplicated,
+                "errors": self._errors,
+                "pending": sum(len(items) for items in self._pending.values()),
+            }
@@ -0,0 +1,24 @@
+# Production server settings: gunicorn with gevent workers.
+#
+# Each gevent worker serves every request in a greenlet on one event loop and
+# monkey-patches sockets, so streaming completions (requests' iter_lines) and
+# /logs/stream viewers (Queue.get) yield to the loop instead of pinning an OS
+# thread each. Run with:  gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '7005')}"
+worker_class = 'gevent'
+
+# The web log viewers and proxy stats live in process memory, so keep a single
+# worker unless you run one replica per worker behind a load balancer.
+workers = int(os.getenv('WEB_WORKERS', '1'))
+worker_connections = int(os.getenv('WEB_WORKER_CONNECTIONS', '1000'))
+
+# Streams can run for minutes; gevent workers heartbeat independently of them.
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('WEB_KEEPALIVE', '75'))
+
+accesslog = None
+errorlog = '-'
+loglevel = os.getenv('WEB_LOG_LEVEL', 'info')
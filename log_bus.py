@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+
+
+class LogBus:
+    """Bounded ring buffer that fans log messages out to web viewers.
+
+    Producers append in O(1) and never wait on a viewer: the lock only guards
+    writing one slot. Each subscriber reads from its own cursor; when it falls
+    more than ``capacity`` messages behind, the overwritten messages are counted
+    as dropped instead of holding up producers.
+
+    Message text longer than LOG_MESSAGE_MAX_CHARS (default 8192) is cut
+    short, so a few large request bodies cannot make the ring (or the
+    history kept from it) hold gigabytes.
+
+    Configured with LOG_BUFFER_SIZE (ring capacity, default 4096) and
+    LOG_BACKLOG (messages replayed to a new viewer, default 200).
+    """
+
+    def __init__(self, capacity=None, backlog=None, max_chars=None):
+        self.capacity = int(os.getenv('LOG_BUFFER_SIZE', '4096')) if capacity is None else capacity
+        self.backlog = int(os.getenv('LOG_BACKLOG', '200')) if backlog is None else backlog
+        self.max_chars = int(os.getenv('LOG_MESSAGE_MAX_CHARS', '8192')) if max_chars is None else max_chars
+        self._truncated = 0
+        self._ring = [None] * self.capacity
+        self._next = 0
+        self._base = 0
+        self._cond = threading.Condition()
+        self._subscribers = set()
+
+    def publish(self, message):
+        text = message.get('message')
+        truncated = self.max_chars > 0 and isinstance(text, str) and len(text) > self.max_chars
+        if truncated:
+            message['message'] = f"{text[:self.max_chars]}... [{len(text) - self.max_chars} more characters not logged]"
+            message['truncated'] = True
+        with self._cond:
+            self._truncated += truncated
+            message['seq'] = self._base + self._next
+            self._ring[self._next % self.capacity] = message
+            self._next += 1
+            self._cond.notify_all()
+
+    def resume(self, seq):
+        """Continue numbering at ``seq``, e.g. after history persisted by a previous run."""
+        with self._cond:
+            self._base = max(seq - self._next, self._base)
+
+    def subscribe(self, replay=None):
+        """Start reading at the live head, or ``replay`` messages before it."""
+        replay = self.backlog if replay is None else replay
+        with self._cond:
+            start = max(self._next - min(replay, self.capacity), 0)
+            subscription = Subscription(self, start)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._cond:
+            self._subscribers.discard(subscription)
+
+    def _read(self, subscription, timeout):
+        with self._cond:
+            if subscription.cursor >= self._next:
+                self._cond.wait(timeout)
+            head = self._next
+            oldest = head - self.capacity
+            if subscription.cursor < oldest:
+                subscription.dropped += oldest - subscription.cursor
+                subscription.cursor = oldest
+            messages = [self._ring[seq % self.capacity] for seq in range(subscription.cursor, head)]
+            subscription.cursor = head
+        return messages
+
+    def stats(self):
+        with self._cond:
+            head = self._next
+            return {
+                "capacity": self.capacity,
+                "backlog": self.backlog,
+                "max_chars": self.max_chars,
+                "published": head,
+                "truncated": self._truncated,
+                "subscribers": [
+                    {"lag": head - sub.cursor, "dropped": sub.dropped, "connected_for": time.time() - sub.since}
+                    for sub in self._subscribers
+                ],
+            }
+
+
+class Subscription:
+    def __init__(self, bus, cursor):
+        self.bus = bus
+        self.cursor = cursor
+        self.dropped = 0
+        self.since = time.time()
+
+    def get(self, timeout=None):
+        """Wait up to ``timeout`` seconds and return every message not yet read."""
+        return self.bus._read(self, timeout)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class ChunkBatcher:
+    """Coalesces streamed tokens into larger log frames.
+
+    A frame is emitted once it has been open for LOG_CHUNK_INTERVAL_MS
+    milliseconds (default 50) or holds LOG_CHUNK_MAX_CHARS characters
+    (default 2048). Call ``flush`` when the stream ends to emit the remainder.
+    """
+
+    def __init__(self, emit, interval=None, max_chars=None):
+        self.emit = emit
+        self.interval = float(os.getenv('LOG_CHUNK_INTERVAL_MS', '50')) / 1000 if interval is None else interval
+        self.max_chars = int(os.getenv('LOG_CHUNK_MAX_CHARS', '2048')) if max_chars is None else max_chars
+        self._parts = []
+        self._size = 0
+        self._opened = 0.0
+
+    def add(self, text):
+        now = time.monotonic()
+        if not self._parts:
+            self._opened = now
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.max_chars or now - self._opened >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if not self._parts:
+            return
+        text = ''.join(self._parts)
+        self._parts = []
+        self._size = 0
+        self.emit(text)
@@ -0,0 +1,327 @@
+import bisect
+import collections
+import json
+import os
+import threading
+
+from offload import run_blocking
+
+
+# Lines per block of the on-disk index
+_BLOCK = 256
+# Bytes read from the end of the history file to find its last entry
+_TAIL_BYTES = 64 * 1024
+
+
+def _entry_size(entry):
+    """Rough in-memory size of a log entry: its text plus a fixed overhead."""
+    message = entry.get('message')
+    return 256 + (len(message) if isinstance(message, str) else 0)
+
+
+def _encode_lines(messages):
+    return [(json.dumps(message, ensure_ascii=False, default=str) + "\n").encode('utf-8') for message in messages]
+
+
+def _count_below(entries, seq):
+    """Number of leading ``entries`` (ordered by seq) with a seq below ``seq``."""
+    low, high = 0, len(entries)
+    while low < high:
+        middle = (low + high) // 2
+        if entries[middle]['seq'] < seq:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class LogFilter:
+    """Criteria for a history query; ``None`` fields match anything."""
+
+    def __init__(self, types=None, model=None, request_id=None, since=None, until=None, text=None):
+        self.types = set(types) if types else None
+        self.model = model
+        self.request_id = request_id
+        self.since = since
+        self.until = until
+        self.text = text.lower() if text else None
+
+    def matches(self, entry):
+        if self.types is not None and entry.get('type') not in self.types:
+            return False
+        if self.model is not None and entry.get('model') != self.model:
+            return False
+        if self.request_id is not None and entry.get('request_id') != self.request_id:
+            return False
+        timestamp = entry.get('timestamp', 0)
+        if self.until is not None and timestamp > self.until:
+            return False
+        if self.since is not None and timestamp < self.since:
+            return False
+        if self.text is not None and self.text not in str(entry.get('message', '')).lower():
+            return False
+        return True
+
+
+class LogStore:
+    """Queryable history of web log messages.
+
+    A background thread reads the LogBus like any other viewer, so logging
+    never waits on the store. The newest LOG_HISTORY_SIZE messages (default
+    10000) are kept in memory, as long as their text fits in
+    LOG_HISTORY_MEMORY_MB (default 64). With LOG_HISTORY_FILE set, every message is
+    also appended to that JSONL file and indexed by sequence number, time and
+    request id, so older pages are read without scanning the whole file. The
+    file is rotated to ``<file>.1`` once it exceeds LOG_HISTORY_MAX_MB
+    (default 100).
+
+    Pages are returned newest first; pass the ``next_before`` of a page as
+    ``before`` to get the one after it.
+
+    At startup only the tail of an existing file is read, to continue its
+    sequence numbers; the index is built on the background thread before it
+    starts appending, and until then queries only see the in-memory history.
+    Under gevent, where that thread is a greenlet on the request loop,
+    indexing, encoding and file writes run on gevent's OS thread pool.
+    """
+
+    def __init__(self, bus, capacity=None, path=None, max_bytes=None, memory_bytes=None):
+        self.bus = bus
+        self.capacity = int(os.getenv('LOG_HISTORY_SIZE', '10000')) if capacity is None else capacity
+        self.memory_bytes = int(float(os.getenv('LOG_HISTORY_MEMORY_MB', '64')) * 1024 * 1024) if memory_bytes is None else memory_bytes
+        self.path = os.getenv('LOG_HISTORY_FILE') or None if path is None else path
+        self.max_bytes = int(float(os.getenv('LOG_HISTORY_MAX_MB', '100')) * 1024 * 1024) if max_bytes is None else max_bytes
+
+        self._lock = threading.Lock()
+        self._ring = collections.deque()
+        self._ring_bytes = 0
+        self._file = None
+        self._size = 0
+        # (first seq, first timestamp, offset) of every _BLOCK lines
+        self._blocks = []
+        self._block_lines = 0
+        self._by_request = {}
+        self._stored = 0
+        self._rotations = 0
+        self._indexed = not self.path
+
+        if self.path:
+            last_seq = self._last_seq()
+            if last_seq is not None:
+                bus.resume(last_seq + 1)
+
+        self._subscription = bus.subscribe(replay=bus.capacity)
+        threading.Thread(target=self._consume, daemon=True).start()
+
+    def _last_seq(self):
+        """Sequence number of the last entry in the history file, read from its tail."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            tail = _TAIL_BYTES
+            while True:
+                start = max(end - tail, 0)
+                f.seek(start)
+                lines = f.read(end - start).splitlines()
+                # The first line of a partial read may be cut off; the parse skips it
+                for line in reversed(lines):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(entry, dict) and 'seq' in entry:
+                        return entry['seq']
+                if start == 0:
+                    return None
+                tail *= 4
+
+    def _load_index(self):
+        """Index an existing history file; returns its last sequence number."""
+        last_seq = None
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            offset = 0
+            line = b''
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Skip a line torn by a crash
+                    offset += len(line)
+                    continue
+                self._index_line(entry, offset)
+                last_seq = entry.get('seq', last_seq)
+                offset += len(line)
+            self._size = offset
+        if line and not line.endswith(b"\n"):
+            # Terminate a torn final line so the next entry starts cleanly
+            with open(self.path, 'ab') as f:
+                f.write(b"\n")
+            self._size += 1
+        return last_seq
+
+    def _index_line(self, entry, offset):
+        if self._block_lines % _BLOCK == 0:
+            self._blocks.append((entry.get('seq', 0), entry.get('timestamp', 0), offset))
+        self._block_lines += 1
+        request_id = entry.get('request_id')
+        if request_id:
+            self._by_request.setdefault(request_id, []).append(offset)
+
+    def _consume(self):
+        if self.path:
+            run_blocking(self._load_index)
+            with self._lock:
+                self._file = open(self.path, 'ab')
+                self._indexed = True
+        while True:
+            messages = self._subscription.get(timeout=5)
+            if messages:
+                self._store(messages)
+
+    def _store(self, messages):
+        # Only this thread opens the file, so it can be checked without the lock
+        lines = run_blocking(_encode_lines, messages) if self._file is not None else None
+        with self._lock:
+            for message in messages:
+                self._ring.append(message)
+                self._ring_bytes += _entry_size(message)
+            while self._ring and (len(self._ring) > self.capacity or self._ring_bytes > self.memory_bytes):
+                self._ring_bytes -= _entry_size(self._ring.popleft())
+            self._stored += len(messages)
+            if lines is None:
+                return
+            for message, line in zip(messages, lines):
+                self._index_line(message, self._size)
+                self._size += len(line)
+            run_blocking(self._append, b''.join(lines))
+            if self._size >= self.max_bytes:
+                run_blocking(self._rotate)
+
+    def _append(self, data):
+        self._file.write(data)
+        self._file.flush()
+
+    def _rotate(self):
+        self._file.close()
+        os.replace(self.path, self.path + '.1')
+        self._file = open(self.path, 'ab')
+        self._size = 0
+        self._blocks = []
+        self._block_lines = 0
+        self._by_request = {}
+        self._rotations += 1
+
+    def query(self, log_filter=None, before=None, limit=100):
+        """Newest-first page of matching messages with ``seq`` below ``before``."""
+        log_filter = log_filter or LogFilter()
+        limit = max(1, min(limit, 1000))
+        with self._lock:
+            ring = list(self._ring)
+
+        matches = []
+        exhausted = False
+        end = len(ring) if before is None else _count_below(ring, before)
+        for entry in reversed(ring[:end]):
+            if log_filter.since is not None and entry.get('timestamp', 0) < log_filter.since:
+                exhausted = True
+                break
+            if log_filter.matches(entry):
+                matches.append(entry)
+                if len(matches) > limit:
+                    break
+
+        if len(matches) <= limit and not exhausted and self._file is not None:
+            oldest = ring[0]['seq'] if ring else None
+            cursor = before if oldest is None else (oldest if before is None else min(before, oldest))
+            matches.extend(self._query_file(log_filter, cursor, limit + 1 - len(matches)))
+
+        has_more = len(matches) > limit
+        page = matches[:limit]
+        return {
+            "entries": page,
+            "next_before": page[-1]['seq'] if has_more and page else None,
+        }
+
+    def _read_line(self, offset):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            line = f.readline()
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def _read_lines(self, start, end):
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        entries = []
+        for line in data.splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+    def _query_file(self, log_filter, before, count):
+        with self._lock:
+            blocks = list(self._blocks)
+            request_offsets = list(self._by_request.get(log_filter.request_id, ())) if log_filter.request_id else None
+            size = self._size
+
+        matches = []
+        if request_offsets is not None:
+            # One request's lines are few; read them directly
+            for offset in reversed(request_offsets):
+                entry = self._read_line(offset)
+                if entry is None or (before is not None and entry.get('seq', 0) >= before):
+                    continue
+                if log_filter.matches(entry):
+                    matches.append(entry)
+                    if len(matches) >= count:
+                        break
+            return matches
+
+        index = len(blocks) - 1
+        if before is not None:
+            index = min(index, bisect.bisect_left([block[0] for block in blocks], before) - 1)
+        if log_filter.until is not None:
+            index = min(index, bisect.bisect_right([block[1] for block in blocks], log_filter.until) - 1)
+        while index >= 0:
+            start = blocks[index][2]
+            end = blocks[index + 1][2] if index + 1 < len(blocks) else size
+            for entry in reversed(self._read_lines(start, end)):
+                if before is not None and entry.get('seq', 0) >= before:
+                    continue
+                if log_filter.since is not None and entry.get('timestamp', 0) < log_filter.since:
+                    return matches
+                if log_filter.matches(entry):
+                    matches.append(entry)
+                    if len(matches) >= count:
+                        return matches
+            index -= 1
+        return matches
+
+    def stats(self):
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "memory_limit_bytes": self.memory_bytes,
+                "in_memory": len(self._ring),
+                "in_memory_bytes": self._ring_bytes,
+                "stored": self._stored,
+                "dropped": self._subscription.dropped,
+                "file": self.path,
+                "file_bytes": self._size,
+                "file_blocks": len(self._blocks),
+                "indexed_requests": len(self._by_request),
+                "rotations": self._rotations,
+                "indexed": self._indexed,
+            }
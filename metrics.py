@@ -0,0 +1,228 @@
+import bisect
+import threading
+import time
+
+
+# Seconds; spans sub-millisecond proxy overhead up to multi-minute generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 40, 60, 80, 100, 150, 200, 400)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register ``fn() -> [(name, type, help, [(labels_dict, value), ...])]`` evaluated at scrape time."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception:
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = list(labels)
+                    lines.append(f"{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(float(bound))}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    'ollama_proxy_requests_total', 'Requests handled by the proxy.', ('route', 'model', 'status')))
+REQUEST_DURATION = registry.register(Histogram(
+    'ollama_proxy_request_duration_seconds', 'Total request duration, including the full stream.', ('route', 'model', 'backend')))
+TIME_TO_FIRST_TOKEN = registry.register(Histogram(
+    'ollama_proxy_time_to_first_token_seconds', 'Time from request arrival to the first streamed token.', ('route', 'model', 'backend')))
+INTER_TOKEN_LATENCY = registry.register(Histogram(
+    'ollama_proxy_inter_token_latency_seconds', 'Gap between consecutive streamed tokens.', ('route', 'model', 'backend')))
+PROXY_OVERHEAD = registry.register(Histogram(
+    'ollama_proxy_overhead_seconds', 'Time spent in proxy code, excluding upstream and queue waits.', ('route', 'model', 'backend')))
+QUEUE_WAIT = registry.register(Histogram(
+    'ollama_proxy_queue_wait_seconds', 'Time spent waiting for an admission slot.', ('route', 'model')))
+UPSTREAM_CONNECT = registry.register(Histogram(
+    'ollama_proxy_upstream_connect_seconds', 'Time until Ollama returned response headers (connect, send and header wait).', ('backend',)))
+TOKENS_PER_SECOND = registry.register(Histogram(
+    'ollama_proxy_generation_tokens_per_second', 'Generation speed reported by Ollama (eval_count / eval_duration).', ('model', 'backend'), RATE_BUCKETS))
+PROMPT_TOKENS_PER_SECOND = registry.register(Histogram(
+    'ollama_proxy_prompt_tokens_per_second', 'Prompt evaluation speed reported by Ollama.', ('model', 'backend'), RATE_BUCKETS))
+TOKENS = registry.register(Counter(
+    'ollama_proxy_tokens_total', 'Tokens reported by Ollama.', ('model', 'backend', 'kind')))
+
+
+def observe_ollama_counts(chunk, model, backend):
+    """Record Ollama's own token counts and speeds from a final chunk."""
+    eval_count = chunk.get('eval_count')
+    eval_duration = chunk.get('eval_duration')
+    if eval_count:
+        TOKENS.inc(eval_count, model=model, backend=backend, kind='completion')
+        if eval_duration:
+            TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9), model=model, backend=backend)
+    prompt_count = chunk.get('prompt_eval_count')
+    prompt_duration = chunk.get('prompt_eval_duration')
+    if prompt_count:
+        TOKENS.inc(prompt_count, model=model, backend=backend, kind='prompt')
+        if prompt_duration:
+            PROMPT_TOKENS_PER_SECOND.observe(prompt_count / (prompt_duration / 1e9), model=model, backend=backend)
+
+
+class StreamTimer:
+    """Splits a request's wall time into upstream waits and proxy work.
+
+    ``upstream`` wraps the iterator of Ollama chunks and times how long each
+    ``next`` blocks; ``track`` wraps the outgoing generator and times how long
+    the proxy spends producing each frame. Overhead is everything in our own
+    code that is not spent waiting on Ollama or on the admission queue.
+    """
+
+    def __init__(self, route, model, started=None):
+        self.route = route
+        self.model = model
+        self.backend = ''
+        self.started = time.perf_counter() if started is None else started
+        self.upstream_wait = 0.0
+        self.queue_wait = 0.0
+        self.setup = None
+        self._busy = 0.0
+        self._last_token = None
+
+    def queued(self, seconds):
+        self.queue_wait += seconds
+        QUEUE_WAIT.observe(seconds, route=self.route, model=self.model)
+
+    def waited(self, seconds):
+        self.upstream_wait += seconds
+
+    def upstream(self, iterable):
+        iterator = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.upstream_wait += time.perf_counter() - t0
+                return
+            self.upstream_wait += time.perf_counter() - t0
+            yield item
+
+    def token(self):
+        now = time.perf_counter()
+        if self._last_token is None:
+            TIME_TO_FIRST_TOKEN.observe(now - self.started, route=self.route, model=self.model, backend=self.backend)
+        else:
+            INTER_TOKEN_LATENCY.observe(now - self._last_token, route=self.route, model=self.model, backend=self.backend)
+        self._last_token = now
+
+    def responded(self):
+        """Mark the end of request setup (the point the response is returned)."""
+        self.setup = time.perf_counter() - self.started
+
+    def track(self, generator):
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    frame = next(generator)
+                except StopIteration:
+                    self._busy += time.perf_counter() - t0
+                    return
+                self._busy += time.perf_counter() - t0
+                yield frame
+        finally:
+            generator.close()
+            self.finish()
+
+    def finish(self):
+        setup = self.setup if self.setup is not None else time.perf_counter() - self.started
+        overhead = setup + self._busy - self.upstream_wait - self.queue_wait
+        PROXY_OVERHEAD.observe(max(overhead, 0.0), route=self.route, model=self.model, backend=self.backend)
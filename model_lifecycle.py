@@ -0,0 +1,271 @@
+import collections
+import os
+import threading
+import time
+
+from backends import is_unhealthy
+from metrics import registry, Histogram
+
+
+MODEL_LOAD_SECONDS = registry.register(Histogram(
+    'ollama_proxy_model_load_seconds', 'Time Ollama spent loading a model, from explicit loads and reported load_duration.', ('model',)))
+
+# A reported load_duration above this means the request waited for a cold load
+COLD_LOAD_SECONDS = 0.5
+
+
+def keep_alive_seconds(value):
+    """Seconds for an Ollama keep_alive value ("30m", "1h", "300", "-1"); None means forever."""
+    value = str(value).strip()
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if value and value[-1] in units:
+        seconds = float(value[:-1]) * units[value[-1]]
+    else:
+        seconds = float(value)
+    return None if seconds < 0 else seconds
+
+
+class ModelLifecycle:
+    """Keeps track of which models are resident in Ollama and warms them.
+
+    Every MODEL_PS_INTERVAL seconds (default 10) ``/api/ps`` is polled on each
+    backend; the resident set feeds backend affinity and the dashboard.
+    PRELOAD_MODELS (comma separated) are loaded at startup on every healthy
+    backend that has them installed. Loads are empty ``/api/generate``
+    requests, which make Ollama load a model and set its keep_alive
+    (MODEL_KEEP_ALIVE, default 30m) without generating tokens.
+
+    Catalog models that made up at least MODEL_HOT_SHARE (default 0.25) of
+    the requests in the last MODEL_HOT_WINDOW seconds (default 600) are hot;
+    the MODEL_PIN_MAX hottest (default 1) are kept pinned on the same
+    backends by renewing their keep_alive before it runs out, and reloaded
+    wherever Ollama evicted them. Requests for models Ollama does not have
+    are not counted, so they are never pinned.
+    """
+
+    def __init__(self, upstream, backends, registry=None):
+        self.upstream = upstream
+        self.backends = backends
+        self.registry = registry
+        self.interval = float(os.getenv('MODEL_PS_INTERVAL', '10'))
+        self.preload = [name.strip() for name in os.getenv('PRELOAD_MODELS', '').split(',') if name.strip()]
+        self.keep_alive = os.getenv('MODEL_KEEP_ALIVE', '30m')
+        self.hot_window = float(os.getenv('MODEL_HOT_WINDOW', '600'))
+        self.hot_share = float(os.getenv('MODEL_HOT_SHARE', '0.25'))
+        self.pin_max = int(os.getenv('MODEL_PIN_MAX', '1'))
+        self.load_timeout = float(os.getenv('MODEL_LOAD_TIMEOUT', '300'))
+
+        self._lock = threading.Lock()
+        self._resident = {}
+        self._recent = collections.deque()
+        self._loads = {}
+        self._pinned_at = {}
+        self._last_poll = None
+        self._poll_error = None
+        self._started = False
+
+    def start(self):
+        """Preload configured models and start polling in the background."""
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        for model in self.preload:
+            try:
+                self.load_everywhere(model)
+            except Exception as e:
+                self._record_error(f"Preloading {model} failed: {e}")
+        while True:
+            try:
+                self.poll()
+                self.pin_hot()
+            except Exception as e:
+                self._record_error(str(e))
+            time.sleep(self.interval)
+
+    def _record_error(self, message):
+        with self._lock:
+            self._poll_error = message
+
+    def poll(self):
+        """Fetch the resident models of every backend from ``/api/ps``."""
+        resident = {}
+        errors = []
+        for backend in self.backends.backends:
+            try:
+                response = self.upstream.get('/api/ps', timeout=5, base_url=backend.url)
+                response.raise_for_status()
+                models = response.json().get('models', [])
+            except Exception as e:
+                errors.append(f"{backend.url}: {e}")
+                continue
+            resident[backend.url] = {
+                model.get('name', ''): {
+                    "size_vram": model.get('size_vram'),
+                    "expires_at": model.get('expires_at'),
+                }
+                for model in models
+            }
+            self.backends.set_loaded(backend, list(resident[backend.url]))
+
+        with self._lock:
+            self._resident.update(resident)
+            self._last_poll = time.monotonic()
+            self._poll_error = "; ".join(errors) or None
+            loaded = set(name for models in self._resident.values() for name in models)
+
+        if self.registry is not None:
+            for name in set(self.registry.names()) | loaded:
+                self.registry.set_running(name, name in loaded)
+        return loaded
+
+    def _targets(self, model):
+        """Healthy backends that have ``model`` installed (or have not said what they have)."""
+        return [
+            backend for backend in self.backends.backends
+            if not backend.ejected() and (not backend.models or model in backend.models)
+        ]
+
+    def load_everywhere(self, model, keep_alive=None, timeout=None):
+        """Load ``model`` on every healthy backend that has it; raises if none could."""
+        loaded = 0
+        errors = []
+        for backend in self._targets(model):
+            try:
+                self.load(model, keep_alive, timeout, backend=backend)
+                loaded += 1
+            except Exception as e:
+                errors.append(f"{backend.url}: {e}")
+        if errors and not loaded:
+            raise RuntimeError("; ".join(errors))
+        if errors:
+            self._record_error(f"Loading {model} failed on " + "; ".join(errors))
+
+    def load(self, model, keep_alive=None, timeout=None, backend=None):
+        """Load ``model`` without generating; returns the seconds it took.
+
+        Goes to ``backend`` when given, else wherever the router sends ``model``.
+        """
+        started = time.monotonic()
+        body = {"model": model, "keep_alive": keep_alive or self.keep_alive, "stream": False}
+        if backend is None:
+            response = self.backends.request(self.upstream, 'POST', '/api/generate', json=body, timeout=timeout or self.load_timeout, model=model)
+        else:
+            self.backends.start(backend)
+            try:
+                response = self.upstream.post('/api/generate', json=body, timeout=timeout or self.load_timeout, base_url=backend.url)
+            except Exception as e:
+                self.backends.finish(backend, not is_unhealthy(e))
+                raise
+            self.backends.finish(backend, not is_unhealthy(response), model=model if response.ok else None)
+            response.backend_url = backend.url
+        response.raise_for_status()
+        elapsed = time.monotonic() - started
+        with self._lock:
+            stats = self._load_stats(model)
+            stats["loads"] += 1
+            stats["last_load_seconds"] = elapsed
+            stats["last_loaded"] = time.time()
+            self._pinned_at[model] = time.monotonic()
+            backend = getattr(response, 'backend_url', None)
+            if backend:
+                self._resident.setdefault(backend, {}).setdefault(model, {})
+        MODEL_LOAD_SECONDS.observe(elapsed, model=model)
+        if self.registry is not None:
+            self.registry.set_running(model, True)
+        return elapsed
+
+    def _load_stats(self, model):
+        return self._loads.setdefault(model, {
+            "loads": 0, "last_load_seconds": None, "last_loaded": None,
+            "cold_loads": 0, "last_cold_load_seconds": None,
+        })
+
+    def record_request(self, model):
+        # Only catalog models can become hot; a missing one would be reloaded on every poll
+        if self.registry is not None and not self.registry.known(model):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent.append((now, model))
+            while self._recent and now - self._recent[0][0] > self.hot_window:
+                self._recent.popleft()
+
+    def observe(self, model, chunk):
+        """Note a cold load reported in the final chunk of a completion."""
+        load_duration = (chunk.get('load_duration') or 0) / 1e9
+        if load_duration < COLD_LOAD_SECONDS:
+            return
+        with self._lock:
+            stats = self._load_stats(model)
+            stats["cold_loads"] += 1
+            stats["last_cold_load_seconds"] = load_duration
+        MODEL_LOAD_SECONDS.observe(load_duration, model=model)
+
+    def _request_counts(self):
+        now = time.monotonic()
+        with self._lock:
+            counts = collections.Counter(model for at, model in self._recent if now - at <= self.hot_window)
+        return counts
+
+    def hot_models(self):
+        counts = self._request_counts()
+        total = sum(counts.values())
+        if not total:
+            return []
+        hot = [model for model, count in counts.most_common() if count / total >= self.hot_share]
+        return hot[:self.pin_max]
+
+    def pin_hot(self):
+        """Renew keep_alive of hot models, reloading any that were evicted."""
+        ttl = keep_alive_seconds(self.keep_alive)
+        for model in self.hot_models():
+            targets = self._targets(model)
+            with self._lock:
+                resident = all(model in self._resident.get(backend.url, {}) for backend in targets)
+                pinned_at = self._pinned_at.get(model)
+            # Renew at half the keep_alive so the model never expires while hot
+            due = pinned_at is None or (ttl is not None and time.monotonic() - pinned_at > ttl / 2)
+            if resident and not due:
+                continue
+            try:
+                self.load_everywhere(model)
+            except Exception as e:
+                self._record_error(f"Pinning {model} failed: {e}")
+
+    def residency(self):
+        """Per model: the backends it is resident on and its load history."""
+        counts = self._request_counts()
+        hot = set(self.hot_models())
+        with self._lock:
+            models = {}
+            for backend, resident in self._resident.items():
+                for name, info in resident.items():
+                    entry = models.setdefault(name, {"resident_on": [], "expires_at": None, "size_vram": None})
+                    entry["resident_on"].append(backend)
+                    entry["expires_at"] = info.get("expires_at") or entry["expires_at"]
+                    entry["size_vram"] = info.get("size_vram") or entry["size_vram"]
+            for name in set(self._loads) | set(counts):
+                models.setdefault(name, {"resident_on": [], "expires_at": None, "size_vram": None})
+            for name, entry in models.items():
+                entry.update(self._loads.get(name, {}))
+                entry["recent_requests"] = counts.get(name, 0)
+                entry["hot"] = name in hot
+            return models
+
+    def stats(self):
+        models = self.residency()
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "keep_alive": self.keep_alive,
+                "preload": self.preload,
+                "hot_window": self.hot_window,
+                "hot_share": self.hot_share,
+                "pin_max": self.pin_max,
+                "last_poll_age": (time.monotonic() - self._last_poll) if self._last_poll else None,
+                "last_error": self._poll_error,
+                "models": models,
+            }
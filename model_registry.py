@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+
+from single_flight import request_key
+
+
+class ModelRegistry:
+    """Cached catalog of the models installed in Ollama.
+
+    With a backend pool the catalog is the union across all hosts.
+
+    Entries are kept in a dict keyed by model name so lookups are O(1). The
+    catalog is considered fresh for MODEL_CATALOG_TTL seconds (default 30).
+    After that it is still served for up to MODEL_CATALOG_MAX_STALE seconds
+    (default 300) while a background thread refreshes it, so callers on the
+    request path never wait on ``/api/tags`` once the catalog is warm.
+    """
+
+    def __init__(self, upstream, ttl=None, max_stale=None, single_flight=None, backends=None):
+        self.upstream = upstream
+        self.single_flight = single_flight
+        self.backends = backends
+        self.ttl = float(os.getenv('MODEL_CATALOG_TTL', '30')) if ttl is None else ttl
+        self.max_stale = float(os.getenv('MODEL_CATALOG_MAX_STALE', '300')) if max_stale is None else max_stale
+
+        self._lock = threading.Lock()
+        self._models = {}
+        self._order = []
+        self._status = {}
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._last_error = None
+
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._refreshes = 0
+
+    def _fetch(self):
+        if self.backends is None:
+            response = self.upstream.get('/api/tags', timeout=5)
+            response.raise_for_status()
+            return response.json().get('models', [])
+        return self._fetch_union()
+
+    def _fetch_union(self):
+        """Union of the catalogs of every backend, recording who has what."""
+        merged = {}
+        errors = []
+        for backend in self.backends.backends:
+            self.backends.start(backend)
+            try:
+                response = self.upstream.get('/api/tags', timeout=5, base_url=backend.url)
+                response.raise_for_status()
+                models = response.json().get('models', [])
+            except Exception as e:
+                self.backends.finish(backend, False)
+                errors.append(f"{backend.url}: {e}")
+                continue
+            self.backends.finish(backend, True)
+            self.backends.set_models(backend, [model.get('name', '') for model in models])
+            for model in models:
+                merged.setdefault(model.get('name', ''), model)
+
+        if errors and len(errors) == len(self.backends.backends):
+            raise Exception("; ".join(errors))
+        return list(merged.values())
+
+    def refresh(self):
+        """Fetch the catalog from Ollama now and replace the cached copy.
+
+        Concurrent refreshes share one ``/api/tags`` call when a single-flight
+        group is configured.
+        """
+        try:
+            if self.single_flight is not None:
+                models = self.single_flight.do(request_key('GET', '/api/tags'), self._fetch)
+            else:
+                models = self._fetch()
+        except Exception as e:
+            with self._lock:
+                self._last_error = str(e)
+            raise
+        with self._lock:
+            self._models = {model.get('name', ''): model for model in models}
+            self._order = [model.get('name', '') for model in models]
+            self._status = {name: running for name, running in self._status.items() if name in self._models}
+            self._fetched_at = time.monotonic()
+            self._last_error = None
+            self._refreshes += 1
+        return models
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure(self):
+        with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if self._fetched_at and age < self.ttl:
+                self._hits += 1
+                return
+            if self._fetched_at and age < self.ttl + self.max_stale:
+                self._stale_hits += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, daemon=True).start()
+                return
+            self._misses += 1
+        self.refresh()
+
+    def models(self):
+        """List of model entries as returned by ``/api/tags``, in Ollama's order."""
+        self._ensure()
+        with self._lock:
+            return [self._models[name] for name in self._order]
+
+    def names(self):
+        self._ensure()
+        with self._lock:
+            return list(self._order)
+
+    def contains(self, name):
+        self._ensure()
+        with self._lock:
+            return name in self._models
+
+    def known(self, name):
+        """Like ``contains``, but only checks the catalog already fetched."""
+        with self._lock:
+            return isinstance(name, str) and name in self._models
+
+    def get(self, name):
+        self._ensure()
+        with self._lock:
+            return self._models.get(name)
+
+    def set_running(self, name, running=True):
+        with self._lock:
+            self._status[name] = running
+
+    def is_running(self, name):
+        with self._lock:
+            return self._status.get(name, False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": len(self._models),
+                "age": (time.monotonic() - self._fetched_at) if self._fetched_at else None,
+                "ttl": self.ttl,
+                "max_stale": self.max_stale,
+                "hits": self._hits,
+                "stale_hits": self._stale_hits,
+                "misses": self._misses,
+                "refreshes": self._refreshes,
+                "refreshing": self._refreshing,
+                "last_error": self._last_error,
+            }
@@ -0,0 +1,18 @@
+import sys
+
+
+def run_blocking(fn, *args):
+    """Call ``fn(*args)`` without stalling the gevent event loop.
+
+    Under the gunicorn gevent worker, ``threading.Thread`` is a greenlet on
+    the same loop that serves requests, so CPU or disk work in a "background
+    thread" still holds up every request. There the call runs on gevent's
+    pool of real OS threads and only the calling greenlet waits for it;
+    otherwise it is an ordinary call. ``fn`` must not take locks created by
+    the patched ``threading`` module.
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from gevent import get_hub
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
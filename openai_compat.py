@@ -0,0 +1,142 @@
+import json
+import uuid
+
+
+# OpenAI sampling parameters that map 1:1 onto Ollama options
+_OPTION_FIELDS = {
+    'temperature': 'temperature',
+    'top_p': 'top_p',
+    'seed': 'seed',
+    'frequency_penalty': 'frequency_penalty',
+    'presence_penalty': 'presence_penalty',
+    'max_tokens': 'num_predict',
+    'max_completion_tokens': 'num_predict',
+}
+
+_FINISH_REASONS = {
+    'stop': 'stop',
+    'length': 'length',
+    'load': 'stop',
+    'unload': 'stop',
+}
+
+
+def _content_to_ollama(content):
+    """Split OpenAI message content into Ollama text and base64 images."""
+    if content is None:
+        return '', []
+    if isinstance(content, str):
+        return content, []
+
+    texts = []
+    images = []
+    for part in content:
+        if isinstance(part, str):
+            texts.append(part)
+            continue
+        kind = part.get('type')
+        if kind == 'text':
+            texts.append(part.get('text', ''))
+        elif kind == 'image_url':
+            url = part.get('image_url', {})
+            url = url.get('url', '') if isinstance(url, dict) else url
+            # Ollama only accepts inline images, sent as bare base64
+            if url.startswith('data:') and ',' in url:
+                images.append(url.split(',', 1)[1])
+    return ''.join(texts), images
+
+
+def _tool_calls_to_ollama(tool_calls):
+    converted = []
+    for call in tool_calls:
+        function = call.get('function', {})
+        arguments = function.get('arguments', {})
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments else {}
+            except json.JSONDecodeError:
+                arguments = {}
+        converted.append({
+            "function": {
+                "name": function.get('name', ''),
+                "arguments": arguments,
+            }
+        })
+    return converted
+
+
+def messages_to_ollama(messages):
+    """Convert OpenAI chat messages to the /api/chat message format."""
+    converted = []
+    for message in messages:
+        role = message.get('role', 'user')
+        if role == 'developer':
+            role = 'system'
+        content, images = _content_to_ollama(message.get('content'))
+        entry = {"role": role, "content": content}
+        if images:
+            entry["images"] = images
+        if message.get('tool_calls'):
+            entry["tool_calls"] = _tool_calls_to_ollama(message['tool_calls'])
+        if role == 'tool' and message.get('name'):
+            entry["tool_name"] = message['name']
+        converted.append(entry)
+    return converted
+
+
+def to_ollama_chat(data, model, stream):
+    """Translate an OpenAI chat completion request body into an /api/chat body."""
+    ollama_data = {
+        "model": model,
+        "messages": messages_to_ollama(data.get('messages', [])),
+        "stream": stream,
+    }
+
+    options = {}
+    for field, option in _OPTION_FIELDS.items():
+        if data.get(field) is not None:
+            options[option] = data[field]
+    stop = data.get('stop')
+    if stop:
+        options['stop'] = [stop] if isinstance(stop, str) else list(stop)
+    if options:
+        ollama_data["options"] = options
+
+    if data.get('tools'):
+        ollama_data["tools"] = data['tools']
+
+    response_format = data.get('response_format') or {}
+    if response_format.get('type') == 'json_object':
+        ollama_data["format"] = "json"
+    elif response_format.get('type') == 'json_schema':
+        ollama_data["format"] = response_format.get('json_schema', {}).get('schema', "json")
+
+    return ollama_data
+
+
+def tool_calls_to_openai(tool_calls):
+    """Convert Ollama tool calls to OpenAI tool calls with string arguments."""
+    return [
+        {
+            "index": index,
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {
+                "name": call.get('function', {}).get('name', ''),
+                "arguments": json.dumps(call.get('function', {}).get('arguments', {})),
+            },
+        }
+        for index, call in enumerate(tool_calls)
+    ]
+
+
+def finish_reason(chunk, saw_tool_calls=False):
+    """OpenAI finish_reason for the final Ollama chunk."""
+    if saw_tool_calls:
+        return 'tool_calls'
+    return _FINISH_REASONS.get(chunk.get('done_reason') or 'stop', 'stop')
+
+
+def prompt_text(ollama_messages):
+    """Text sent as prompt content, for token estimates."""
+    return ''.join(message.get('content', '') for message in ollama_messages)
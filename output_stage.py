@@ -0,0 +1,260 @@
+import os
+import queue
+import threading
+import time
+import zlib
+
+from config import env_bool
+from metrics import registry, Counter, Histogram
+
+
+OUTPUT_BYTES = registry.register(Counter(
+    'ollama_proxy_output_bytes_total', 'Bytes of compressed response bodies before (raw) and after (wire) compression.', ('route', 'stage')))
+STREAM_FRAMES = registry.register(Counter(
+    'ollama_proxy_stream_frames_total', 'Upstream chunks read (in) and frames written (out) by coalesced streams.', ('route', 'stage')))
+COALESCE_DELAY = registry.register(Histogram(
+    'ollama_proxy_coalesce_delay_seconds', 'How long coalescing held the first delta of a frame before writing it.', ('route',)))
+COMPRESS_SECONDS = registry.register(Histogram(
+    'ollama_proxy_compress_seconds', 'Time spent compressing one frame or response body.', ('route',),
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)))
+
+# zlib window bits per Content-Encoding; HTTP's "deflate" is the zlib format
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+COMPRESSIBLE_TYPES = ('text/event-stream', 'application/json', 'application/x-ndjson')
+
+# Upstream chunks a coalescing reader may hold that the client has not taken yet
+READ_AHEAD = 64
+
+_END = object()
+_ERROR = object()
+
+
+class OutputStage:
+    """Coalesces streamed deltas and compresses response bodies.
+
+    Ollama streams one token per chunk, so a plain stream is one small
+    ``data:`` frame, one HTTP chunk and often one TCP packet per token.
+    With coalescing on, chunks that arrive within STREAM_COALESCE_MS of the
+    first one still waiting are written together; chat completions merge
+    their text into a single delta. A frame is written early once it holds
+    STREAM_COALESCE_BYTES of text.
+
+    With compression on, JSON and SSE responses are gzip or deflate encoded
+    for clients that send a matching Accept-Encoding. Streams are flushed
+    after every frame so each event still reaches the client when it is
+    written.
+
+    Configured through environment variables:
+
+    - STREAM_COALESCE_MS: coalescing window in milliseconds (default 0, off)
+    - STREAM_COALESCE_BYTES: write a coalesced frame once it holds this many bytes (default 1024)
+    - RESPONSE_COMPRESSION: compress responses for clients that accept it (default false)
+    - COMPRESSION_LEVEL: zlib level, 1 (fastest) to 9 (smallest) (default 6)
+    - COMPRESSION_MIN_BYTES: smallest non-streaming body worth compressing (default 1024)
+    """
+
+    def __init__(self):
+        self.coalesce_window = float(os.getenv('STREAM_COALESCE_MS', '0')) / 1000
+        self.coalesce_bytes = max(1, int(os.getenv('STREAM_COALESCE_BYTES', '1024')))
+        self.compression = env_bool('RESPONSE_COMPRESSION', False)
+        self.level = int(os.getenv('COMPRESSION_LEVEL', '6'))
+        self.min_bytes = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+
+        self._lock = threading.Lock()
+        self._chunks_in = 0
+        self._frames_out = 0
+        self._coalesce_delay = 0.0
+        self._coalesce_saved = 0
+        self._responses = {'gzip': 0, 'deflate': 0}
+        self._raw_bytes = 0
+        self._wire_bytes = 0
+        self._compress_seconds = 0.0
+        self._compress_calls = 0
+
+    def batches(self, route, items, size=len, arrived=None, close=None):
+        """Yield ``items`` in lists of those that arrived within the coalescing window.
+
+        Without a window every item is its own list. With one, ``items`` is
+        read on a background thread so a batch can be closed on time even
+        while the next item is slow to come. The reader stays at most
+        READ_AHEAD items ahead, so a slow client slows the upstream read
+        down rather than buffering the stream. ``arrived`` is called with
+        each item as it is read (for timing), and ``close`` when the batches
+        are closed, to release an upstream the reader may still be blocked on.
+        """
+        if self.coalesce_window <= 0:
+            try:
+                for item in items:
+                    if arrived is not None:
+                        arrived(item)
+                    yield [item]
+            finally:
+                if close is not None:
+                    close()
+            return
+
+        arrivals = queue.Queue(maxsize=READ_AHEAD)
+        stop = threading.Event()
+
+        def read():
+            try:
+                for item in items:
+                    if arrived is not None:
+                        arrived(item)
+                    arrivals.put((item, time.perf_counter()))
+                    if stop.is_set():
+                        return
+                if not stop.is_set():
+                    arrivals.put((_END, None))
+            except Exception as e:
+                # Failing because the consumer closed the upstream is expected
+                if not stop.is_set():
+                    arrivals.put((_ERROR, e))
+
+        threading.Thread(target=read, daemon=True).start()
+        chunks = frames = 0
+        try:
+            pending = None
+            while True:
+                item, arrived_at = pending or arrivals.get()
+                pending = None
+                if item is _END:
+                    return
+                if item is _ERROR:
+                    raise arrived_at
+                batch = [item]
+                total = size(item)
+                deadline = arrived_at + self.coalesce_window
+                while total < self.coalesce_bytes:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        next_item = arrivals.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if next_item[0] is _END or next_item[0] is _ERROR:
+                        pending = next_item
+                        break
+                    batch.append(next_item[0])
+                    total += size(next_item[0])
+                delay = time.perf_counter() - arrived_at
+                chunks += len(batch)
+                frames += 1
+                with self._lock:
+                    self._chunks_in += len(batch)
+                    self._frames_out += 1
+                    self._coalesce_delay += delay
+                COALESCE_DELAY.observe(delay, route=route)
+                yield batch
+        finally:
+            stop.set()
+            if close is not None:
+                close()
+            # Unblock a reader waiting for room; it sees ``stop`` after its next put
+            while True:
+                try:
+                    arrivals.get_nowait()
+                except queue.Empty:
+                    break
+            STREAM_FRAMES.inc(chunks, route=route, stage='in')
+            STREAM_FRAMES.inc(frames, route=route, stage='out')
+
+    def saved(self, nbytes):
+        """Count SSE bytes a coalesced frame saved over one frame per delta."""
+        if nbytes > 0:
+            with self._lock:
+                self._coalesce_saved += nbytes
+
+    def negotiate(self, request):
+        """The Content-Encoding to use for ``request``'s response, or None."""
+        if not self.compression:
+            return None
+        return request.accept_encodings.best_match(('gzip', 'deflate'))
+
+    def compress(self, response, request, route):
+        """Encode ``response`` in place when it is compressible and the client accepts it."""
+        if not self.compression or response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        if 'Content-Encoding' in response.headers or response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(request)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._compress_stream(response.response, encoding, route)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_bytes:
+                return response
+            started = time.perf_counter()
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, _WBITS[encoding])
+            compressed = compressor.compress(body) + compressor.flush()
+            self._record(route, encoding, len(body), len(compressed), time.perf_counter() - started, 1)
+            response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _compress_stream(self, body, encoding, route):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, _WBITS[encoding])
+        raw = wire = calls = 0
+        seconds = 0.0
+        try:
+            for frame in body:
+                if isinstance(frame, str):
+                    frame = frame.encode('utf-8')
+                if not frame:
+                    continue
+                started = time.perf_counter()
+                # A sync flush ends the frame on a byte boundary so the client can decode it now
+                compressed = compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                elapsed = time.perf_counter() - started
+                COMPRESS_SECONDS.observe(elapsed, route=route)
+                seconds += elapsed
+                calls += 1
+                raw += len(frame)
+                wire += len(compressed)
+                yield compressed
+            tail = compressor.flush()
+            wire += len(tail)
+            yield tail
+        finally:
+            close = getattr(body, 'close', None)
+            if close is not None:
+                close()
+            self._record(route, encoding, raw, wire, seconds, calls, observe=False)
+
+    def _record(self, route, encoding, raw, wire, seconds, calls, observe=True):
+        with self._lock:
+            self._responses[encoding] += 1
+            self._raw_bytes += raw
+            self._wire_bytes += wire
+            self._compress_seconds += seconds
+            self._compress_calls += calls
+        OUTPUT_BYTES.inc(raw, route=route, stage='raw')
+        OUTPUT_BYTES.inc(wire, route=route, stage='wire')
+        if observe:
+            COMPRESS_SECONDS.observe(seconds, route=route)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "coalesce_window_ms": self.coalesce_window * 1000,
+                "coalesce_bytes": self.coalesce_bytes,
+                "chunks_in": self._chunks_in,
+                "frames_out": self._frames_out,
+                "chunks_per_frame": (self._chunks_in / self._frames_out) if self._frames_out else 0.0,
+                "avg_coalesce_delay_ms": (self._coalesce_delay / self._frames_out * 1000) if self._frames_out else 0.0,
+                "coalesce_bytes_saved": self._coalesce_saved,
+                "compression": self.compression,
+                "compression_level": self.level,
+                "compressed_responses": dict(self._responses),
+                "raw_bytes": self._raw_bytes,
+                "wire_bytes": self._wire_bytes,
+                "compression_ratio": (self._wire_bytes / self._raw_bytes) if self._raw_bytes else 0.0,
+                "bytes_saved": self._raw_bytes - self._wire_bytes,
+                "avg_compress_ms": (self._compress_seconds / self._compress_calls * 1000) if self._compress_calls else 0.0,
+            }
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import env_bool
+from metrics import registry, Counter
+
+
+PREFIX_LOOKUPS = registry.register(Counter(
+    'ollama_proxy_prefix_affinity_lookups_total', 'Prompt prefix lookups, by result (hit or miss).', ('result',)))
+
+
+def _message_bytes(message):
+    """Canonical bytes of one /api/chat message: what Ollama puts in its prompt."""
+    content = message.get('content', '')
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    parts = [message.get('role', ''), content]
+    if message.get('images'):
+        parts.append(hashlib.sha1(''.join(message['images']).encode('utf-8')).hexdigest())
+    if message.get('tool_calls'):
+        parts.append(json.dumps(message['tool_calls'], sort_keys=True, ensure_ascii=False))
+    return '\0'.join(parts).encode('utf-8')
+
+
+def prefix_fingerprints(model, messages, tools=None):
+    """Rolling hashes of every message prefix: entry ``i`` covers ``messages[:i + 1]``.
+
+    Each hash chains the previous one with the next message, so two requests
+    share a fingerprint exactly when they share that many leading messages
+    (for the same model and tools, which Ollama renders ahead of them).
+    """
+    fingerprints = []
+    seed = model
+    if tools:
+        seed += '\0' + json.dumps(tools, sort_keys=True, ensure_ascii=False)
+    digest = hashlib.blake2b(seed.encode('utf-8'), digest_size=16).digest()
+    for message in messages:
+        digest = hashlib.blake2b(digest + _message_bytes(message), digest_size=16).digest()
+        fingerprints.append(digest)
+    return fingerprints
+
+
+class PrefixAffinity:
+    """Remembers which backend last evaluated a prompt prefix.
+
+    Ollama keeps the KV cache of a model's recent prompts, so a follow-up
+    turn sent to the same backend only evaluates the new messages. After a
+    request is routed, the fingerprints of its whole prompt and of its
+    leading system messages are mapped to the backend that served it. The
+    next request is routed to the backend of its longest known prefix, which
+    pins a conversation to one backend and groups requests that share a
+    system prompt.
+
+    Configured through environment variables:
+
+    - PREFIX_AFFINITY: enable prefix routing (default true)
+    - PREFIX_AFFINITY_SIZE: prefixes remembered, least recently used evicted first (default 4096)
+    - PREFIX_AFFINITY_TTL: seconds a prefix is assumed to stay cached on its backend (default 1800)
+    """
+
+    def __init__(self):
+        self.enabled = env_bool('PREFIX_AFFINITY', True)
+        self.capacity = int(os.getenv('PREFIX_AFFINITY_SIZE', '4096'))
+        self.ttl = float(os.getenv('PREFIX_AFFINITY_TTL', '1800'))
+
+        self._lock = threading.Lock()
+        self._table = OrderedDict()
+
+        self._lookups = 0
+        self._hits = 0
+        self._matched_messages = 0
+        self._routed = 0
+        self._elsewhere = 0
+        self._evictions = 0
+
+    def lookup(self, fingerprints):
+        """Backend of the longest known prefix, and how many messages it covers."""
+        if not self.enabled or not fingerprints:
+            return None, 0
+        now = time.monotonic()
+        with self._lock:
+            self._lookups += 1
+            for depth in range(len(fingerprints), 0, -1):
+                item = self._table.get(fingerprints[depth - 1])
+                if item is None:
+                    continue
+                backend, stored_at = item
+                if now - stored_at >= self.ttl:
+                    del self._table[fingerprints[depth - 1]]
+                    continue
+                self._table.move_to_end(fingerprints[depth - 1])
+                self._hits += 1
+                self._matched_messages += depth
+                break
+            else:
+                backend, depth = None, 0
+        PREFIX_LOOKUPS.inc(result='hit' if backend else 'miss')
+        return backend, depth
+
+    def remember(self, fingerprints, messages, backend, preferred=None):
+        """Map the request's prefixes to the backend that served it."""
+        if not self.enabled or not fingerprints or not backend:
+            return
+        keys = [fingerprints[-1]]
+        # The leading system messages are what other conversations share
+        system = 0
+        while system < len(messages) and messages[system].get('role') == 'system':
+            system += 1
+        if 0 < system < len(fingerprints):
+            keys.append(fingerprints[system - 1])
+        now = time.monotonic()
+        with self._lock:
+            if preferred is not None:
+                if preferred == backend:
+                    self._routed += 1
+                else:
+                    self._elsewhere += 1
+            for key in keys:
+                self._table[key] = (backend, now)
+                self._table.move_to_end(key)
+            while len(self._table) > self.capacity:
+                self._table.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "capacity": self.capacity,
+                "ttl": self.ttl,
+                "entries": len(self._table),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": (self._hits / self._lookups) if self._lookups else 0.0,
+                "avg_matched_messages": (self._matched_messages / self._hits) if self._hits else 0.0,
+                "routed_to_preferred": self._routed,
+                "routed_elsewhere": self._elsewhere,
+                "evictions": self._evictions,
+            }
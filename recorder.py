@@ -0,0 +1,355 @@
+"""Opt-in traffic recorder.
+
+Segments are append-only files of length-prefixed, zlib-compressed JSON
+records::
+
+    b"OPRX1\\n" then, per record: >II (compressed length, crc32) + payload
+
+Each segment has a ``.idx`` sidecar with one ``request_id offset`` line per
+record, so a request can be found without decompressing the segment.
+
+    python recorder.py export captures/ -o capture.jsonl   # for bench/replay.py
+    python recorder.py show captures/ chatcmpl-0123456789ab
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from config import env_float
+from offload import run_blocking
+
+
+MAGIC = b"OPRX1\n"
+_HEADER = struct.Struct('>II')
+
+# Preset dictionary: most records repeat these keys, so even a small record
+# compresses well on its own
+_ZDICT = (
+    b'{"request_id": "chatcmpl-", "ts": , "method": "POST", "path": "/v1/chat/completions", '
+    b'"body": {"model": "", "messages": [{"role": "system", "content": ""}, {"role": "user", "content": ""}, '
+    b'{"role": "assistant", "content": ""}], "stream": true, "temperature": , "max_tokens": , "tools": '
+    b'[{"type": "function", "function": {"name": "", "description": "", "parameters": {"type": "object", '
+    b'"properties": {}, "required": []}}}]}, "status": 200, "duration": , "model": "", "backend": "http://", '
+    b'"response": "", "truncated": false}'
+)
+
+
+class Capture:
+    """One request being recorded; response text is kept up to a limit."""
+
+    def __init__(self, request_id, method, path, body, max_chars):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.body = body
+        self.ts = time.time()
+        self.response = None
+        self.truncated = False
+        self._parts = []
+        self._chars = 0
+        self._max_chars = max_chars
+
+    def add(self, text):
+        if self.truncated:
+            return
+        room = self._max_chars - self._chars
+        if len(text) > room:
+            text = text[:room]
+            self.truncated = True
+        self._parts.append(text)
+        self._chars += len(text)
+
+    def text(self):
+        return ''.join(self._parts)
+
+
+def _truncate(value, max_chars):
+    """Shorten long strings anywhere in a JSON value, keeping it valid."""
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars]
+    if isinstance(value, dict):
+        return {key: _truncate(item, max_chars) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_truncate(item, max_chars) for item in value]
+    return value
+
+
+def _compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS, zdict=_ZDICT)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data):
+    return zlib.decompressobj(zlib.MAX_WBITS, zdict=_ZDICT).decompress(data)
+
+
+def read_records(path):
+    """Yield ``(offset, record)`` for every intact record in a segment."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return
+        while True:
+            offset = f.tell()
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            length, crc = _HEADER.unpack(header)
+            payload = f.read(length)
+            # A torn write at the end of a segment ends it
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield offset, json.loads(_decompress(payload))
+
+
+def read_record(path, offset):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        length, crc = _HEADER.unpack(f.read(_HEADER.size))
+        payload = f.read(length)
+    if zlib.crc32(payload) != crc:
+        raise ValueError(f"corrupt record at {path}:{offset}")
+    return json.loads(_decompress(payload))
+
+
+def segments(directory):
+    """Segment paths, oldest first."""
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.rec'))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+
+class Recorder:
+    """Records sampled requests and responses to rotating segment files.
+
+    ``begin`` decides whether a request is sampled and ``finish`` hands the
+    finished record to a background writer through a bounded queue. Requests
+    never wait on the disk: when the queue is full the record is dropped and
+    counted. Serialization, truncation and compression happen on the
+    writer thread; under gevent, where that thread is a greenlet on the
+    request loop, they and the file writes run on gevent's OS thread pool.
+
+    Configured through environment variables:
+
+    - RECORD_DIR: directory for the segments; recording is off when unset
+    - RECORD_SAMPLE_RATE: share of requests recorded (default 1.0)
+    - RECORD_MAX_CHARS: longest string kept in a body or response (default 16384)
+    - RECORD_SEGMENT_MB: size at which a new segment is started (default 64)
+    - RECORD_MAX_SEGMENTS: segments kept before the oldest is deleted (default 20)
+    - RECORD_QUEUE: records waiting for the writer before new ones are dropped (default 1024)
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory if directory is not None else os.getenv('RECORD_DIR') or None
+        self.enabled = bool(self.directory)
+        self.sample_rate = env_float('RECORD_SAMPLE_RATE', 1.0)
+        self.max_chars = int(os.getenv('RECORD_MAX_CHARS', '16384'))
+        self.segment_bytes = int(float(os.getenv('RECORD_SEGMENT_MB', '64')) * 1024 * 1024)
+        self.max_segments = int(os.getenv('RECORD_MAX_SEGMENTS', '20'))
+
+        self._queue = queue.Queue(maxsize=int(os.getenv('RECORD_QUEUE', '1024')))
+        self._lock = threading.Lock()
+        self._file = None
+        self._index = None
+        self._path = None
+        self._offsets = {}
+        self._segment_seq = 0
+
+        self._recorded = 0
+        self._dropped = 0
+        self._sampled_out = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._errors = 0
+
+        # The writer thread and directory are set up by the first finished request
+        self._writer = None
+
+    def begin(self, request_id, method, path, body):
+        """Start recording a request; returns None when it is not sampled."""
+        if not self.enabled:
+            return None
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._sampled_out += 1
+            return None
+        return Capture(request_id, method, path, body, self.max_chars)
+
+    def finish(self, capture, status=None, duration=None, **fields):
+        if capture is None:
+            return
+        record = {
+            "request_id": capture.request_id,
+            "ts": capture.ts,
+            "method": capture.method,
+            "path": capture.path,
+            "body": capture.body,
+            "status": status,
+            "duration": duration,
+            "response": capture.response if capture.response is not None else capture.text(),
+            "truncated": capture.truncated,
+        }
+        record.update(fields)
+        if self._writer is None:
+            self._start_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._dropped += 1
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            print(f"Recorder cannot create {self.directory}: {e}", file=sys.stderr)
+        while True:
+            record = self._queue.get()
+            try:
+                self._write(record)
+            except Exception as e:
+                self._errors += 1
+                print(f"Recorder write failed: {e}", file=sys.stderr)
+
+    def _encode(self, record):
+        record["body"] = _truncate(record["body"], self.max_chars)
+        if isinstance(record["response"], (dict, list)):
+            record["response"] = _truncate(record["response"], self.max_chars)
+        data = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        return len(data), _compress(data)
+
+    def _append(self, frame, index_line):
+        self._file.write(frame)
+        self._file.flush()
+        self._index.write(index_line)
+        self._index.flush()
+
+    def _write(self, record):
+        size, payload = run_blocking(self._encode, record)
+
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                run_blocking(self._rotate)
+            offset = self._file.tell()
+            run_blocking(self._append, _HEADER.pack(len(payload), zlib.crc32(payload)) + payload, f"{record['request_id']} {offset}\n")
+            self._offsets[record['request_id']] = offset
+            self._recorded += 1
+            self._bytes_in += size
+            self._bytes_out += _HEADER.size + len(payload)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+        self._segment_seq += 1
+        name = f"capture-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._segment_seq:06d}.rec"
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path, 'wb')
+        self._file.write(MAGIC)
+        self._index = open(self._path[:-4] + '.idx', 'a', encoding='utf-8')
+        self._offsets = {}
+
+        existing = segments(self.directory)
+        for path in existing[:max(len(existing) - self.max_segments, 0)]:
+            for stale in (path, path[:-4] + '.idx'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def lookup(self, request_id):
+        """The recorded request/response for ``request_id``, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            offset = self._offsets.get(request_id)
+            current = self._path
+        if offset is not None:
+            return read_record(current, offset)
+        return find(self.directory, request_id)
+
+    def stats(self):
+        with self._lock:
+            files = segments(self.directory) if self.enabled else []
+            return {
+                "enabled": self.enabled,
+                "directory": self.directory,
+                "sample_rate": self.sample_rate,
+                "max_chars": self.max_chars,
+                "recorded": self._recorded,
+                "dropped": self._dropped,
+                "sampled_out": self._sampled_out,
+                "errors": self._errors,
+                "queue_depth": self._queue.qsize(),
+                "segments": len(files),
+                "disk_bytes": sum(os.path.getsize(path) for path in files if os.path.exists(path)),
+                "compression_ratio": (self._bytes_in / self._bytes_out) if self._bytes_out else None,
+            }
+
+
+def find(directory, request_id):
+    """Search segment indexes, newest first, for ``request_id``."""
+    for path in reversed(segments(directory)):
+        try:
+            with open(path[:-4] + '.idx', encoding='utf-8') as f:
+                offsets = [line.split(' ', 1)[1] for line in f if line.split(' ', 1)[0] == request_id]
+        except (OSError, IndexError):
+            continue
+        if offsets:
+            return read_record(path, int(offsets[-1]))
+    return None
+
+
+def export(directory, out, since=None):
+    """Write every record as a JSON line that bench/replay.py can replay."""
+    count = 0
+    for path in segments(directory):
+        for _, record in read_records(path):
+            if since and record.get('ts', 0) < since:
+                continue
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and export recorded traffic")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="convert segments to JSONL")
+    export_parser.add_argument('directory')
+    export_parser.add_argument('-o', '--output', help="output file (default: stdout)")
+    export_parser.add_argument('--since', type=float, help="only records after this Unix time")
+    show_parser = commands.add_parser('show', help="print the record of one request")
+    show_parser.add_argument('directory')
+    show_parser.add_argument('request_id')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            count = export(args.directory, out, args.since)
+        finally:
+            if args.output:
+                out.close()
+        print(f"Exported {count} records", file=sys.stderr)
+    else:
+        record = find(args.directory, args.request_id)
+        if record is None:
+            sys.exit(f"{args.request_id} not found")
+        print(json.dumps(record, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import env_bool
+
+
+# Fields of the final Ollama chunk worth keeping with a cached answer
+_KEPT_FIELDS = ('model', 'done_reason', 'prompt_eval_count', 'eval_count')
+
+
+def is_deterministic(data):
+    """Only temperature 0 or seeded requests produce repeatable answers."""
+    return data.get('temperature') == 0 or data.get('seed') is not None
+
+
+def entry_from_chunks(content, tool_calls, final_chunk):
+    """Build a cache entry, shaped like a non-streaming /api/chat response."""
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    entry = {"message": message, "done": True}
+    for field in _KEPT_FIELDS:
+        if field in final_chunk:
+            entry[field] = final_chunk[field]
+    return entry
+
+
+def replay_chunks(entry):
+    """Replay a cached entry as the chunks Ollama would have streamed."""
+    yield {"message": entry["message"], "done": False}
+    final = {key: value for key, value in entry.items() if key != "message"}
+    final["message"] = {"role": "assistant", "content": ""}
+    yield final
+
+
+class ResponseCache:
+    """Exact-match cache for deterministic chat completions.
+
+    Keyed on a SHA-256 of the canonical /api/chat request (model, messages,
+    options, tools, format). An in-memory LRU sits in front of an optional
+    on-disk tier with one JSON file per entry.
+
+    Configured through environment variables:
+
+    - RESPONSE_CACHE: enable the cache (default false)
+    - RESPONSE_CACHE_SIZE: entries kept in memory (default 256)
+    - RESPONSE_CACHE_TTL: seconds an entry stays valid (default 3600)
+    - RESPONSE_CACHE_DIR: directory for the on-disk tier (default: memory only)
+    - RESPONSE_CACHE_DISK_MAX_MB: size limit of the on-disk tier (default 256)
+    """
+
+    def __init__(self):
+        self.enabled = env_bool('RESPONSE_CACHE', False)
+        self.max_entries = int(os.getenv('RESPONSE_CACHE_SIZE', '256'))
+        self.ttl = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+        self.disk_dir = os.getenv('RESPONSE_CACHE_DIR') or None
+        self.disk_max_bytes = int(float(os.getenv('RESPONSE_CACHE_DISK_MAX_MB', '256')) * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk_bytes = 0
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._bytes_saved = 0
+
+        if self.enabled and self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def key(self, ollama_data):
+        canonical = {
+            "model": ollama_data.get('model'),
+            "messages": ollama_data.get('messages'),
+            "options": ollama_data.get('options'),
+            "tools": ollama_data.get('tools'),
+            "format": ollama_data.get('format'),
+        }
+        encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                stored_at, size, entry = item
+                if now - stored_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._hits += 1
+                    self._bytes_saved += size
+                    return entry
+                del self._memory[key]
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            stored_at, size, entry = entry
+            self._disk_hits += 1
+            self._bytes_saved += size
+            self._remember(key, stored_at, size, entry)
+        return entry
+
+    def put(self, key, entry):
+        encoded = json.dumps(entry, separators=(',', ':')).encode('utf-8')
+        now = time.time()
+        with self._lock:
+            self._stores += 1
+            self._remember(key, now, len(encoded), entry)
+        self._disk_put(key, encoded)
+
+    def _remember(self, key, stored_at, size, entry):
+        self._memory[key] = (stored_at, size, entry)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_files(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            files.append((name, stat.st_size, stat.st_mtime))
+        return files
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if now - stat.st_mtime >= self.ttl:
+                os.remove(path)
+                with self._lock:
+                    self._disk_bytes -= stat.st_size
+                return None
+            with open(path, 'rb') as f:
+                encoded = f.read()
+            return stat.st_mtime, len(encoded), json.loads(encoded)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key, encoded):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(encoded)
+            # Replacing an entry frees the old file's bytes
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(encoded) - replaced
+            over_limit = self._disk_bytes > self.disk_max_bytes
+        if over_limit:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        """Drop expired entries, then the oldest ones until under the size limit."""
+        now = time.time()
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        for name, size, mtime in files:
+            if total <= self.disk_max_bytes and now - mtime < self.ttl:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._evictions += evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk_dir": self.disk_dir,
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": ((self._hits + self._disk_hits) / lookups) if lookups else 0.0,
+                "stores": self._stores,
+                "evictions": self._evictions,
+                "bytes_saved": self._bytes_saved,
+            }
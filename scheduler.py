@@ -0,0 +1,254 @@
+import bisect
+import collections
+import itertools
+import math
+import os
+import threading
+import time
+
+
+# Lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+
+class QueueFull(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, scheduler, model, priority, seq, client='', weight=1.0):
+        self.scheduler = scheduler
+        self.model = model
+        self.priority = priority
+        self.seq = seq
+        self.client = client
+        self.weight = weight
+        # Virtual start and finish times for weighted fair queuing
+        self.start = 0.0
+        self.finish = 0.0
+        self.granted = threading.Event()
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.released = False
+
+    def sort_key(self):
+        return (self.priority, self.finish, self.seq)
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+    def release(self):
+        self.scheduler.release(self)
+
+
+class Scheduler:
+    """Admission control in front of Ollama.
+
+    At most MAX_CONCURRENCY_PER_MODEL requests run per model and at most
+    MAX_CONCURRENCY_PER_BACKEND per Ollama host (0 disables a limit, the
+    default). The scheduler admits up to the per-host limit times the number
+    of hosts and the backend pool routes each admitted request to a host
+    below the limit. Requests over the limit wait in a queue of at most
+    MAX_QUEUE entries (default 64), interactive streaming requests ahead of
+    batch ones, for up to QUEUE_TIMEOUT seconds (default 60). When the queue
+    is full requests are rejected immediately with a Retry-After estimate.
+
+    Within a priority, clients share capacity by weighted fair queuing:
+    each request is stamped with a virtual finish time, its client's
+    previous finish time plus the client's average slot hold time divided
+    by its weight, and the earliest finish is admitted first. A client
+    sending a long batch of requests therefore queues behind its own work
+    rather than in front of everyone else's. A client that has nothing
+    queued or running starts again from the current virtual time and only
+    its hold time is kept. Beyond MAX_TRACKED_CLIENTS clients (default
+    1000) the least recently used idle ones are forgotten.
+    """
+
+    def __init__(self, backend_count=1):
+        self.per_model = int(os.getenv('MAX_CONCURRENCY_PER_MODEL', '0'))
+        self.per_backend = int(os.getenv('MAX_CONCURRENCY_PER_BACKEND', '0'))
+        self.max_queue = int(os.getenv('MAX_QUEUE', '64'))
+        self.queue_timeout = float(os.getenv('QUEUE_TIMEOUT', '60'))
+        self.max_clients = max(1, int(os.getenv('MAX_TRACKED_CLIENTS', '1000')))
+        self.backend_count = backend_count
+
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._active = {}
+        self._active_total = 0
+        self._virtual_time = 0.0
+        # client -> [queued or running tickets, last virtual finish, EWMA of hold seconds],
+        # idle clients in least recently used order
+        self._clients = collections.OrderedDict()
+
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._hold_ewma = None
+
+    @property
+    def enabled(self):
+        return self.per_model > 0 or self.per_backend > 0
+
+    def _capacity(self):
+        return self.per_backend * self.backend_count if self.per_backend > 0 else None
+
+    def _can_run(self, model):
+        capacity = self._capacity()
+        if capacity is not None and self._active_total >= capacity:
+            return False
+        if self.per_model > 0 and self._active.get(model, 0) >= self.per_model:
+            return False
+        return True
+
+    def _stamp(self, ticket):
+        """Give ``ticket`` its virtual start and finish times."""
+        client = self._clients.setdefault(ticket.client, [0, 0.0, None])
+        self._clients.move_to_end(ticket.client)
+        start = self._virtual_time if not client[0] else max(self._virtual_time, client[1])
+        cost = client[2] or self._hold_ewma or 1.0
+        ticket.start = start
+        ticket.finish = start + cost / max(ticket.weight, 0.01)
+        client[0] += 1
+        client[1] = ticket.finish
+
+    def _unstamp(self, ticket):
+        client = self._clients[ticket.client]
+        client[0] -= 1
+        if not client[0] and client[2] is None:
+            del self._clients[ticket.client]
+        self._forget_idle()
+
+    def _forget_idle(self):
+        """Drop least recently used idle clients while over MAX_TRACKED_CLIENTS."""
+        excess = len(self._clients) - self.max_clients
+        if excess <= 0:
+            return
+        idle = [name for name, (count, _, _) in self._clients.items() if not count]
+        for name in idle[:excess]:
+            del self._clients[name]
+
+    def _grant(self, ticket):
+        self._virtual_time = max(self._virtual_time, ticket.start)
+        ticket.admitted_at = time.monotonic()
+        waited = ticket.admitted_at - ticket.enqueued_at
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._admitted += 1
+        self._active[ticket.model] = self._active.get(ticket.model, 0) + 1
+        self._active_total += 1
+        ticket.granted.set()
+
+    def _dispatch(self):
+        """Admit queued tickets in priority order while capacity allows."""
+        index = 0
+        while index < len(self._waiting):
+            capacity = self._capacity()
+            if capacity is not None and self._active_total >= capacity:
+                return
+            ticket = self._waiting[index]
+            if self._can_run(ticket.model):
+                del self._waiting[index]
+                self._grant(ticket)
+            else:
+                index += 1
+
+    def retry_after(self):
+        """Rough seconds until a slot frees up, for the Retry-After header."""
+        capacity = self._capacity() or max(self.per_model, 1)
+        hold = self._hold_ewma or 1.0
+        return max(1, math.ceil(hold * (len(self._waiting) + 1) / capacity))
+
+    def acquire(self, model, priority=PRIORITY_INTERACTIVE, client='', weight=1.0):
+        """Wait for a slot for ``model``; raises QueueFull when over the limits.
+
+        ``client`` and ``weight`` set the request's fair share of the queue.
+        """
+        ticket = Ticket(self, model, priority, next(self._seq), client, weight)
+        if not self.enabled:
+            with self._lock:
+                self._stamp(ticket)
+                self._grant(ticket)
+            return ticket
+
+        with self._lock:
+            self._stamp(ticket)
+            # Every waiter that could run was admitted by _dispatch, so the
+            # ones left wait on a saturated model and must not hold this one back
+            if self._can_run(model):
+                self._grant(ticket)
+                return ticket
+            if len(self._waiting) >= self.max_queue:
+                self._unstamp(ticket)
+                self._rejected += 1
+                raise QueueFull("Server is busy: request queue is full", self.retry_after())
+            bisect.insort(self._waiting, ticket)
+            self._queued += 1
+
+        if ticket.granted.wait(self.queue_timeout):
+            return ticket
+
+        with self._lock:
+            if ticket.granted.is_set():
+                return ticket
+            self._waiting.remove(ticket)
+            self._unstamp(ticket)
+            self._timeouts += 1
+            raise QueueFull("Server is busy: timed out waiting in the request queue", self.retry_after())
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.released or ticket.admitted_at is None:
+                return
+            ticket.released = True
+            held = time.monotonic() - ticket.admitted_at
+            self._hold_ewma = held if self._hold_ewma is None else 0.8 * self._hold_ewma + 0.2 * held
+            client = self._clients[ticket.client]
+            client[2] = held if client[2] is None else 0.8 * client[2] + 0.2 * held
+            client[0] -= 1
+            if not client[0]:
+                self._forget_idle()
+            self._active[ticket.model] -= 1
+            if not self._active[ticket.model]:
+                del self._active[ticket.model]
+            self._active_total -= 1
+            self._dispatch()
+
+    def stats(self):
+        with self._lock:
+            queued = collections.Counter(t.client for t in self._waiting)
+            return {
+                "enabled": self.enabled,
+                "max_concurrency_per_model": self.per_model,
+                "max_concurrency_per_backend": self.per_backend,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "active": dict(self._active),
+                "active_total": self._active_total,
+                "queue_depth": len(self._waiting),
+                "queued_by_priority": {
+                    "interactive": sum(1 for t in self._waiting if t.priority == PRIORITY_INTERACTIVE),
+                    "batch": sum(1 for t in self._waiting if t.priority == PRIORITY_BATCH),
+                },
+                "clients": {
+                    client: {"queued": queued.get(client, 0), "active": count - queued.get(client, 0), "hold_ewma": hold}
+                    for client, (count, _, hold) in self._clients.items()
+                },
+                "virtual_time": self._virtual_time,
+                "admitted": self._admitted,
+                "queued": self._queued,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+                "wait_avg": (self._wait_total / self._admitted) if self._admitted else 0.0,
+                "wait_max": self._wait_max,
+                "hold_ewma": self._hold_ewma,
+            }
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def request_key(method, path, data=None):
+    """Canonical key for an upstream call: identical calls get identical keys."""
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False) if data is not None else ''
+    digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+    return f"{method} {path} {digest}"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """One upstream stream, buffered until every reader has read each line.
+
+    ``lines[0]`` is line number ``start`` of the stream; ``cursors`` holds
+    the next line number of each reader. Once the flight stops taking new
+    readers, lines every reader is past are dropped.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.opened = threading.Event()
+        self.response = None
+        self.error = None
+        self.lines = []
+        self.start = 0
+        self.cursors = {}
+        self.joinable = True
+        self.finished = False
+        self.readers = 0
+        self.cancelled = False
+
+    def trim(self):
+        """Drop the lines every reader has read; call with ``cond`` held."""
+        if self.joinable or not self.cursors:
+            return
+        done = min(self.cursors.values()) - self.start
+        if done > 0:
+            del self.lines[:done]
+            self.start += done
+
+
+class FlightReader:
+    """Response-like view of a shared stream (``iter_lines``/``close``)."""
+
+    def __init__(self, group, key, flight):
+        self._group = group
+        self._key = key
+        self._flight = flight
+        self._closed = False
+
+    @property
+    def backend_url(self):
+        return getattr(self._flight.response, 'backend_url', None)
+
+    def iter_lines(self):
+        flight = self._flight
+        try:
+            while True:
+                with flight.cond:
+                    position = flight.cursors[self]
+                    while position >= flight.start + len(flight.lines) and not flight.finished and not self._closed:
+                        flight.cond.wait()
+                    if self._closed:
+                        return
+                    lines = flight.lines[position - flight.start:]
+                    position += len(lines)
+                    flight.cursors[self] = position
+                    flight.trim()
+                    finished = flight.finished and position >= flight.start + len(flight.lines)
+                    error = flight.error
+                for line in lines:
+                    yield line
+                if finished:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._group._release(self._key, self._flight)
+        # Wake iter_lines if another thread closed this reader
+        with self._flight.cond:
+            self._flight.cursors.pop(self, None)
+            self._flight.trim()
+            self._flight.cond.notify_all()
+
+
+class SingleFlight:
+    """Collapses identical concurrent upstream calls into one.
+
+    ``do`` shares the result of a plain call; ``stream`` shares one upstream
+    stream. Followers can join a stream until it has produced
+    SINGLE_FLIGHT_JOIN_LINES lines (default 256) and replay it from the
+    start; after that identical requests open a stream of their own, and
+    only lines some reader has yet to read are kept. When every reader of a
+    stream has gone away the upstream response is closed.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.join_lines = int(os.getenv('SINGLE_FLIGHT_JOIN_LINES', '256'))
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._flights = {}
+
+        self._total = 0
+        self._leaders = 0
+        self._shared = 0
+
+    def do(self, key, fn):
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            self._total += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stream(self, key, open_fn):
+        """Return a reader for the shared stream; ``open_fn`` opens the upstream response."""
+        if not self.enabled:
+            return open_fn()
+
+        with self._lock:
+            self._total += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._shared += 1
+                leader = False
+            else:
+                flight = _StreamFlight()
+                self._flights[key] = flight
+                self._leaders += 1
+                leader = True
+            flight.readers += 1
+            reader = FlightReader(self, key, flight)
+            # Hold the lines this reader has yet to read from the moment it joins
+            with flight.cond:
+                flight.cursors[reader] = 0
+
+        if leader:
+            try:
+                flight.response = open_fn()
+            except Exception as e:
+                flight.error = e
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.opened.set()
+                raise
+            flight.opened.set()
+            threading.Thread(target=self._pump, args=(key, flight), daemon=True).start()
+        else:
+            flight.opened.wait()
+            if flight.response is None:
+                with self._lock:
+                    flight.readers -= 1
+                raise flight.error
+
+        return reader
+
+    def _pump(self, key, flight):
+        try:
+            for line in flight.response.iter_lines():
+                if flight.cancelled:
+                    break
+                if not line:
+                    continue
+                if flight.joinable and len(flight.lines) >= self.join_lines:
+                    self._close_to_joiners(key, flight)
+                with flight.cond:
+                    flight.lines.append(line)
+                    flight.trim()
+                    flight.cond.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.finished = True
+                flight.cond.notify_all()
+            flight.response.close()
+
+    def _close_to_joiners(self, key, flight):
+        """Stop ``flight`` taking new readers so its buffer can be trimmed."""
+        with self._lock:
+            flight.joinable = False
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _release(self, key, flight):
+        with self._lock:
+            flight.readers -= 1
+            abandoned = flight.readers <= 0 and not flight.finished
+            if abandoned:
+                flight.cancelled = True
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        if abandoned and flight.response is not None:
+            flight.response.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "calls": self._total,
+                "upstream_calls": self._leaders,
+                "deduplicated": self._shared,
+                "dedup_ratio": (self._shared / self._total) if self._total else 0.0,
+                "in_flight": len(self._calls) + len(self._flights),
+                "waiters": sum(call.waiters for call in self._calls.values())
+                + sum(max(flight.readers - 1, 0) for flight in self._flights.values()),
+            }
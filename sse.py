@@ -0,0 +1,63 @@
+import json
+from json.encoder import encode_basestring
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+DONE = b"data: [DONE]\n\n"
+
+if orjson is not None:
+    JSON_BACKEND = 'orjson'
+    loads = orjson.loads
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+
+    def dumps_str(text):
+        return orjson.dumps(text)
+else:
+    JSON_BACKEND = 'json'
+    loads = json.loads
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def dumps_str(text):
+        return encode_basestring(text).encode('utf-8')
+
+
+def passthrough(line):
+    """Frame an NDJSON line from Ollama as an SSE event without parsing it."""
+    return b"data: " + line + b"\n\n"
+
+
+class ChunkEncoder:
+    """Encodes ``chat.completion.chunk`` events for one completion.
+
+    Everything except the delta is the same for every chunk of a
+    completion, so the bytes before and after it are built once and each
+    content chunk only escapes its own text.
+    """
+
+    def __init__(self, completion_id, created, model):
+        head = dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model})
+        self._prefix = b"data: " + head[:-1] + b',"choices":[{"index":0,"delta":'
+        self._open = b',"finish_reason":null}]}\n\n'
+
+    def role(self, role='assistant'):
+        return self._prefix + b'{"role":' + dumps_str(role) + b'}' + self._open
+
+    def content(self, text):
+        return self._prefix + b'{"content":' + dumps_str(text) + b'}' + self._open
+
+    def tool_calls(self, tool_calls):
+        return self._prefix + b'{"tool_calls":' + dumps(tool_calls) + b'}' + self._open
+
+    def finish(self, reason):
+        return self._prefix + b'{},"finish_reason":' + dumps_str(reason) + b'}]}\n\n'
+
+    def usage(self, usage):
+        return self._prefix + b'{},"finish_reason":null}],"usage":' + dumps(usage) + b'}\n\n'
@@ -0,0 +1,134 @@
+import builtins
+import os
+import sys
+import threading
+import time
+
+
+class StartupProfile:
+    """Where startup time goes, reported when PROFILE_STARTUP is set.
+
+    Imports are timed by wrapping ``__import__`` until ``finish``: each
+    module's cumulative time includes the modules it imports, its self time
+    does not. ``mark`` records named phases (imports, subsystems, warm-up)
+    as the time since the previous mark.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.imports = {}
+        self.phases = []
+        self._last_mark = self.started
+        self._local = threading.local()
+        self._original_import = None
+
+    @classmethod
+    def from_env(cls):
+        profile = cls(os.getenv('PROFILE_STARTUP', '').strip().lower() in ('1', 'true', 'yes', 'on'))
+        if profile.enabled:
+            profile._original_import = builtins.__import__
+            builtins.__import__ = profile._import
+        return profile
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.imports.setdefault(name, (elapsed, elapsed - children))
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last_mark))
+        self._last_mark = now
+
+    def finish(self):
+        """Stop timing imports and print the report so far."""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+        if self.enabled:
+            self.print_report()
+
+    def report(self, top=20):
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        return {
+            "enabled": self.enabled,
+            "total_seconds": self._last_mark - self.started,
+            "phases": [{"phase": phase, "seconds": seconds} for phase, seconds in self.phases],
+            "imports": [
+                {"module": name, "cumulative_seconds": cumulative, "self_seconds": own}
+                for name, (cumulative, own) in slowest
+            ],
+        }
+
+    def print_report(self, out=None, top=20):
+        out = out or sys.stderr
+        report = self.report(top)
+        print(f"Startup profile: {report['total_seconds'] * 1000:.1f} ms", file=out)
+        for phase in report['phases']:
+            print(f"  {phase['phase']:<24} {phase['seconds'] * 1000:8.1f} ms", file=out)
+        if report['imports']:
+            print(f"  {'slowest imports':<24} {'cumulative':>11} {'self':>9}", file=out)
+            for entry in report['imports']:
+                print(f"  {entry['module']:<24} {entry['cumulative_seconds'] * 1000:8.1f} ms {entry['self_seconds'] * 1000:6.1f} ms", file=out)
+        out.flush()
+
+
+class WarmUp:
+    """Background warm-up steps that gate readiness.
+
+    Each step is retried with backoff (1 s doubling to 10 s) until it
+    succeeds; the process reports ready once every step has succeeded once.
+    """
+
+    def __init__(self, steps, on_ready=None):
+        self.steps = steps
+        self.on_ready = on_ready
+        self.ready = False
+        self._status = {name: {"done": False, "seconds": None, "attempts": 0, "error": None} for name, _ in steps}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        for name, step in self.steps:
+            backoff = 1.0
+            started = time.perf_counter()
+            while True:
+                with self._lock:
+                    self._status[name]["attempts"] += 1
+                try:
+                    step()
+                    break
+                except Exception as e:
+                    with self._lock:
+                        self._status[name]["error"] = str(e)
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 10.0)
+            with self._lock:
+                self._status[name].update(done=True, seconds=time.perf_counter() - started, error=None)
+        self.ready = True
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "steps": {name: dict(status) for name, status in self._status.items()},
+            }
@@ -0,0 +1,91 @@
+import datetime
+
+import pytest
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from backends import BackendPool, is_unhealthy
+
+
+class FakeUpstream:
+    """Answers per backend URL with a status code or raises an exception."""
+
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.calls = []
+
+    def request(self, method, path, json=None, stream=False, timeout=None, base_url=None):
+        self.calls.append(base_url)
+        outcome = self.outcomes[base_url]
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response.elapsed = datetime.timedelta(seconds=0.25)
+        response._content = b'{}'
+        response._content_consumed = True
+        return response
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setenv('BACKEND_MAX_FAILURES', '1')
+    return BackendPool(['http://a', 'http://b'])
+
+
+def test_connection_errors_fail_over_and_eject(pool):
+    upstream = FakeUpstream({'http://a': requests.exceptions.ConnectionError(), 'http://b': 200})
+    response = pool.request(upstream, 'POST', '/api/chat', json={})
+    assert response.backend_url == 'http://b'
+    assert pool.backends[0].ejected()
+
+
+def test_unhealthy_status_fails_over(pool):
+    upstream = FakeUpstream({'http://a': 503, 'http://b': 200})
+    assert pool.request(upstream, 'POST', '/api/chat', json={}).status_code == 200
+    assert upstream.calls == ['http://a', 'http://b']
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ReadTimeout(),
+    requests.exceptions.ConnectionError(ReadTimeoutError(None, '/api/chat', 'read timed out')),
+])
+def test_read_timeouts_are_not_retried_or_held_against_the_host(pool, error):
+    upstream = FakeUpstream({'http://a': error, 'http://b': 200})
+    with pytest.raises(requests.exceptions.RequestException):
+        pool.request(upstream, 'POST', '/api/chat', json={})
+    assert upstream.calls == ['http://a']
+    assert not pool.backends[0].ejected()
+
+
+def test_connect_timeout_is_unhealthy():
+    assert is_unhealthy(requests.exceptions.ConnectTimeout())
+    assert not is_unhealthy(requests.exceptions.ReadTimeout())
+
+
+def test_latency_is_time_to_headers(pool):
+    upstream = FakeUpstream({'http://a': 200, 'http://b': 200})
+    pool.request(upstream, 'POST', '/api/chat', json={})
+    assert pool.backends[0].latency_ewma == 0.25
+
+
+def test_least_busy_backend_is_chosen(pool):
+    pool.start(pool.backends[0])
+    assert pool.choose().url == 'http://b'
+
+
+def test_affinity_prefers_the_backend_with_the_model_loaded(pool):
+    pool.set_loaded(pool.backends[1], ['m'])
+    assert pool.choose('m').url == 'http://b'
+
+
+def test_per_backend_limit_overrides_affinity(monkeypatch):
+    monkeypatch.setenv('MAX_CONCURRENCY_PER_BACKEND', '1')
+    pool = BackendPool(['http://a', 'http://b'])
+    pool.set_loaded(pool.backends[0], ['m'])
+    pool.start(pool.backends[0])
+    assert pool.choose('m').url == 'http://b'
+    # Every host at the limit: fall back to the least busy one
+    pool.start(pool.backends[1])
+    pool.start(pool.backends[1])
+    assert pool.choose('m').url == 'http://a'
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from embeddings import EmbeddingBatcher, EmbeddingCache, VectorStore, content_key
+
+
+@pytest.fixture
+def make_cache(monkeypatch, tmp_path):
+    def make(disk=True, **env):
+        if disk:
+            monkeypatch.setenv('EMBED_CACHE_DIR', str(tmp_path))
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return EmbeddingCache()
+    return make
+
+
+def test_content_key_depends_on_model_text_and_dimensions():
+    key = content_key('m', 'hello')
+    assert key == content_key('m', 'hello')
+    assert key != content_key('other', 'hello')
+    assert key != content_key('m', 'hello', dimensions=8)
+    assert len(key) == 16
+
+
+def test_vector_store_round_trip_and_reopen(tmp_path):
+    store = VectorStore(str(tmp_path), 'm-2', 2, 1 << 20)
+    store.put(b'a' * 16, [1.0, 2.0])
+    store.put(b'b' * 16, [3.0, 4.0])
+    assert store.get(b'a' * 16) == [1.0, 2.0]
+
+    reopened = VectorStore(str(tmp_path), 'm-2', 2, 1 << 20)
+    assert reopened.get(b'b' * 16) == [3.0, 4.0]
+    assert reopened.get(b'c' * 16) is None
+
+
+def test_vector_store_drops_rows_a_crash_left_half_written(tmp_path):
+    store = VectorStore(str(tmp_path), 'm-2', 2, 1 << 20)
+    store.put(b'a' * 16, [1.0, 2.0])
+    with open(store.vector_path, 'ab') as f:
+        f.write(b'\0' * 8)
+    reopened = VectorStore(str(tmp_path), 'm-2', 2, 1 << 20)
+    assert reopened.disk_bytes() == 8 + 16
+    assert reopened.get(b'a' * 16) == [1.0, 2.0]
+
+
+def test_vector_store_starts_over_at_its_size_limit(tmp_path):
+    store = VectorStore(str(tmp_path), 'm-1', 1, 3 * 4)
+    for i in range(4):
+        store.put(bytes([i]) * 16, [float(i)])
+    assert store.resets == 1
+    assert store.get(bytes([0]) * 16) is None
+    assert store.get(bytes([3]) * 16) == [3.0]
+
+
+def test_cache_memory_lru(make_cache):
+    cache = make_cache(disk=False, EMBED_CACHE_SIZE=2)
+    for name in 'abc':
+        cache.put('m', name.encode() * 16, [1.0])
+    assert cache.get('m', b'a' * 16) == (None, None)
+    assert cache.get('m', b'c' * 16) == ([1.0], 'memory')
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_finds_vectors_on_disk_after_a_restart(make_cache):
+    make_cache().put('m', b'k' * 16, [0.5, 0.25])
+    vector, source = make_cache().get('m', b'k' * 16)
+    assert (vector, source) == ([0.5, 0.25], 'disk')
+
+
+def test_batcher_sends_concurrent_inputs_in_one_call():
+    calls = []
+
+    def send(model, texts, dimensions):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts], 10 * len(texts)
+
+    batcher = EmbeddingBatcher(send)
+    batcher.window = 0.2
+    results = {}
+
+    def embed(text):
+        [item] = batcher.embed('m', [content_key('m', text)], [text])
+        results[text] = item.vector
+
+    threads = [threading.Thread(target=embed, args=(text,)) for text in ['a', 'bb', 'ccc', 'bb']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(calls[0]) == ['a', 'bb', 'ccc']
+    assert results == {'a': [1.0], 'bb': [2.0], 'ccc': [3.0]}
+    assert batcher.stats()["deduplicated"] == 1
+
+
+def test_batcher_sends_full_batches_at_once():
+    calls = []
+
+    def send(model, texts, dimensions):
+        calls.append(len(texts))
+        return [[0.0] for _ in texts], 0
+
+    batcher = EmbeddingBatcher(send)
+    batcher.window = 0
+    batcher.max_batch = 2
+    texts = ['a', 'b', 'c', 'd', 'e']
+    items = batcher.embed('m', [content_key('m', text) for text in texts], texts)
+    assert calls == [2, 2, 1]
+    assert all(item.vector == [0.0] for item in items)
+
+
+def test_batcher_fails_every_waiter_of_a_failed_batch():
+    def send(model, texts, dimensions):
+        return [[0.0]], 0
+
+    batcher = EmbeddingBatcher(send)
+    batcher.window = 0
+    with pytest.raises(ValueError):
+        batcher.embed('m', [b'a' * 16, b'b' * 16], ['a', 'b'])
+    assert batcher.stats()["errors"] == 1
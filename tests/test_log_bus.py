@@ -0,0 +1,54 @@
+from log_bus import ChunkBatcher, LogBus
+
+
+def test_subscriber_reads_what_was_published_after_it_joined():
+    bus = LogBus(capacity=8, backlog=0)
+    bus.publish({"message": "before"})
+    subscription = bus.subscribe()
+    bus.publish({"message": "a"})
+    bus.publish({"message": "b"})
+    assert [m["message"] for m in subscription.get(timeout=0)] == ['a', 'b']
+    assert subscription.get(timeout=0) == []
+
+
+def test_backlog_is_replayed_to_new_subscribers():
+    bus = LogBus(capacity=8, backlog=2)
+    for i in range(5):
+        bus.publish({"message": str(i)})
+    assert [m["message"] for m in bus.subscribe().get(timeout=0)] == ['3', '4']
+
+
+def test_slow_subscriber_skips_overwritten_messages():
+    bus = LogBus(capacity=4, backlog=0)
+    subscription = bus.subscribe()
+    for i in range(10):
+        bus.publish({"message": str(i)})
+    assert [m["message"] for m in subscription.get(timeout=0)] == ['6', '7', '8', '9']
+    assert subscription.dropped == 6
+
+
+def test_sequence_numbers_continue_after_resume():
+    bus = LogBus(capacity=4, backlog=0)
+    bus.resume(100)
+    message = {"message": "x"}
+    bus.publish(message)
+    assert message["seq"] == 100
+
+
+def test_long_messages_are_cut():
+    bus = LogBus(capacity=4, max_chars=10)
+    message = {"message": "x" * 25}
+    bus.publish(message)
+    assert message["message"].startswith("x" * 10 + "...")
+    assert "15 more characters" in message["message"]
+    assert message["truncated"] is True
+    assert bus.stats()["truncated"] == 1
+
+
+def test_chunk_batcher_flushes_at_max_chars():
+    frames = []
+    batcher = ChunkBatcher(frames.append, interval=60, max_chars=5)
+    for token in ['ab', 'cd', 'ef', 'g']:
+        batcher.add(token)
+    batcher.flush()
+    assert frames == ['abcdef', 'g']
@@ -0,0 +1,104 @@
+import time
+
+from log_bus import LogBus
+from log_store import LogFilter, LogStore
+
+
+def make(path=None, **kwargs):
+    bus = LogBus(capacity=1024, backlog=0, max_chars=0)
+    store = LogStore(bus, path=str(path) if path else None, **kwargs)
+    return bus, store
+
+
+def publish(bus, store, count, start=0, **fields):
+    stored = store.stats()["stored"]
+    for i in range(start, start + count):
+        entry = {"message": f"message {i}", "type": "request", "timestamp": 1000.0 + i}
+        entry.update(fields)
+        bus.publish(entry)
+    wait_for(lambda: store.stats()["stored"] >= stored + count)
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 10
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def messages(page):
+    return [entry["message"] for entry in page["entries"]]
+
+
+def test_pages_are_newest_first():
+    bus, store = make()
+    publish(bus, store, 5)
+    page = store.query(limit=2)
+    assert messages(page) == ['message 4', 'message 3']
+    page = store.query(before=page["next_before"], limit=2)
+    assert messages(page) == ['message 2', 'message 1']
+    assert messages(store.query(before=page["next_before"], limit=2)) == ['message 0']
+
+
+def test_filters():
+    bus, store = make()
+    publish(bus, store, 3)
+    publish(bus, store, 2, start=3, type="error", request_id="req-1")
+    assert messages(store.query(LogFilter(types=["error"]))) == ['message 4', 'message 3']
+    assert messages(store.query(LogFilter(request_id="req-1"), limit=1)) == ['message 4']
+    assert messages(store.query(LogFilter(text="MESSAGE 1"))) == ['message 1']
+    assert messages(store.query(LogFilter(since=1001.0, until=1002.0))) == ['message 2', 'message 1']
+
+
+def test_memory_is_bounded_by_count_and_size():
+    bus, store = make(capacity=3)
+    publish(bus, store, 10)
+    assert store.stats()["in_memory"] == 3
+
+    bus, store = make(memory_bytes=2000)
+    bus.publish({"message": "x" * 5000, "timestamp": 1.0})
+    publish(bus, store, 2)
+    stats = store.stats()
+    assert stats["in_memory"] == 2
+    assert stats["in_memory_bytes"] <= 2000
+
+
+def test_older_pages_come_from_the_file(tmp_path):
+    path = tmp_path / 'history.jsonl'
+    bus, store = make(path, capacity=10)
+    wait_for(lambda: store.stats()["indexed"])
+    publish(bus, store, 600)
+    publish(bus, store, 1, start=600, request_id="req-old")
+    publish(bus, store, 50, start=601)
+
+    page = store.query(before=100, limit=3)
+    assert messages(page) == ['message 99', 'message 98', 'message 97']
+    assert messages(store.query(LogFilter(request_id="req-old"))) == ['message 600']
+
+
+def test_restart_continues_numbering_and_keeps_history(tmp_path):
+    path = tmp_path / 'history.jsonl'
+    bus, store = make(path)
+    wait_for(lambda: store.stats()["indexed"])
+    publish(bus, store, 5)
+    # A crash can leave a torn last line
+    with open(path, 'ab') as f:
+        f.write(b'{"message": "torn')
+
+    bus, store = make(path)
+    wait_for(lambda: store.stats()["indexed"])
+    entry = {"message": "after restart", "timestamp": 2000.0}
+    bus.publish(entry)
+    assert entry["seq"] == 5
+    wait_for(lambda: store.stats()["stored"] >= 1)
+    assert messages(store.query(limit=3)) == ['after restart', 'message 4', 'message 3']
+
+
+def test_file_is_rotated_at_max_bytes(tmp_path):
+    path = tmp_path / 'history.jsonl'
+    bus, store = make(path, max_bytes=2000)
+    wait_for(lambda: store.stats()["indexed"])
+    publish(bus, store, 50)
+    assert store.stats()["rotations"] >= 1
+    assert (tmp_path / 'history.jsonl.1').exists()
+    assert store.stats()["file_bytes"] < 2000
@@ -0,0 +1,112 @@
+import io
+import json
+import os
+import time
+
+import pytest
+
+import recorder
+from recorder import Capture, Recorder, export, find, read_record, read_records, segments
+
+
+@pytest.fixture
+def make(monkeypatch, tmp_path):
+    def make(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return Recorder(str(tmp_path))
+    return make
+
+
+def record(rec, request_id, text="answer", body=None):
+    capture = rec.begin(request_id, 'POST', '/v1/chat/completions', body or {"model": "m", "messages": []})
+    capture.add(text)
+    rec.finish(capture, status=200, duration=0.1)
+
+
+def drain(rec, count):
+    deadline = time.monotonic() + 5
+    while rec.stats()["recorded"] + rec.stats()["errors"] < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert rec.stats()["recorded"] == count
+
+
+def test_capture_stops_at_max_chars():
+    capture = Capture('r', 'POST', '/', {}, max_chars=5)
+    capture.add('abc')
+    capture.add('defgh')
+    capture.add('ij')
+    assert capture.text() == 'abcde'
+    assert capture.truncated
+
+
+def test_sampled_out_requests_are_not_recorded(make):
+    rec = make(RECORD_SAMPLE_RATE=0)
+    assert rec.begin('r', 'POST', '/', {}) is None
+    assert rec.stats()["sampled_out"] == 1
+
+
+def test_records_round_trip(make, tmp_path):
+    rec = make()
+    record(rec, 'req-1', 'hello')
+    record(rec, 'req-2', 'world')
+    drain(rec, 2)
+
+    assert rec.lookup('req-2')["response"] == 'world'
+    assert find(str(tmp_path), 'req-1')["response"] == 'hello'
+    [path] = segments(str(tmp_path))
+    assert [entry["request_id"] for _, entry in read_records(path)] == ['req-1', 'req-2']
+
+
+def test_long_strings_in_bodies_are_truncated(make):
+    rec = make(RECORD_MAX_CHARS=10)
+    record(rec, 'req-1', body={"messages": [{"content": "x" * 100}]})
+    drain(rec, 1)
+    assert rec.lookup('req-1')["body"]["messages"][0]["content"] == 'x' * 10
+
+
+def test_a_torn_record_ends_the_segment(make, tmp_path):
+    rec = make()
+    record(rec, 'req-1')
+    drain(rec, 1)
+    [path] = segments(str(tmp_path))
+    with open(path, 'ab') as f:
+        f.write(recorder._HEADER.pack(1000, 0) + b'partial')
+    assert [entry["request_id"] for _, entry in read_records(path)] == ['req-1']
+
+
+def test_a_corrupt_record_fails_its_crc(make, tmp_path):
+    rec = make()
+    record(rec, 'req-1')
+    drain(rec, 1)
+    [path] = segments(str(tmp_path))
+    offset = rec._offsets['req-1']
+    with open(path, 'r+b') as f:
+        f.seek(offset + recorder._HEADER.size + 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    with pytest.raises(ValueError):
+        read_record(path, offset)
+    assert list(read_records(path)) == []
+
+
+def test_segments_rotate_and_old_ones_are_deleted(make, tmp_path):
+    rec = make(RECORD_SEGMENT_MB=200 / (1024 * 1024), RECORD_MAX_SEGMENTS=2)
+    for i in range(10):
+        record(rec, f'req-{i}', 'text ' * 50)
+    drain(rec, 10)
+    files = segments(str(tmp_path))
+    assert len(files) == 2
+    assert all(os.path.exists(path[:-4] + '.idx') for path in files)
+    assert rec.lookup('req-9') is not None
+
+
+def test_export_writes_one_json_line_per_record(make, tmp_path):
+    rec = make()
+    for i in range(3):
+        record(rec, f'req-{i}')
+    drain(rec, 3)
+    out = io.StringIO()
+    assert export(str(tmp_path), out) == 3
+    assert [json.loads(line)["request_id"] for line in out.getvalue().splitlines()] == ['req-0', 'req-1', 'req-2']
@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+
+from response_cache import ResponseCache, entry_from_chunks, is_deterministic, replay_chunks
+
+
+@pytest.fixture
+def make(monkeypatch, tmp_path):
+    def make(disk=False, **env):
+        monkeypatch.setenv('RESPONSE_CACHE', 'true')
+        if disk:
+            monkeypatch.setenv('RESPONSE_CACHE_DIR', str(tmp_path))
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return ResponseCache()
+    return make
+
+
+def entry(text):
+    return entry_from_chunks(text, [], {"model": "m", "eval_count": 3, "done": True})
+
+
+def test_only_temperature_zero_or_seeded_requests_are_deterministic():
+    assert is_deterministic({"temperature": 0})
+    assert is_deterministic({"seed": 1})
+    assert not is_deterministic({"temperature": 0.7})
+    assert not is_deterministic({})
+
+
+def test_key_ignores_fields_outside_the_prompt(make):
+    cache = make()
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "options": {"temperature": 0}}
+    assert cache.key(request) == cache.key(dict(request, stream=True))
+    assert cache.key(request) != cache.key(dict(request, model="other"))
+
+
+def test_replay_matches_the_stored_entry():
+    chunks = list(replay_chunks(entry("hello")))
+    assert chunks[0]["message"]["content"] == "hello"
+    assert chunks[-1]["done"] is True
+    assert chunks[-1]["eval_count"] == 3
+
+
+def test_memory_lru_evicts_the_least_recently_used(make):
+    cache = make(RESPONSE_CACHE_SIZE=2)
+    cache.put('a', entry('a'))
+    cache.put('b', entry('b'))
+    cache.get('a')
+    cache.put('c', entry('c'))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_misses(make):
+    cache = make(RESPONSE_CACHE_TTL=0.01)
+    cache.put('a', entry('a'))
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def test_disk_tier_serves_entries_evicted_from_memory(make):
+    cache = make(disk=True, RESPONSE_CACHE_SIZE=1)
+    cache.put('a', entry('a'))
+    cache.put('b', entry('b'))
+    assert cache.get('a')["message"]["content"] == 'a'
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_overwriting_an_entry_counts_its_bytes_once(make, tmp_path):
+    cache = make(disk=True)
+    for _ in range(5):
+        cache.put('a', entry('a' * 100))
+    assert cache.stats()["disk_bytes"] == os.path.getsize(tmp_path / 'a.json')
+
+
+def test_disk_bytes_survive_a_restart(make, tmp_path):
+    make(disk=True).put('a', entry('a'))
+    assert make(disk=True).stats()["disk_bytes"] == os.path.getsize(tmp_path / 'a.json')
+
+
+def test_disk_tier_stays_under_its_size_limit(make, tmp_path):
+    cache = make(disk=True, RESPONSE_CACHE_DISK_MAX_MB=2000 / (1024 * 1024))
+    for i in range(20):
+        cache.put(f'k{i}', entry('x' * 200))
+        # Give every file its own mtime so the oldest is evicted first
+        os.utime(tmp_path / f'k{i}.json', (i, time.time() - 100 + i))
+    total = sum(os.path.getsize(path) for path in tmp_path.iterdir())
+    assert total <= 2000
+    assert cache.stats()["disk_bytes"] == total
+    assert (tmp_path / 'k19.json').exists()
@@ -0,0 +1,155 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import Scheduler, QueueFull, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+
+
+def make(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, str(value))
+    return Scheduler()
+
+
+class Waiter:
+    """Calls ``acquire`` on a thread, since a queued acquire blocks."""
+
+    def __init__(self, scheduler, model, priority=PRIORITY_INTERACTIVE, client='', weight=1.0):
+        self.ticket = None
+        self.error = None
+        depth = scheduler.stats()["queue_depth"]
+        self.thread = threading.Thread(target=self._run, args=(scheduler, model, priority, client, weight), daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 2
+        while scheduler.stats()["queue_depth"] == depth and not self.done and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    @property
+    def done(self):
+        return self.ticket is not None or self.error is not None
+
+    def _run(self, scheduler, model, priority, client, weight):
+        try:
+            self.ticket = scheduler.acquire(model, priority, client, weight)
+        except QueueFull as e:
+            self.error = e
+
+    def wait(self):
+        self.thread.join(2)
+        return self.ticket
+
+
+def test_disabled_grants_everything(monkeypatch):
+    scheduler = make(monkeypatch)
+    tickets = [scheduler.acquire('m') for _ in range(10)]
+    assert scheduler.stats()["active_total"] == 10
+    for ticket in tickets:
+        ticket.release()
+    assert scheduler.stats()["active_total"] == 0
+
+
+def test_per_model_limit_queues_until_release(monkeypatch):
+    scheduler = make(monkeypatch, MAX_CONCURRENCY_PER_MODEL=1)
+    first = scheduler.acquire('m')
+    waiter = Waiter(scheduler, 'm')
+    assert not waiter.done
+    assert scheduler.stats()["queue_depth"] == 1
+
+    first.release()
+    assert waiter.wait() is not None
+    assert scheduler.stats()["active"] == {'m': 1}
+
+
+def test_free_model_is_not_held_back_by_queued_waiters(monkeypatch):
+    scheduler = make(monkeypatch, MAX_CONCURRENCY_PER_MODEL=1)
+    scheduler.acquire('a')
+    waiter = Waiter(scheduler, 'a')
+    assert not waiter.done
+
+    started = time.monotonic()
+    ticket = scheduler.acquire('b')
+    assert time.monotonic() - started < 0.5
+    assert ticket.admitted_at is not None
+    assert scheduler.stats()["queue_depth"] == 1
+
+
+def test_full_queue_rejects_with_retry_after(monkeypatch):
+    scheduler = make(monkeypatch, MAX_CONCURRENCY_PER_MODEL=1, MAX_QUEUE=1)
+    scheduler.acquire('m')
+    Waiter(scheduler, 'm')
+    with pytest.raises(QueueFull) as raised:
+        scheduler.acquire('m')
+    assert raised.value.retry_after >= 1
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_queue_timeout_removes_the_waiter(monkeypatch):
+    scheduler = make(monkeypatch, MAX_CONCURRENCY_PER_MODEL=1, QUEUE_TIMEOUT=0.05)
+    scheduler.acquire('m')
+    with pytest.raises(QueueFull):
+        scheduler.acquire('m', client='late')
+    stats = scheduler.stats()
+    assert stats["timeouts"] == 1
+    assert stats["queue_depth"] == 0
+    assert 'late' not in stats["clients"]
+
+
+def test_per_backend_limit_scales_with_backends(monkeypatch):
+    monkeypatch.setenv('MAX_CONCURRENCY_PER_BACKEND', '2')
+    scheduler = Scheduler(backend_count=2)
+    tickets = [scheduler.acquire(f'm{i}') for i in range(4)]
+    waiter = Waiter(scheduler, 'other')
+    assert not waiter.done
+    tickets[0].release()
+    assert waiter.wait() is not None
+
+
+def test_interactive_requests_go_before_batch(monkeypatch):
+    scheduler = make(monkeypatch, MAX_CONCURRENCY_PER_MODEL=1)
+    running = scheduler.acquire('m')
+    batch = Waiter(scheduler, 'm', PRIORITY_BATCH)
+    interactive = Waiter(scheduler, 'm', PRIORITY_INTERACTIVE)
+
+    running.release()
+    assert interactive.wait() is not None
+    assert not batch.done
+    interactive.ticket.release()
+    assert batch.wait() is not None
+
+
+def test_fair_queuing_interleaves_clients(monkeypatch):
+    scheduler = make(monkeypatch, MAX_CONCURRENCY_PER_MODEL=1)
+    running = scheduler.acquire('m', client='busy')
+    busy = [Waiter(scheduler, 'm', client='busy') for _ in range(3)]
+    quiet = Waiter(scheduler, 'm', client='quiet')
+
+    running.release()
+    # The quiet client starts at the current virtual time, ahead of the busy client's backlog
+    admitted = quiet.wait()
+    assert admitted is not None
+    assert not any(waiter.done for waiter in busy)
+    admitted.release()
+    assert busy[0].wait() is not None
+
+
+def test_weight_scales_virtual_finish(monkeypatch):
+    scheduler = make(monkeypatch, MAX_CONCURRENCY_PER_MODEL=1)
+    scheduler.acquire('m')
+    Waiter(scheduler, 'm', client='light', weight=1.0)
+    Waiter(scheduler, 'm', client='heavy', weight=4.0)
+    waiting = {ticket.client: ticket for ticket in scheduler._waiting}
+    assert waiting['heavy'].finish - waiting['heavy'].start == pytest.approx(
+        (waiting['light'].finish - waiting['light'].start) / 4)
+    assert scheduler._waiting[0].client == 'heavy'
+
+
+def test_idle_clients_are_forgotten_beyond_the_limit(monkeypatch):
+    scheduler = make(monkeypatch, MAX_TRACKED_CLIENTS=3)
+    running = scheduler.acquire('m', client='running')
+    for i in range(20):
+        scheduler.acquire('m', client=f'client-{i}').release()
+    clients = scheduler.stats()["clients"]
+    assert len(clients) <= 3
+    assert 'running' in clients
+    running.release()
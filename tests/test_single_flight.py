@@ -0,0 +1,95 @@
+import threading
+import time
+
+from single_flight import SingleFlight, request_key
+
+
+class FakeStream:
+    def __init__(self, lines, gate=None):
+        self.lines = lines
+        self.gate = gate
+        self.closed = False
+
+    def iter_lines(self):
+        for line in self.lines:
+            if self.gate is not None:
+                self.gate.wait()
+            if self.closed:
+                return
+            yield line
+
+    def close(self):
+        self.closed = True
+
+
+def test_request_key_is_canonical():
+    assert request_key('POST', '/api/chat', {"a": 1, "b": 2}) == request_key('POST', '/api/chat', {"b": 2, "a": 1})
+    assert request_key('POST', '/api/chat', {"a": 1}) != request_key('POST', '/api/generate', {"a": 1})
+
+
+def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('k', fn))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [1]
+    assert results == ['result'] * 3
+    assert flights.stats()["deduplicated"] == 2
+
+
+def test_followers_replay_a_stream_from_the_start():
+    flights = SingleFlight()
+    gate = threading.Event()
+    opened = []
+
+    def open_stream():
+        stream = FakeStream([b'1', b'2', b'3'], gate)
+        opened.append(stream)
+        return stream
+
+    leader = flights.stream('k', open_stream)
+    follower = flights.stream('k', open_stream)
+    gate.set()
+    assert list(leader.iter_lines()) == [b'1', b'2', b'3']
+    assert list(follower.iter_lines()) == [b'1', b'2', b'3']
+    assert len(opened) == 1
+
+
+def test_upstream_is_closed_when_every_reader_leaves():
+    flights = SingleFlight()
+    gate = threading.Event()
+    stream = FakeStream([b'1', b'2'], gate)
+    readers = [flights.stream('k', lambda: stream) for _ in range(2)]
+    readers[0].close()
+    assert not stream.closed
+    readers[1].close()
+    assert stream.closed
+    gate.set()
+
+
+def test_lines_are_freed_once_the_stream_stops_taking_readers(monkeypatch):
+    monkeypatch.setenv('SINGLE_FLIGHT_JOIN_LINES', '4')
+    flights = SingleFlight()
+    lines = [str(i).encode() for i in range(1000)]
+    reader = flights.stream('k', lambda: FakeStream(lines))
+    flight = reader._flight
+    assert list(reader.iter_lines()) == lines
+    assert flight.lines == []
+    assert flight.start == len(lines)
+
+    # After the join window an identical request gets a stream of its own
+    late = flights.stream('k', lambda: FakeStream([b'x']))
+    assert late._flight is not flight
@@ -0,0 +1,149 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import env_bool, env_float
+
+
+class UpstreamClient:
+    """Shared, pooled HTTP client for all calls to Ollama.
+
+    Configured through environment variables:
+
+    - OLLAMA_POOL_SIZE: connections kept per upstream host (default 32)
+    - OLLAMA_POOL_BLOCK: wait for a free connection instead of opening extra ones (default false)
+    - OLLAMA_KEEPALIVE: reuse connections between requests (default true)
+    - OLLAMA_CONNECT_TIMEOUT: seconds to establish a connection (default 5)
+    - OLLAMA_READ_TIMEOUT: seconds between bytes from Ollama, "none" to disable (default 300)
+    - OLLAMA_RETRIES: retries on connect errors and 502/503/504 (default 2)
+    - OLLAMA_RETRY_BACKOFF: backoff factor between retries (default 0.2)
+    - OLLAMA_RETRY_METHODS: comma separated methods that may be retried (default GET,HEAD)
+    """
+
+    def __init__(self, base_url, hosts=1):
+        self.base_url = base_url.rstrip('/')
+        self.hosts = hosts
+        self.pool_size = int(os.getenv('OLLAMA_POOL_SIZE', '32'))
+        self.pool_block = env_bool('OLLAMA_POOL_BLOCK', False)
+        self.keepalive = env_bool('OLLAMA_KEEPALIVE', True)
+        self.connect_timeout = env_float('OLLAMA_CONNECT_TIMEOUT', 5.0)
+        self.read_timeout = env_float('OLLAMA_READ_TIMEOUT', 300.0)
+        self.retries = int(os.getenv('OLLAMA_RETRIES', '2'))
+        self.retry_backoff = env_float('OLLAMA_RETRY_BACKOFF', 0.2)
+        self.retry_methods = frozenset(
+            m.strip().upper()
+            for m in os.getenv('OLLAMA_RETRY_METHODS', 'GET,HEAD').split(',')
+            if m.strip()
+        )
+
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=0,
+            status=self.retries,
+            backoff_factor=self.retry_backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=self.retry_methods,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(
+            # One pool per Ollama host; fewer would evict pools and their idle connections
+            pool_connections=max(4, hosts),
+            pool_maxsize=self.pool_size,
+            pool_block=self.pool_block,
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        if not self.keepalive:
+            self.session.headers['Connection'] = 'close'
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def request(self, method, path, json=None, stream=False, timeout=None, base_url=None):
+        """Send a request to Ollama through the shared pool.
+
+        ``timeout`` overrides the read timeout; the connect timeout always applies.
+        """
+        url = f"{(base_url or self.base_url).rstrip('/')}{path}"
+        read_timeout = self.read_timeout if timeout is None else timeout
+        with self._lock:
+            self._requests += 1
+        try:
+            return self.session.request(
+                method,
+                url,
+                json=json,
+                stream=stream,
+                timeout=(self.connect_timeout, read_timeout),
+            )
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, json=None, **kwargs):
+        return self.request('POST', path, json=json, **kwargs)
+
+    def stats(self):
+        """Pool usage: a hit is a request served on an already open connection."""
+        pools = []
+        total_requests = 0
+        total_connections = 0
+        manager = self._adapter.poolmanager
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            num_requests = getattr(pool, 'num_requests', 0)
+            num_connections = getattr(pool, 'num_connections', 0)
+            total_requests += num_requests
+            total_connections += num_connections
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "requests": num_requests,
+                "connections_opened": num_connections,
+                "hits": max(num_requests - num_connections, 0),
+                "misses": num_connections,
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+            })
+
+        with self._lock:
+            sent = self._requests
+            errors = self._errors
+
+        hits = max(total_requests - total_connections, 0)
+        return {
+            "config": {
+                "base_url": self.base_url,
+                "pool_size": self.pool_size,
+                "pool_block": self.pool_block,
+                "keepalive": self.keepalive,
+                "connect_timeout": self.connect_timeout,
+                "read_timeout": self.read_timeout,
+                "retries": self.retries,
+                "retry_backoff": self.retry_backoff,
+                "retry_methods": sorted(self.retry_methods),
+            },
+            "requests": sent,
+            "errors": errors,
+            "pool_hits": hits,
+            "pool_misses": total_connections,
+            "pool_hit_rate": (hits / total_requests) if total_requests else 0.0,
+            "pools": pools,
+        }
@@ -0,0 +1,105 @@
+import threading
+
+
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+
+class CompletionCount:
+    """Running size of a completion, kept as counters instead of the text."""
+
+    def __init__(self):
+        self.chars = 0
+        self.chunks = 0
+
+    def add(self, text):
+        self.chars += len(text)
+        self.chunks += 1
+
+
+class TokenCounter:
+    """Token counts for the OpenAI ``usage`` block.
+
+    Ollama's ``prompt_eval_count``/``eval_count`` are used whenever the final
+    chunk carries them, and each such response teaches the counter the
+    characters-per-token ratio of that model. When the counts are missing,
+    tokens are estimated with the learned ratio, else with tiktoken if it is
+    installed, else at four characters per token. A streamed completion
+    without counts is measured in Ollama chunks, which are one token each.
+
+    Ollama does not say how much of a prompt came from its KV cache, so
+    ``cached_tokens`` is always 0.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ratios = {}
+        self._encoding = None
+
+    def _encoder(self):
+        # tiktoken is slow to import and only needed for models without a learned ratio
+        if self._encoding is None:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding('cl100k_base')
+            except Exception:
+                self._encoding = False
+        return self._encoding
+
+    def learn(self, model, chars, tokens):
+        if not chars or not tokens:
+            return
+        ratio = chars / tokens
+        with self._lock:
+            previous = self._ratios.get(model)
+            self._ratios[model] = ratio if previous is None else 0.8 * previous + 0.2 * ratio
+
+    def estimate(self, model, text):
+        if not text:
+            return 0
+        with self._lock:
+            ratio = self._ratios.get(model)
+        if ratio is None:
+            encoding = self._encoder()
+            if encoding:
+                return len(encoding.encode(text, disallowed_special=()))
+            ratio = DEFAULT_CHARS_PER_TOKEN
+        return max(1, round(len(text) / ratio))
+
+    def usage(self, model, prompt, completion, final_chunk, streamed=False):
+        """Usage block for a completion; ``prompt`` is the prompt text."""
+        eval_count = final_chunk.get('eval_count')
+        if eval_count:
+            self.learn(model, completion.chars, eval_count)
+            completion_tokens = eval_count
+        elif streamed:
+            completion_tokens = completion.chunks
+        else:
+            completion_tokens = round(completion.chars / self._ratio(model))
+
+        prompt_tokens = final_chunk.get('prompt_eval_count')
+        if prompt_tokens is None:
+            prompt_tokens = self.estimate(model, prompt)
+
+        return usage_block(prompt_tokens, completion_tokens)
+
+    def _ratio(self, model):
+        with self._lock:
+            return self._ratios.get(model, DEFAULT_CHARS_PER_TOKEN)
+
+
+def usage_block(prompt_tokens, completion_tokens, cached_tokens=0):
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {
+            "cached_tokens": cached_tokens,
+            "audio_tokens": 0
+        },
+        "completion_tokens_details": {
+            "reasoning_tokens": 0,
+            "audio_tokens": 0,
+            "accepted_prediction_tokens": 0,
+            "rejected_prediction_tokens": 0
+        }
+    }